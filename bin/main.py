@@ -1,6 +1,10 @@
-from palantir.manager import Manager
+"""Run the forecast in configuration.yaml and print its field production
 
-m = Manager()
-m.load_configuration('configuration.yaml')
+Equivalent to: palantir run configuration.yaml
+"""
+import sys
 
-print(m)
+from palantir.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main(['run', 'configuration.yaml'] + sys.argv[1:]))
@@ -14,9 +14,7 @@ from setuptools import setup
 # Add here console scripts and other entry points in ini-style format
 entry_points = """
 [console_scripts]
-# script_name = palantir.module:function
-# For example:
-# fibonacci = palantir.skeleton:run
+palantir = palantir.cli:main
 """
 
 
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 from tempfile import NamedTemporaryFile
 
-from pkg_resources import DistributionNotFound, get_distribution
 
-try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    __version__ = 'unknown'
+def __getattr__(name):
+    # the version is looked up on first use, keeping package metadata out of the import path
+    if name == '__version__':
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            return version(__name__)
+        except PackageNotFoundError:
+            return 'unknown'
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def make_temp_file(content):
@@ -0,0 +1,150 @@
+"""Command line interface: palantir <command> ...
+
+Modules that need numpy, pandas or scipy are imported by the commands that use them, so quick
+commands such as validate and summarise start without loading them.
+"""
+
+import argparse
+import sys
+
+LEVELS = ('field', 'pex', 'whp', 'well')
+TIME_STEPS = ('daily', 'monthly', 'quarterly', 'annual')
+
+
+def _load_config(filepath):
+    from palantir.configuration_manager import ConfigurationManager
+    try:
+        return ConfigurationManager(filepath).config
+    except KeyError as error:
+        raise ValueError("{} has no {} section".format(filepath, error)) from None
+
+
+def run(args):
+    """Run a forecast and write its production"""
+    from palantir.manager import Manager
+
+    manager = Manager(args.config, time_step=args.time_step, inventory=args.inventory, history=args.history)
+    production = getattr(manager.profiles, '{}_production'.format(args.level))
+    production.to_csv(sys.stdout if args.out == '-' else args.out)
+    if args.profiles:
+        from palantir.export import write_parquet
+        write_parquet(manager.profiles, args.profiles)
+
+
+def validate(args):
+    """Check a configuration file, printing any problems"""
+    from palantir.configuration_manager import validate_config
+
+    try:
+        problems = validate_config(_load_config(args.config))
+    except ValueError as error:
+        problems = [str(error)]
+    for problem in problems:
+        print(problem)
+    if problems:
+        return 1
+    print('{} is valid'.format(args.config))
+    return 0
+
+
+def summarise(args):
+    """Print a summary of a configuration file"""
+    config = _load_config(args.config)
+    wells = [details for whps in config['pexes'].values() for whp_wells in (whps or {}).values()
+             for details in (whp_wells or {}).values()]
+    platforms = sum(len(whps or {}) for whps in config['pexes'].values())
+
+    print('Asset: {}'.format(config['asset']))
+    print('Start date: {:%d/%m/%Y}'.format(config['start date']))
+    print('Pexes: {}, wellhead platforms: {}'.format(len(config['pexes']), platforms))
+    print('Existing wells: {} oil, {} gas'.format(sum(well.get('type') == 'oil' for well in wells),
+                                                  sum(well.get('type') == 'gas' for well in wells)))
+    for rig_name, program_details in config.get('programs', {}).items():
+        steps = program_details['program']
+        drills = days = 0
+        for step in steps:
+            (action, parameters), = step.items()
+            if action == 'drill wells':
+                drills += parameters[0]
+                days += parameters[0] * parameters[3]
+            elif action != 'start':
+                drills += action == 'drill'
+                days += parameters[-1]
+        print('{}: {} steps, {} wells drilled over {} days'.format(rig_name, len(steps), drills, days))
+
+
+def production(args):
+    """Summarise a production history CSV into the facilities section of a configuration"""
+    from palantir.production_history import summarise_production, write_facilities
+
+    summary = summarise_production(args.csv, chunksize=args.chunksize, gas_scale=args.gas_scale)
+    if args.output == '-':
+        write_facilities(summary, sys.stdout, args.asset, args.pex, args.whp)
+    else:
+        write_facilities(summary, args.output, args.asset, args.pex, args.whp)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='palantir', description='Production forecasting for oil and gas assets')
+    parser.add_argument('--version', action=VersionAction, help="show the program's version and exit")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    parser_run = commands.add_parser('run', help='run a forecast', description=run.__doc__)
+    parser_run.add_argument('config', help='configuration file')
+    parser_run.add_argument('-o', '--out', default='-', help='output CSV file, default stdout')
+    parser_run.add_argument('--level', choices=LEVELS, default='field', help='production to write, default field')
+    parser_run.add_argument('--time-step', choices=TIME_STEPS, default='daily', help='forecast time step')
+    parser_run.add_argument('--inventory', help='CSV or Parquet inventory of existing wells')
+    parser_run.add_argument('--history', help='production history CSV to fit existing wells to')
+    parser_run.add_argument('--profiles', help='also write every well profile as a Parquet dataset here')
+    parser_run.set_defaults(handler=run)
+
+    parser_validate = commands.add_parser('validate', help='check a configuration file', description=validate.__doc__)
+    parser_validate.add_argument('config', help='configuration file')
+    parser_validate.set_defaults(handler=validate)
+
+    parser_summarise = commands.add_parser('summarise', help='summarise a configuration file',
+                                           description=summarise.__doc__)
+    parser_summarise.add_argument('config', help='configuration file')
+    parser_summarise.set_defaults(handler=summarise)
+
+    parser_production = commands.add_parser('production', help='summarise a production history CSV',
+                                            description=production.__doc__)
+    parser_production.add_argument('csv', help="production history with a Date column and '<well> <Phase>' columns")
+    parser_production.add_argument('-o', '--output', default='-', help='output YAML file, default stdout')
+    parser_production.add_argument('--asset', default='Asset', help='asset name')
+    parser_production.add_argument('--pex', default='Pex', help='pex of the wells')
+    parser_production.add_argument('--whp', default='WHP', help='wellhead platform of the wells')
+    # defaults as in palantir.production_history, which isn't imported until the command runs
+    parser_production.add_argument('--chunksize', type=int, default=100000, help='CSV rows read at a time')
+    parser_production.add_argument('--gas-scale', type=float, default=1000000,
+                                   help='multiplier on gas values, default converts MMscf to scf')
+    parser_production.set_defaults(handler=production)
+
+    return parser
+
+
+class VersionAction(argparse.Action):
+    """Prints the version, reading the package metadata only when asked"""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, **kwargs):
+        super().__init__(option_strings, dest=dest, nargs=0, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        import palantir
+        print('palantir {}'.format(palantir.__version__))
+        parser.exit()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args) or 0
+    except (OSError, ValueError) as error:
+        print('palantir: {}'.format(error), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
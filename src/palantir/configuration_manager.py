@@ -1,45 +1,167 @@
 """A Class for manages a Palantir configuration file"""
 
+import hashlib
+import os
+import pickle
+import tempfile
 from datetime import datetime
 
 import yaml
 
+from palantir.program import compile_step, expand_step
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+# Bump when the layout of a compiled config changes, so older cache entries are ignored
+CACHE_VERSION = 2
+
+# Well slots of a wellhead platform when the config gives none
+DEFAULT_SLOTS = 6
+
 
 def format_time_string(time_string):
     return datetime.strptime(time_string, '%d/%m/%Y')
 
 
+def well_slots(config, whp_name):
+    """The number of well slots of a wellhead platform: its own entry under facilities: well slots, otherwise
+    defaults: wellhead platform: well slots"""
+    return config.get('platform well slots', {}).get(whp_name, config.get('well slots', DEFAULT_SLOTS))
+
+
+def default_cache_dir():
+    """The compiled config cache directory: $PALANTIR_CACHE_DIR, or ~/.cache/palantir"""
+    return os.environ.get('PALANTIR_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'palantir')
+
+
 class ConfigurationManager:
-    """Represents a configuration file"""
+    """Represents a configuration file
+
+    The parsed and validated config, with dates and program steps already parsed, is cached in a
+    pickle keyed by a hash of the file's contents, so an unchanged file is not parsed again.
+        - configuration_filepath: path of the YAML configuration file
+        - cache_dir: where compiled configs are kept, default_cache_dir() if None
+        - use_cache: False always parses the file and writes no cache entry
+    """
+
+    def __init__(self, configuration_filepath, cache_dir=None, use_cache=True):
+        with open(configuration_filepath, 'rb') as yaml_file:
+            content = yaml_file.read()
 
-    def __init__(self, configuration_filepath):
-        self.config = {}
+        cache_path = None
+        if use_cache:
+            digest = hashlib.sha256(content).hexdigest()
+            cache_path = os.path.join(cache_dir or default_cache_dir(), '{}-{}.pickle'.format(digest, CACHE_VERSION))
 
-        with open(configuration_filepath) as yaml_file:
-            cfg = yaml.load(yaml_file)
+        self.config = self._read_cache(cache_path) if cache_path else None
+        if self.config is None:
+            self.config = self.compile(yaml.load(content, Loader=Loader))
+            if cache_path:
+                self._write_cache(cache_path, self.config)
+
+    @staticmethod
+    def compile(cfg):
+        """Return the validated config of a parsed configuration file"""
+        config = {}
 
         # description
         description = cfg['description']
-        self.config['start date'] = format_time_string(description['start date'])
+        config['start date'] = format_time_string(description['start date'])
 
         # defaults
         well_defaults = cfg['defaults']['well']
-        self.config['choke'] = well_defaults['choke']
-        self.config['active period'] = well_defaults['active period']
-        self.config['ultimate oil recovery'] = well_defaults['oil well']['ultimate oil recovery']
-        self.config['initial oil rate'] = well_defaults['oil well']['initial oil rate']
-        self.config['gas oil ratio'] = well_defaults['oil well']['gas oil ratio']
-        self.config['b oil'] = well_defaults['oil well']['b oil']
-        self.config['ultimate gas recovery'] = well_defaults['gas well']['ultimate gas recovery']
-        self.config['initial gas rate'] = well_defaults['gas well']['initial gas rate']
-        self.config['gas condensate ratio'] = well_defaults['gas well']['gas condensate ratio']
-        self.config['b gas'] = well_defaults['gas well']['b gas']
+        config['choke'] = well_defaults['choke']
+        config['active period'] = well_defaults['active period']
+        config['ultimate oil recovery'] = well_defaults['oil well']['ultimate oil recovery']
+        config['initial oil rate'] = well_defaults['oil well']['initial oil rate']
+        config['gas oil ratio'] = well_defaults['oil well']['gas oil ratio']
+        config['b oil'] = well_defaults['oil well']['b oil']
+        config['ultimate gas recovery'] = well_defaults['gas well']['ultimate gas recovery']
+        config['initial gas rate'] = well_defaults['gas well']['initial gas rate']
+        config['gas condensate ratio'] = well_defaults['gas well']['gas condensate ratio']
+        config['b gas'] = well_defaults['gas well']['b gas']
+        config['well slots'] = (cfg['defaults'].get('wellhead platform') or {}).get('well slots', DEFAULT_SLOTS)
 
         # facilities
         facilities = cfg['facilities']
-        self.config['asset'] = facilities['asset']
-        self.config['pexes'] = facilities['pexes']
+        config['asset'] = facilities['asset']
+        config['pexes'] = facilities.get('pexes') or {}
+        config['platform well slots'] = facilities.get('well slots') or {}
 
         # programs
         if 'programs' in cfg:
-            self.config['programs'] = cfg['programs']
+            config['programs'] = {rig_name: dict(program_details,
+                                                 program=[compile_step(step) for step in program_details['program']])
+                                  for rig_name, program_details in cfg['programs'].items()}
+
+        return config
+
+    @staticmethod
+    def _read_cache(cache_path):
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                return pickle.load(cache_file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    @staticmethod
+    def _write_cache(cache_path, config):
+        """Write a cache entry atomically. A cache that can't be written is skipped."""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(cache_path), delete=False) as cache_file:
+                pickle.dump(config, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_file.name, cache_path)
+        except OSError:
+            pass
+
+
+def validate_config(config):
+    """Return a list of the problems in a compiled config that would stop a forecast, empty if none"""
+    problems = []
+    wells = {}
+    platforms = {}
+
+    for pex_name, whps in config['pexes'].items():
+        for whp_name, whp_wells in (whps or {}).items():
+            platforms[whp_name] = set()
+            for well_name, well_details in (whp_wells or {}).items():
+                wells[well_name] = wells.get(well_name, 0) + 1
+                platforms[whp_name].add(well_name)
+                well_type = well_details.get('type')
+                if well_type not in ('oil', 'gas'):
+                    problems.append("Well {} has unknown type {}".format(well_name, well_type))
+                elif well_type == 'oil':
+                    missing = [name for name in ('oil rate', 'oil cumulative') if name not in well_details]
+                    if missing:
+                        problems.append("Oil well {} has no {}".format(well_name, ' or '.join(missing)))
+
+    for rig_name, program_details in config.get('programs', {}).items():
+        steps = program_details['program']
+        if not steps or 'start' not in steps[0]:
+            problems.append("Program for {} doesn't begin with a start step".format(rig_name))
+        location = None
+        for step in (single for step in steps for single in expand_step(step)):
+            (action, parameters), = step.items()
+            if action in ('start', 'move'):
+                location = parameters[1 if action == 'start' else 0]
+                if platforms and location not in platforms:
+                    problems.append("Program for {} goes to unknown wellhead platform {}".format(rig_name, location))
+            if action == 'drill':
+                well_name, well_type, _ = parameters
+                wells[well_name] = wells.get(well_name, 0) + 1
+                if well_type not in ('oil', 'gas'):
+                    problems.append("Program for {} drills {} of unknown type {}".format(
+                        rig_name, well_name, well_type))
+                if location in platforms:
+                    platforms[location].add(well_name)
+
+    problems.extend("Well {} is defined {} times".format(name, count) for name, count in wells.items() if count > 1)
+    for whp_name, whp_wells in platforms.items():
+        if len(whp_wells) > well_slots(config, whp_name):
+            problems.append("Wellhead platform {} has {} well slots for {} wells".format(
+                whp_name, well_slots(config, whp_name), len(whp_wells)))
+    return problems
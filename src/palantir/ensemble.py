@@ -0,0 +1,230 @@
+"""Classes for running probabilistic forecasts as ensembles of perturbed realisations"""
+
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from palantir.configuration_manager import ConfigurationManager
+from palantir.facilities import OilWell
+from palantir.manager import Manager, build_asset
+from palantir.profile_store import DAILY, PHASES
+from palantir.program import parse_parameters
+
+# Parameters that can be perturbed. Each is sampled as a multiplier on its base value.
+PARAMETERS = ('ultimate oil recovery', 'initial oil rate', 'b oil', 'gas oil ratio', 'drill duration')
+
+# Percentile of each P value under the exceedance convention: P90 is the low case
+P_VALUES = {'P10': 90, 'P50': 50, 'P90': 10}
+
+# Number of realisations sent to a worker process at a time
+CHUNK_SIZE = 4
+
+# Per-process state shared by every realisation a worker runs
+_worker = {}
+
+
+class QuantileAccumulator:
+    """Streaming estimate of one quantile for every cell of a steps x phases array
+
+    Uses the P-square algorithm (Jain & Chlamtac, 1985): five markers per cell are adjusted as each
+    realisation arrives, so memory does not grow with the number of realisations. Realisations may
+    be of different lengths; steps beyond the end of a realisation count as zero production.
+    """
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.count = 0
+        self.heights = np.zeros((5, 0, len(PHASES)))
+        self.positions = np.zeros((5, 0, len(PHASES)))
+        self.increments = np.array([0, quantile / 2, quantile, (1 + quantile) / 2, 1])
+        self.desired = None
+
+    def add(self, values):
+        """Add one realisation's values, shaped steps x phases"""
+        values = np.asarray(values, dtype=float)
+        steps = self.heights.shape[1]
+        if values.shape[0] > steps:
+            self._extend(values.shape[0])
+        elif values.shape[0] < steps:
+            values = np.concatenate([values, np.zeros((steps - values.shape[0], values.shape[1]))])
+
+        if self.count < 5:
+            self.heights[self.count] = values
+            self.count += 1
+            if self.count == 5:
+                self.heights.sort(axis=0)
+                self.positions = np.broadcast_to(np.arange(1.0, 6.0)[:, None, None], self.heights.shape).copy()
+                self.desired = 1 + 4 * self.increments
+            return
+
+        self.count += 1
+        self._update(values)
+
+    def _extend(self, steps):
+        """Add steps that every earlier realisation saw as zero"""
+        extra = steps - self.heights.shape[1]
+        self.heights = np.concatenate([self.heights, np.zeros((5, extra, len(PHASES)))], axis=1)
+        if self.count >= 5:
+            positions = np.broadcast_to(self.desired[:, None, None], (5, extra, len(PHASES)))
+        else:
+            positions = np.zeros((5, extra, len(PHASES)))
+        self.positions = np.concatenate([self.positions, positions], axis=1)
+
+    def _update(self, x):
+        q, n = self.heights, self.positions
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+
+        # cell k holds x where q[k] <= x < q[k + 1]; markers above it move up one position
+        k = (x >= q[1:4]).sum(axis=0)
+        n[1:] += np.arange(1, 5)[:, None, None] > k
+        self.desired += self.increments
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in (1, 2, 3):
+                d = self.desired[i] - n[i]
+                move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+                s = np.sign(d)
+                parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                        (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                        (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                neighbour_q = np.where(s > 0, q[i + 1], q[i - 1])
+                neighbour_n = np.where(s > 0, n[i + 1], n[i - 1])
+                linear = q[i] + s * (neighbour_q - q[i]) / (neighbour_n - n[i])
+                adjusted = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear)
+                q[i] = np.where(move, adjusted, q[i])
+                n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def value(self):
+        """The current quantile estimate, shaped steps x phases"""
+        if self.count < 5:
+            return np.percentile(self.heights[:self.count], 100 * self.quantile, axis=0)
+        return self.heights[2].copy()
+
+
+class Ensemble:
+    """Runs a probabilistic forecast as realisations of a base configuration with perturbed parameters
+
+    Distributions map a name in PARAMETERS to an object with an rvs(size, random_state) method, such
+    as a frozen scipy.stats distribution, that samples a multiplier on the base value. The config and
+    facility tree are parsed once and shared with worker processes; each realisation's field
+    production is streamed into percentile accumulators rather than kept.
+    """
+
+    def __init__(self, configuration_filepath=None, distributions=None, time_step=DAILY, config=None):
+        if config is None:
+            config = ConfigurationManager(configuration_filepath).config
+        self.config = config
+        self.distributions = distributions or {}
+        self.time_step = time_step
+
+        unknown = set(self.distributions) - set(PARAMETERS)
+        if unknown:
+            raise ValueError("Can't perturb {}".format(', '.join(sorted(unknown))))
+
+        self.asset = build_asset(self.config)
+        self.percentiles = {}
+
+    def sample(self, realisations, seed=None):
+        """Return a list of {parameter: multiplier} dicts, one per realisation"""
+        rng = np.random.default_rng(seed)
+        samples = {name: np.asarray(distribution.rvs(size=realisations, random_state=rng), dtype=float)
+                   for name, distribution in self.distributions.items()}
+        return [{name: values[i] for name, values in samples.items()} for i in range(realisations)]
+
+    def run(self, realisations, processes=None, seed=None):
+        """Run the realisations across a process pool and return P10/P50/P90 field production frames
+
+        processes=1 runs every realisation in this process.
+        """
+        accumulators = {name: QuantileAccumulator(percentile / 100) for name, percentile in P_VALUES.items()}
+        index = None
+        samples = self.sample(realisations, seed=seed)
+        initargs = (self.config, self.asset, self.time_step)
+
+        if processes == 1:
+            _initialise_worker(*initargs)
+            results = map(_run_realisation, samples)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=processes, initializer=_initialise_worker, initargs=initargs)
+            results = executor.map(_run_realisation, samples, chunksize=CHUNK_SIZE)
+
+        try:
+            for realisation_index, values in results:
+                if index is None or len(realisation_index) > len(index):
+                    index = realisation_index
+                for accumulator in accumulators.values():
+                    accumulator.add(values)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.percentiles = {name: pd.DataFrame(accumulator.value, index=index, columns=list(PHASES))
+                            for name, accumulator in accumulators.items()}
+        return self.percentiles
+
+
+def _initialise_worker(config, asset, time_step):
+    _worker['config'] = config
+    _worker['asset'] = asset
+    _worker['time_step'] = time_step
+
+
+def _run_realisation(factors):
+    """Run one realisation in a worker and return its field production calendar and values"""
+    config = perturb_config(_worker['config'], factors)
+    asset = perturb_asset(_worker['asset'], config, factors)
+    manager = Manager(config=config, asset=asset, time_step=_worker['time_step'])
+    field_production = manager.profiles.field_production
+    return field_production.index, field_production.to_numpy()
+
+
+def perturb_config(config, factors):
+    """Return a copy of a config with default well parameters and drill durations scaled by factors"""
+    config = dict(config)
+    for name in ('ultimate oil recovery', 'initial oil rate', 'b oil'):
+        if name in factors:
+            config[name] = config[name] * factors[name]
+    if 'gas oil ratio' in factors:
+        config['gas oil ratio'] = [ratio * factors['gas oil ratio'] for ratio in config['gas oil ratio']]
+    if 'drill duration' in factors and 'programs' in config:
+        config['programs'] = _scale_drill_durations(config['programs'], factors['drill duration'])
+    return config
+
+
+def perturb_asset(asset, config, factors):
+    """Return a copy of a facility tree taking its defaults from a perturbed config, with each oil well's
+    own values of the perturbed parameters, which may come from a history match or inventory, scaled
+    by their factors"""
+    asset = copy.deepcopy(asset)
+    asset.defaults = config
+    scaled = [(name, name.replace(' ', '_')) for name in ('ultimate oil recovery', 'initial oil rate', 'b oil')
+              if name in factors]
+    for well in asset.wells:
+        if isinstance(well, OilWell):
+            for name, attribute in scaled:
+                setattr(well, attribute, getattr(well, attribute) * factors[name])
+            if 'gas oil ratio' in factors:
+                well.gas_oil_ratio = [ratio * factors['gas oil ratio'] for ratio in well.gas_oil_ratio]
+    return asset
+
+
+def _scale_drill_durations(programs, factor):
+    scaled = {}
+    for rig_name, program_details in programs.items():
+        steps = []
+        for step in program_details['program']:
+            action, parameters = list(step.items())[0]
+            if action.lower() == 'drill':
+                well_name, well_type, duration = parse_parameters('drill', parameters)
+                parameters = (well_name, well_type, max(1, int(round(duration * factor))))
+            elif action.lower() == 'drill wells':
+                count, pattern, well_type, duration, first = parse_parameters('drill wells', parameters)
+                parameters = (count, pattern, well_type, max(1, int(round(duration * factor))), first)
+            steps.append({action: parameters})
+        scaled[rig_name] = dict(program_details, program=steps)
+    return scaled
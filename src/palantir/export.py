@@ -0,0 +1,88 @@
+"""Export forecast profiles as Arrow tables and partitioned Parquet datasets
+
+Needs pyarrow, an optional dependency: pip install palantir[parquet]
+"""
+
+import numpy as np
+
+from palantir.profile_store import LEVELS, PHASES
+
+# Levels a Parquet dataset is partitioned by, one directory per value
+PARTITION_COLUMNS = ('pex', 'whp')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Exporting profiles needs pyarrow: pip install palantir[parquet]") from None
+    return pyarrow
+
+
+def _store(profiles):
+    return getattr(profiles, 'store', profiles)
+
+
+def to_arrow(profiles, start=None, end=None, dtype=np.float32):
+    """Return the profiles as a long Arrow table with one row per well per step
+
+    Columns are date, dictionary encoded asset/pex/whp/well names, and a rate column per phase. The
+    rates are gathered from the store in one pass and written phase-major in the requested dtype, so
+    Arrow wraps each rate column's buffer without copying it, and there is no pandas round trip.
+        - profiles: a Profiles or ProfileStore
+        - start, end: optional dates limiting the rows to steps in [start, end)
+        - dtype: rate dtype, float32 by default
+    """
+    pa = _pyarrow()
+    store = _store(profiles)
+    if store.start_date is None:
+        return pa.table({'date': pa.array([], pa.date32())})
+
+    window = [None if date is None else store.offset(date) for date in (start, end)]
+    rows, t, steps = store.long_rows(*window)
+
+    columns = {'date': pa.array(np.datetime64(store.start_date, 'D') + _step_days(store, steps))}
+    for i, level in enumerate(LEVELS):
+        dictionary = pa.array(store.categories[level], pa.string())
+        columns[level] = pa.DictionaryArray.from_arrays(pa.array(store.codes[rows, i]), dictionary)
+    # gathered into a phase-major buffer, converting the dtype on the way, so each rate column is
+    # contiguous and wrapped by Arrow without a further copy
+    values = np.empty((len(PHASES), len(rows)), dtype=dtype)
+    values.T[...] = store.gather(rows, t)
+    for i, phase in enumerate(PHASES):
+        columns[phase] = pa.array(values[i])
+    return pa.table(columns)
+
+
+def _step_days(store, steps):
+    """Days from the calendar start to the start of each step"""
+    index = store.index
+    days = (index - index[0]).days.to_numpy() if len(index) else np.zeros(0, dtype=int)
+    return days[steps].astype('timedelta64[D]')
+
+
+def write_parquet(profiles, path, partition_cols=PARTITION_COLUMNS, start=None, end=None, dtype=np.float32):
+    """Write the profiles as a Parquet dataset in directories partitioned by pex and whp
+
+    Readers can select partitions and date ranges without loading the rest, see read_parquet.
+        - path: root directory of the dataset
+        - partition_cols: hierarchy levels to partition by
+    """
+    pa = _pyarrow()
+    table = to_arrow(profiles, start=start, end=end, dtype=dtype)
+    pa.parquet.write_to_dataset(table, root_path=str(path), partition_cols=list(partition_cols))
+
+
+def read_parquet(path, start=None, end=None, **levels):
+    """Read a Parquet profile dataset as an Arrow table, e.g. read_parquet(path, pex='nene', start=date)
+
+    Only the partitions matching the given levels and the row groups overlapping [start, end) are read.
+    """
+    pa = _pyarrow()
+    filters = [(level, '=', str(name).lower()) for level, name in levels.items()]
+    if start is not None:
+        filters.append(('date', '>=', np.datetime64(start, 'D').item()))
+    if end is not None:
+        filters.append(('date', '<', np.datetime64(end, 'D').item()))
+    return pa.parquet.read_table(str(path), filters=filters or None)
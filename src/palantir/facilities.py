@@ -1,17 +1,109 @@
 """ Classes that represent physical facilities"""
 
+from bisect import bisect_left, insort
+
 from anytree import NodeMixin, findall
 
-DEFAULT_SLOTS = 6  # TODO Fix
+from palantir.configuration_manager import DEFAULT_SLOTS
+from palantir.well_table import GAS, OIL, WellTable
+
 DEFAULT_CHOKE = 1
 
 
+class Facility(NodeMixin):
+    """A node in an Asset tree. Keeps the Asset's indexes current as nodes are attached and detached."""
+
+    def _post_attach(self, parent):
+        asset = self.root
+        if isinstance(asset, Asset):
+            asset.register(self)
+
+    def _pre_detach(self, parent):
+        asset = self.root
+        if isinstance(asset, Asset):
+            asset.unregister(self)
+
+
 class Asset(NodeMixin):
-    """Represents the Asset. Root of a tree that represents the facilities in the Asset."""
+    """Represents the Asset. Root of a tree that represents the facilities in the Asset.
+
+    Keeps name and type indexes of every facility in the tree, updated as nodes attach and detach, so
+    lookups don't search the tree.
+    """
 
     def __init__(self, name=None, defaults=None):
         self.name = name
         self.defaults = defaults
+        self._nodes_by_type = {}
+        self._nodes_by_name = {Pex: {}, WellHeadPlatform: {}, Well: {}}
+        self._slot_index = []
+        self._slot_keys = {}
+        self._slot_order = 0
+        self.well_table = WellTable()
+
+    def register(self, node):
+        """Add a node and its descendants to the indexes"""
+        for facility in (node,) + node.descendants:
+            self._nodes_by_type.setdefault(type(facility), {})[facility] = None
+            names = self._names_for(facility)
+            if names is not None:
+                names.setdefault(facility.name, {})[facility] = None
+            if isinstance(facility, WellHeadPlatform):
+                self.index_slots(facility)
+            elif isinstance(facility, Well) and facility._table is None:
+                self.well_table.adopt(facility, GAS if isinstance(facility, GasWell) else OIL)
+
+    def unregister(self, node):
+        """Remove a node and its descendants from the indexes"""
+        for facility in (node,) + node.descendants:
+            if isinstance(facility, WellHeadPlatform):
+                self.unindex_slots(facility)
+            elif isinstance(facility, Well) and facility._table is self.well_table:
+                self.well_table.release(facility)
+            self._nodes_by_type.get(type(facility), {}).pop(facility, None)
+            names = self._names_for(facility)
+            if names is not None:
+                nodes = names.get(facility.name, {})
+                nodes.pop(facility, None)
+                if not nodes:
+                    names.pop(facility.name, None)
+
+    def index_slots(self, wellhead_platform):
+        """Add a wellhead platform to the index of platforms ordered by remaining slots"""
+        self._slot_order += 1
+        key = (wellhead_platform.remaining_slots, self._slot_order)
+        self._slot_keys[wellhead_platform] = key
+        insort(self._slot_index, key + (wellhead_platform,))
+
+    def unindex_slots(self, wellhead_platform):
+        key = self._slot_keys.pop(wellhead_platform, None)
+        if key is not None:
+            del self._slot_index[bisect_left(self._slot_index, key)]
+
+    def platforms_with_capacity(self, slots=1):
+        """Wellhead platforms with at least a number of remaining slots, most free first"""
+        start = bisect_left(self._slot_index, (slots,))
+        return [entry[-1] for entry in reversed(self._slot_index[start:])]
+
+    def find_platform_with_capacity(self, slots=1, near=None):
+        """Return a wellhead platform with a number of slots free, or None. Given a platform near, prefer it,
+        then the platform on its pex with the most free slots, then the platform anywhere with the most."""
+        if near is not None:
+            if near.remaining_slots >= slots:
+                return near
+            siblings = [whp for whp in near.siblings if isinstance(whp, WellHeadPlatform)
+                        and whp.remaining_slots >= slots]
+            if siblings:
+                return max(siblings, key=lambda whp: self._slot_keys.get(whp, (whp.remaining_slots,)))
+        if self._slot_index and self._slot_index[-1][0] >= slots:
+            return self._slot_index[-1][-1]
+        return None
+
+    def _names_for(self, node):
+        return next((names for kind, names in self._nodes_by_name.items() if isinstance(node, kind)), None)
+
+    def _nodes_of_type(self, node_type):
+        return list(self._nodes_by_type.get(node_type, {}))
 
     def add_pex(self, pex):
         if isinstance(pex, Pex):
@@ -22,30 +114,27 @@ class Asset(NodeMixin):
 
     @property
     def pexes(self):
-        return findall(self, filter_=lambda node: type(node).__name__ == "Pex")
+        return self._nodes_of_type(Pex)
 
     @property
     def wellhead_platforms(self):
-        return findall(self, filter_=lambda node: type(node).__name__ == "WellHeadPlatform")
+        return self._nodes_of_type(WellHeadPlatform)
 
     @property
     def wells(self):
-        oil_wells = findall(self, filter_=lambda node: type(node).__name__ == "OilWell")
-        gas_wells = findall(self, filter_=lambda node: type(node).__name__ == "GasWell")
-        return oil_wells + gas_wells
+        return self._nodes_of_type(OilWell) + self._nodes_of_type(GasWell)
 
     def get_wellhead_platform_by_name(self, wellhead_platform_name):
-        return next((wellhead_platform for wellhead_platform in self.wellhead_platforms if
-                     wellhead_platform.name == wellhead_platform_name), None)
+        return next(iter(self._nodes_by_name[WellHeadPlatform].get(wellhead_platform_name, ())), None)
 
     def get_well_by_name(self, well_name):
-        return next((well for well in self.wells if well.name == well_name), None)
+        return next(iter(self._nodes_by_name[Well].get(well_name, ())), None)
 
     def __str__(self):
         return "Asset:{}".format(self.name)
 
 
-class Pex(NodeMixin):
+class Pex(Facility):
     """Represents a Pex in an Asset"""
 
     def __init__(self, name=None):
@@ -67,23 +156,44 @@ class Pex(NodeMixin):
         return "Pex:{}".format(self.name)
 
 
-class WellHeadPlatform(NodeMixin):
+class WellHeadPlatform(Facility):
     """Represents a Wellhead Platform in an Asset"""
 
     def __init__(self, name=None, well_slots=DEFAULT_SLOTS):
         self.parent = None
         self.name = name
-        self.well_slots = well_slots
+        self.well_count = 0
+        self._well_slots = well_slots
 
     @property
     def wells(self):
-        oil_wells = findall(self, filter_=lambda node: type(node).__name__ == "OilWell")
-        gas_wells = findall(self, filter_=lambda node: type(node).__name__ == "GasWell")
+        oil_wells = [node for node in self.children if type(node).__name__ == "OilWell"]
+        gas_wells = [node for node in self.children if type(node).__name__ == "GasWell"]
         return oil_wells + gas_wells
 
+    @property
+    def well_slots(self):
+        return self._well_slots
+
+    @well_slots.setter
+    def well_slots(self, well_slots):
+        self._update_slots(well_slots=well_slots)
+
     @property
     def remaining_slots(self):
-        return self.well_slots - len(self.wells)
+        return self.well_slots - self.well_count
+
+    def _update_slots(self, well_slots=None, well_count_change=0):
+        """Change the slot count or the live well count, keeping the Asset's slot index in order"""
+        asset = self.root
+        indexed = isinstance(asset, Asset) and self in asset._slot_keys
+        if indexed:
+            asset.unindex_slots(self)
+        if well_slots is not None:
+            self._well_slots = well_slots
+        self.well_count += well_count_change
+        if indexed:
+            asset.index_slots(self)
 
     def add_well(self, well):
         if isinstance(well, Well):
@@ -97,11 +207,64 @@ class WellHeadPlatform(NodeMixin):
         return "WellHeadPlatform:{}".format(self.name)
 
 
-class Well(NodeMixin):
-    """Represents a Well in an Asset"""
+class WellAttribute:
+    """A well attribute stored in its Asset's WellTable while the well is in an Asset, and on the well otherwise"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, well, owner=None):
+        if well is None:
+            return self
+        if well._table is None:
+            return well._values.get(self.name)
+        return well._table.get(self.name, well._row)
+
+    def __set__(self, well, value):
+        if well._table is None:
+            well._values[self.name] = value
+        else:
+            well._table.set(self.name, well._row, value)
+
+
+class RatioAttribute(WellAttribute):
+    """A [start, end] pair of values stored in the _start and _end columns of a WellTable"""
+
+    def __get__(self, well, owner=None):
+        if well is None:
+            return self
+        if well._table is None:
+            return well._values.get(self.name)
+        start = well._table.get(self.name + '_start', well._row)
+        end = well._table.get(self.name + '_end', well._row)
+        return None if start is None else [start, end]
+
+    def __set__(self, well, value):
+        if well._table is None:
+            well._values[self.name] = value
+        else:
+            start, end = (None, None) if value is None else value
+            well._table.set(self.name + '_start', well._row, start)
+            well._table.set(self.name + '_end', well._row, end)
+
+
+class Well(Facility):
+    """Represents a Well in an Asset
+
+    Decline parameters and rates are WellAttributes: once the well is attached to an Asset they live in
+    a row of the Asset's WellTable, so the profile engine can read them as columns.
+    """
+
+    active_period = WellAttribute()
+    choke = WellAttribute()
+    is_new_well = WellAttribute()
+    start_date = WellAttribute()
 
     def __init__(self, name=None, start_date=None, well_details=None, well_defaults=None):
 
+        self._table = None
+        self._row = None
+        self._values = {}
         self.parent = None
         self.name = name
         self.active_period = well_defaults['active period']
@@ -114,6 +277,31 @@ class Well(NodeMixin):
             self.is_new_well = True
             self.start_date = start_date
 
+    def _post_attach(self, parent):
+        if isinstance(parent, WellHeadPlatform):
+            parent._update_slots(well_count_change=1)
+        super()._post_attach(parent)
+
+    def _pre_detach(self, parent):
+        super()._pre_detach(parent)
+        if isinstance(parent, WellHeadPlatform):
+            parent._update_slots(well_count_change=-1)
+
+    @classmethod
+    def from_table_row(cls, name, table, row):
+        """A well whose attributes have already been written to a row of a WellTable"""
+        well = cls.__new__(cls)
+        well._table, well._row, well._values = table, row, None
+        well.name = name
+        table.wells[row] = well
+        return well
+
+    @classmethod
+    def table_attributes(cls):
+        """Names of the attributes stored in a WellTable"""
+        return [name for klass in reversed(cls.__mro__) for name, value in vars(klass).items()
+                if isinstance(value, WellAttribute)]
+
     @property
     def whp(self):
         return self.parent
@@ -135,6 +323,13 @@ class Well(NodeMixin):
 class OilWell(Well):
     """Represents an oil well in an Asset"""
 
+    initial_oil_rate = WellAttribute()
+    oil_rate = WellAttribute()
+    oil_cumulative = WellAttribute()
+    ultimate_oil_recovery = WellAttribute()
+    b_oil = WellAttribute()
+    gas_oil_ratio = RatioAttribute()
+
     def __init__(self, name=None, start_date=None, well_details=None, well_defaults=None):
         super().__init__(name=name, start_date=start_date, well_details=well_details, well_defaults=well_defaults)
         # defaults
@@ -147,12 +342,21 @@ class OilWell(Well):
             # It's an existing well
             self.oil_rate = well_details['oil rate']
             self.oil_cumulative = well_details['oil cumulative']
-            self.gas_oil_ratio = well_details['gas oil ratio']
+            self.gas_oil_ratio = well_details.get('gas oil ratio', self.gas_oil_ratio)
 
 
 class GasWell(Well):
     """Represents a gas well in an Asset"""
 
+    initial_gas_rate = WellAttribute()
+    gas_rate = WellAttribute()
+    gas_cumulative = WellAttribute()
+    ultimate_gas_recovery = WellAttribute()
+    b_gas = WellAttribute()
+    gas_condensate_ratio = WellAttribute()
+    condensate_rate = WellAttribute()
+    condensate_cumulative = WellAttribute()
+
     def __init__(self, name=None, start_date=None, well_details=None, well_defaults=None):
         super().__init__(name=name, start_date=start_date, well_details=well_details, well_defaults=well_defaults)
         # defaults
@@ -162,7 +366,7 @@ class GasWell(Well):
         self.b_gas = well_defaults['b gas']
         # details
         if well_details:
-            self.condensate_rate = well_details['condensate rate']
-            self.condensate_cumulative = well_details['condensate cumulative']
-            self.gas_rate = well_details['gas rate']
-            self.gas_cumulative = well_details['gas cumulative']
+            self.condensate_rate = well_details.get('condensate rate')
+            self.condensate_cumulative = well_details.get('condensate cumulative')
+            self.gas_rate = well_details.get('gas rate')
+            self.gas_cumulative = well_details.get('gas cumulative')
@@ -0,0 +1,200 @@
+"""Fit Arps decline parameters to well production history"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from palantir.facilities import OilWell
+from palantir.production_history import read_production_history
+from palantir.profile import _decline, cumulative_production
+
+# Range of b allowed in a fit
+B_BOUNDS = (0.0, 2.0)
+
+# Initial b of every fit
+INITIAL_B = 0.5
+
+# Below this b the derivative with respect to b uses its series expansion
+B_SERIES = 1e-3
+
+# Convergence settings for the batch fit
+FIT_TOLERANCE = 1e-10
+FIT_MAX_ITERATIONS = 100
+
+# Wells fitted together, limiting the wells x days x parameters Jacobian held at once
+FIT_CHUNK_SIZE = 256
+
+# Fewest producing days a well needs to be fitted
+MIN_HISTORY_DAYS = 3
+
+DeclineFit = namedtuple('DeclineFit', ['qoi', 'di', 'b', 'rmse', 'converged'])
+
+
+def _log_arps(theta, t):
+    """Log rate of Arp's equation, and its Jacobian, for parameters (ln qoi, ln di, b) per well
+        - theta: wells x 3 parameters
+        - t: wells x days times
+    """
+    log_qoi, di, b = theta[:, 0, None], np.exp(theta[:, 1, None]), theta[:, 2, None]
+    x = di * t
+    u = 1 + b * x
+    series = b < B_SERIES
+    safe_b = np.where(series, 1.0, b)
+    log_u_over_b = np.where(series, x - b * x ** 2 / 2, np.log1p(b * x) / safe_b)
+
+    f = log_qoi - log_u_over_b
+    jacobian = np.empty(t.shape + (3,))
+    jacobian[..., 0] = 1
+    jacobian[..., 1] = -x / u
+    jacobian[..., 2] = np.where(series, x ** 2 / 2 - 2 * b * x ** 3 / 3, (log_u_over_b - x / u) / safe_b)
+    return f, jacobian
+
+
+def _initial_parameters(t, y, valid):
+    """Starting (ln qoi, ln di, b) from an exponential fit of log rate against time"""
+    n = valid.sum(axis=1)
+    st, sy = (valid * t).sum(axis=1), (valid * y).sum(axis=1)
+    stt, sty = (valid * t * t).sum(axis=1), (valid * t * y).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sty - st * sy) / (n * stt - st ** 2)
+        intercept = (sy - slope * st) / n
+    slope = np.where(np.isfinite(slope), slope, 0)
+    intercept = np.where(np.isfinite(intercept), intercept, 0)
+    return np.column_stack([intercept, np.log(np.maximum(-slope, 1e-6)), np.full(len(n), INITIAL_B)])
+
+
+def fit_decline(t, q, tol=FIT_TOLERANCE, maxiter=FIT_MAX_ITERATIONS, chunk_size=FIT_CHUNK_SIZE):
+    """Fit Arps qoi, di and b to many rate histories at once by least squares on log rate
+
+    Uses Levenberg-Marquardt with a damping factor per well: each iteration solves every well's 3 x 3
+    normal equations in one batched call, and a well stops iterating once its cost stops improving.
+    di and qoi are fitted as logs so they stay positive, and b is kept within B_BOUNDS.
+        - t: wells x days array of days since first production
+        - q: wells x days array of rates. Rates that are not positive or finite are ignored.
+    Returns a DeclineFit of arrays, one entry per well.
+    """
+    t = np.atleast_2d(np.asarray(t, dtype=float))
+    q = np.atleast_2d(np.asarray(q, dtype=float))
+    fits = [_fit_chunk(t[i:i + chunk_size], q[i:i + chunk_size], tol, maxiter)
+            for i in range(0, len(q), chunk_size)]
+    if not fits:
+        return DeclineFit(*(np.zeros(0) for _ in DeclineFit._fields))
+    return DeclineFit(*(np.concatenate(values) for values in zip(*fits)))
+
+
+def _cost(theta, t, y, valid):
+    """Sum of squared log rate residuals of each well, with the residuals and Jacobian"""
+    f, jacobian = _log_arps(theta, t)
+    residual = np.where(valid, f - y, 0)
+    return (residual ** 2).sum(axis=1), residual, jacobian * valid[..., None]
+
+
+def _fit_chunk(t, q, tol, maxiter):
+    valid = np.isfinite(q) & (q > 0) & np.isfinite(t)
+    y = np.log(np.where(valid, q, 1))
+    t = np.where(valid, t, 0)
+    enough = valid.sum(axis=1) >= MIN_HISTORY_DAYS
+
+    theta = _initial_parameters(t, y, valid)
+    cost, residual, jacobian = _cost(theta, t, y, valid)
+    damping = np.full(len(q), 1e-3)
+    active = enough.copy()
+    converged = np.zeros(len(q), dtype=bool)
+
+    for _ in range(maxiter):
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+
+        normal = np.einsum('wti,wtj->wij', jacobian[rows], jacobian[rows])
+        gradient = np.einsum('wti,wt->wi', jacobian[rows], residual[rows])
+        diagonal = np.einsum('wii->wi', normal) + 1e-12
+        damped = normal + damping[rows, None, None] * np.eye(3) * diagonal[:, None, :]
+        trial = theta[rows] - np.linalg.solve(damped, gradient[..., None])[..., 0]
+        trial[:, 2] = np.clip(trial[:, 2], *B_BOUNDS)
+
+        trial_cost, trial_residual, trial_jacobian = _cost(trial, t[rows], y[rows], valid[rows])
+        improved = trial_cost < cost[rows]
+        settled = improved & (cost[rows] - trial_cost <= tol * cost[rows])
+
+        accept = rows[improved]
+        theta[accept] = trial[improved]
+        cost[accept] = trial_cost[improved]
+        residual[accept] = trial_residual[improved]
+        jacobian[accept] = trial_jacobian[improved]
+        damping[rows] = np.where(improved, damping[rows] / 10, damping[rows] * 10)
+
+        # a well whose damping has grown this large can't be improved further from where it is
+        done = rows[settled | (damping[rows] > 1e10) | (cost[rows] <= tol)]
+        converged[done] = True
+        active[done] = False
+
+    rmse = np.sqrt(cost / np.maximum(valid.sum(axis=1), 1))
+    return np.exp(theta[:, 0]), np.exp(theta[:, 1]), theta[:, 2], rmse, converged & enough
+
+
+def history_arrays(history, phases):
+    """Return (t, q, end) arrays for one phase column of each well in a production history
+        - history: DataFrame indexed by date with (well, phase) columns, as read_production_history
+        - phases: (well, phase) columns to take
+    t is days since each well's first producing day, and end is the day after the history ends on
+    that clock.
+    """
+    days = ((history.index - history.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=float)
+    q = history[list(phases)].to_numpy(dtype=float).T
+    producing = q > 0
+    first = np.where(producing.any(axis=1), days[producing.argmax(axis=1)], 0.0)
+    t = days[None, :] - first[:, None]
+    q = np.where(t >= 0, q, 0)
+    return t, q, days[-1] + 1 - first
+
+
+def match_history(asset, history, tol=FIT_TOLERANCE, maxiter=FIT_MAX_ITERATIONS):
+    """Fit the decline of every existing well in an asset to its production history and write the
+    fitted parameters back into the wells
+
+    Oil wells are fitted to their oil history and gas wells to their gas history. For each fitted well
+    the fitted b is written, along with the fitted rate at the end of the history as the current rate
+    and the recovery that gives the fitted decline from there over the well's active period. The
+    forecast's decline rate solver then reproduces the fitted decline. Oil cumulatives are taken from
+    the history. Wells that are missing from the history or whose fit does not converge are left as
+    they are.
+        - history: DataFrame from read_production_history, or the path of a production CSV
+    Returns a DataFrame of the fit for each well with history.
+    """
+    if not isinstance(history, pd.DataFrame):
+        history = read_production_history(history)
+
+    wells = [well for well in asset.wells if not well.is_new_well]
+    columns = [(well.name, 'oil' if isinstance(well, OilWell) else 'gas') for well in wells]
+    fitted = [(well, column) for well, column in zip(wells, columns) if column in history]
+    if not fitted:
+        return pd.DataFrame(columns=['qoi', 'di', 'b', 'rmse', 'converged', 'rate', 'decline', 'remaining'])
+
+    wells, columns = zip(*fitted)
+    t, q, end = history_arrays(history, columns)
+    fit = fit_decline(t, q, tol=tol, maxiter=maxiter)
+
+    rate = _decline(fit.di, end, fit.qoi, fit.b)
+    decline = fit.di / (1 + fit.b * fit.di * end)
+    active_period = np.array([well.active_period for well in wells])
+    remaining = cumulative_production(decline, rate, fit.b, active_period)
+    cumulative = history[list(columns)].to_numpy(dtype=float).sum(axis=0)
+
+    for i, well in enumerate(wells):
+        if not fit.converged[i]:
+            continue
+        if isinstance(well, OilWell):
+            well.b_oil = float(fit.b[i])
+            well.oil_rate = float(rate[i])
+            well.oil_cumulative = float(cumulative[i])
+            well.ultimate_oil_recovery = float(cumulative[i] + remaining[i])
+        else:
+            well.b_gas = float(fit.b[i])
+            well.initial_gas_rate = float(rate[i])
+            well.ultimate_gas_recovery = float(remaining[i])
+
+    return pd.DataFrame({'qoi': fit.qoi, 'di': fit.di, 'b': fit.b, 'rmse': fit.rmse, 'converged': fit.converged,
+                         'rate': rate, 'decline': decline, 'remaining': remaining},
+                        index=pd.Index([well.name for well in wells], name='well'))
@@ -0,0 +1,129 @@
+"""Build the wells of an Asset from a tabular well inventory
+
+An inventory has one row per existing well, with columns
+
+    pex, whp, well, type, oil_rate, oil_cumulative, gas_oil_ratio_start, gas_oil_ratio_end,
+    gas_rate, gas_cumulative, gas_condensate_ratio, condensate_rate, condensate_cumulative
+
+pex, whp, well and type ('oil' or 'gas') are required, as are oil_rate and oil_cumulative for oil
+wells. Column names may also be written as in a configuration file, e.g. 'oil rate'. Blank GOR and
+CGR values take the configuration defaults.
+"""
+
+import numpy as np
+import pandas as pd
+
+from palantir.configuration_manager import well_slots
+from palantir.facilities import GasWell, OilWell, Pex, WellHeadPlatform
+from palantir.well_table import GAS, OIL
+
+REQUIRED_COLUMNS = ('pex', 'whp', 'well', 'type')
+REQUIRED_OIL_COLUMNS = ('oil_rate', 'oil_cumulative')
+WELL_TYPES = {'oil': OIL, 'gas': GAS}
+
+
+def read_inventory(filepath):
+    """Read a well inventory from a CSV file, or a Parquet file (which needs pyarrow or fastparquet)"""
+    if str(filepath).lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(filepath)
+    return pd.read_csv(filepath)
+
+
+def add_inventory(asset, inventory):
+    """Add the wells of an inventory to an Asset, creating any pexes and wellhead platforms it names.
+
+    Well attributes are written to the Asset's WellTable as whole columns rather than well by well.
+        - asset: an Asset whose defaults are a parsed config
+        - inventory: a DataFrame, or the path of a CSV or Parquet file
+    Returns the Asset.
+    """
+    if not isinstance(inventory, pd.DataFrame):
+        inventory = read_inventory(inventory)
+    inventory = inventory.rename(columns=lambda column: str(column).strip().lower().replace(' ', '_'))
+    _validate(asset, inventory)
+
+    config = asset.defaults
+    type_codes = inventory['type'].astype(str).str.strip().str.lower().map(WELL_TYPES).to_numpy(np.int8)
+    oil = type_codes == OIL
+    gas = ~oil
+
+    def column(name, mask, default=np.nan):
+        if name in inventory:
+            values = inventory[name].to_numpy(dtype=float, na_value=np.nan)
+            values = np.where(np.isnan(values), default, values)
+        else:
+            values = np.full(len(inventory), default, dtype=float)
+        return np.where(mask, values, np.nan)
+
+    missing = [name for name in REQUIRED_OIL_COLUMNS if np.isnan(column(name, oil)[oil]).any()]
+    if missing:
+        raise ValueError("Oil wells in inventory are missing {}".format(', '.join(missing)))
+
+    gor_start, gor_end = config['gas oil ratio']
+    values = {
+        'start_date': np.datetime64(config['start date'], 's'),
+        'active_period': config['active period'],
+        'choke': config['choke'],
+        'is_new_well': False,
+        'ultimate_oil_recovery': np.where(oil, config['ultimate oil recovery'], np.nan),
+        'initial_oil_rate': np.where(oil, config['initial oil rate'], np.nan),
+        'b_oil': np.where(oil, config['b oil'], np.nan),
+        'oil_rate': column('oil_rate', oil),
+        'oil_cumulative': column('oil_cumulative', oil),
+        'gas_oil_ratio_start': column('gas_oil_ratio_start', oil, gor_start),
+        'gas_oil_ratio_end': column('gas_oil_ratio_end', oil, gor_end),
+        'ultimate_gas_recovery': np.where(gas, config['ultimate gas recovery'], np.nan),
+        'initial_gas_rate': np.where(gas, config['initial gas rate'], np.nan),
+        'b_gas': np.where(gas, config['b gas'], np.nan),
+        'gas_condensate_ratio': column('gas_condensate_ratio', gas, config['gas condensate ratio']),
+        'gas_rate': column('gas_rate', gas),
+        'gas_cumulative': column('gas_cumulative', gas),
+        'condensate_rate': column('condensate_rate', gas),
+        'condensate_cumulative': column('condensate_cumulative', gas),
+    }
+
+    platforms = _wellhead_platforms(asset, inventory['pex'].astype(str), inventory['whp'].astype(str))
+    rows = asset.well_table.extend(type_codes, platforms, values)
+
+    for name, type_code, row, whp in zip(inventory['well'].astype(str), type_codes.tolist(), rows.tolist(), platforms):
+        well_class = OilWell if type_code == OIL else GasWell
+        well_class.from_table_row(name, asset.well_table, row).parent = whp
+
+    return asset
+
+
+def _validate(asset, inventory):
+    missing = [name for name in REQUIRED_COLUMNS if name not in inventory]
+    if missing:
+        raise ValueError("Inventory is missing columns: {}".format(', '.join(missing)))
+
+    types = inventory['type'].astype(str).str.strip().str.lower()
+    unknown = sorted(set(types) - set(WELL_TYPES))
+    if unknown:
+        raise ValueError("Unknown well types in inventory: {}".format(', '.join(unknown)))
+
+    names = inventory['well'].astype(str)
+    duplicated = sorted(set(names[names.duplicated()]) |
+                        {name for name in names if asset.get_well_by_name(name) is not None})
+    if duplicated:
+        raise ValueError("Duplicate wells in inventory: {}".format(', '.join(duplicated)))
+
+
+def _wellhead_platforms(asset, pex_names, whp_names):
+    """The wellhead platform of each inventory row, creating those that don't exist yet"""
+    pexes = {pex.name: pex for pex in asset.pexes}
+    whps = {(whp.parent.name, whp.name): whp for whp in asset.wellhead_platforms}
+
+    keys = pd.MultiIndex.from_arrays([pex_names, whp_names])
+    codes, uniques = pd.factorize(keys)
+    platforms = []
+    for pex_name, whp_name in uniques:
+        if pex_name not in pexes:
+            pexes[pex_name] = Pex(name=pex_name)
+            asset.add_pex(pexes[pex_name])
+        if (pex_name, whp_name) not in whps:
+            whps[pex_name, whp_name] = WellHeadPlatform(name=whp_name,
+                                                        well_slots=well_slots(asset.defaults or {}, whp_name))
+            pexes[pex_name].add_wellhead_platform(whps[pex_name, whp_name])
+        platforms.append(whps[pex_name, whp_name])
+    return [platforms[code] for code in codes]
@@ -1,52 +1,95 @@
 """Classes for parsing a configuration file and managing the creation of a forecast"""
 
-from palantir.configuration_manager import ConfigurationManager
+import warnings
+
+from palantir.configuration_manager import ConfigurationManager, well_slots
 from palantir.facilities import Asset, GasWell, OilWell, Pex, WellHeadPlatform
+from palantir.history_match import match_history
+from palantir.inventory import add_inventory
 from palantir.profile import Profiles
+from palantir.profile_store import DAILY
 from palantir.program import Program
+from palantir.schedule import Scheduler
 
 
-class Manager:
-    """Manages the production and exporting of a forecast"""
+def build_asset(config, inventory=None):
+    """Construct the facility tree of pexes, wellhead platforms and existing wells described by a config,
+    adding the wells of a tabular inventory (a DataFrame, or a CSV or Parquet file) if one is given"""
+
+    asset = Asset(config['asset'], defaults=config)
+
+    for pex_name, whps in (config['pexes'] or {}).items():
+        pex = Pex(name=pex_name)
+        asset.add_pex(pex)
+
+        for whp_name, wells in whps.items():
+            whp = WellHeadPlatform(name=whp_name, well_slots=well_slots(config, whp_name))
+            pex.add_wellhead_platform(whp)
+
+            if wells:
+                for well_name, well_details in wells.items():
+                    if well_details['type'] == 'oil':
+                        well = OilWell(name=well_name, well_details=well_details, well_defaults=config)
+                    else:
+                        well = GasWell(name=well_name, well_details=well_details, well_defaults=config)
+                    whp.add_well(well)
 
-    def __init__(self, configuration_filepath):
+    if inventory is not None:
+        add_inventory(asset, inventory)
 
-        configuration_manager = ConfigurationManager(configuration_filepath)
-        self.config = configuration_manager.config
+    return asset
 
-        self.asset = None
+
+class Manager:
+    """Manages the production and exporting of a forecast"""
+
+    def __init__(self, configuration_filepath=None, time_step=DAILY, config=None, asset=None, inventory=None,
+                 profile_path=None, history=None):
+        """Build a forecast from a configuration file, or from an already parsed config.
+        An asset built from the same config may be given to skip constructing the facility tree;
+        it is used as is, and programs add their wells to it. Existing wells may also be loaded from
+        a tabular inventory, see palantir.inventory. Given a profile_path, well curves are kept in a
+        memory-mapped file there rather than in memory. Given a production history, existing wells'
+        declines are first fitted to it, see palantir.history_match."""
+
+        if config is None:
+            configuration_manager = ConfigurationManager(configuration_filepath)
+            config = configuration_manager.config
+        self.config = config
+
+        self.asset = asset
         self.programs = []
+        self.scheduler = None
+        self.waits = []
         self.rig = None
-        self.profiles = Profiles()
-
-        self._initialise_facilities()
+        self.profiles = Profiles(start_date=self.config['start date'], time_step=time_step, path=profile_path)
+        self.unconverged_wells = []
+        self.inventory = inventory
+
+        if self.asset is None:
+            self._initialise_facilities()
+        self.history_match = None
+        if history is not None:
+            self._match_history(history)
         self._run_programs()
         self._initialise_profiles()
 
     def _initialise_facilities(self):
         """Construct the facility tree of wellhead platforms and wells"""
-        
-        self.asset = Asset(self.config['asset'], defaults=self.config)
-
-        for pex_name, whps in self.config['pexes'].items():
-            pex = Pex(name=pex_name)
-            self.asset.add_pex(pex)
 
-            for whp_name, wells in whps.items():
-                whp = WellHeadPlatform(name=whp_name)
-                pex.add_wellhead_platform(whp)
+        self.asset = build_asset(self.config, inventory=self.inventory)
 
-                if wells:
-                    for well_name, well_details in wells.items():
-                        if well_details['type'] == 'oil':
-                            well = OilWell(name=well_name, well_details=well_details, well_defaults=self.config)
-                        else:
-                            well = GasWell(name=well_name, well_details=well_details, well_defaults=self.config)
-                        whp.add_well(well)
+    def _match_history(self, history):
+        """Fit existing wells' declines to their production history"""
+        self.history_match = match_history(self.asset, history)
+        unmatched = list(self.history_match.index[~self.history_match['converged'].to_numpy(dtype=bool)])
+        if unmatched:
+            warnings.warn("History match did not converge for wells: {}".format(', '.join(unmatched)),
+                          RuntimeWarning)
 
     def _run_programs(self):
-        """Parses configuration file for program steps, builds, and runs the program"""
-        # TODO process multiple programs
+        """Parses configuration file for program steps, builds the programs, and runs every rig's program
+        together on one clock, see palantir.schedule"""
         # TODO trap no program
         # TODO check WellheadPlatform exists and create if missing
 
@@ -58,11 +101,110 @@ class Manager:
                                   steps=program_details['program'])
                 self.programs.append(program)
 
-            for program in self.programs:
-                program.execute()
+        self.scheduler = Scheduler(self.programs)
+        self.waits = self.scheduler.run()
 
     def _initialise_profiles(self):
-        """Build composite profile DataFrame from individual wells"""
-
-        for well in self.asset.wells:
-            self.profiles.add(well)
+        """Build composite profile DataFrame from individual wells, solving all decline rates in one pass"""
+
+        wells = self.asset.wells
+        self.profiles.set_hierarchy(self.asset)
+        self._well_states = self._current_well_states()
+        keys = [self._well_states[well.name][0] for well in wells]
+        di, converged = self.profiles.solve(wells, keys=keys)
+
+        self.unconverged_wells = [well.name for well, ok in zip(wells, converged) if not ok]
+        if self.unconverged_wells:
+            warnings.warn("Decline rates did not converge for wells: {}".format(', '.join(self.unconverged_wells)),
+                          RuntimeWarning)
+
+        for well, well_di, key in zip(wells, di, keys):
+            self.profiles.add(well, di=well_di, key=key)
+
+    def _current_well_states(self):
+        """The inputs each well's profile depends on: its decline parameters, start date and location"""
+        wells = self.asset.wells
+        return {well.name: (key, well.start_date, well.whp.name, well.pex.name)
+                for well, key in zip(wells, self.profiles.cache.keys(wells))}
+
+    def _reforecast(self):
+        """Recompute the profiles of wells that were added, removed, or whose inputs changed"""
+        states = self._current_well_states()
+        removed = [name for name in self._well_states if name not in states]
+        changed = [name for name, state in states.items() if self._well_states.get(name) != state]
+
+        for name in removed:
+            self.profiles.remove(name)
+
+        unconverged = set(self.unconverged_wells) - set(changed) - set(removed)
+        if changed:
+            wells = [self.asset.get_well_by_name(name) for name in changed]
+            keys = [states[name][0] for name in changed]
+            di, converged = self.profiles.solve(wells, keys=keys)
+            for well, well_di, key in zip(wells, di, keys):
+                self.profiles.replace(well, di=well_di, key=key)
+            unconverged |= {well.name for well, ok in zip(wells, converged) if not ok}
+        self.unconverged_wells = [well.name for well in self.asset.wells if well.name in unconverged]
+
+        self._well_states = states
+        return changed + removed
+
+    def get_program(self, rig_name):
+        return next((program for program in self.programs if program.rig.name == rig_name), None)
+
+    def update_well(self, well_name, **parameters):
+        """Change attributes of a well, e.g. update_well('NNM-3', oil_rate=1500), and re-forecast only that well.
+        Returns the names of the wells whose profiles were recomputed."""
+        well = self.asset.get_well_by_name(well_name)
+        if well is None:
+            raise ValueError("No well named {}".format(well_name))
+        for name in parameters:
+            if not hasattr(well, name):
+                raise ValueError("Well {} has no parameter {}".format(well_name, name))
+        for name, value in parameters.items():
+            setattr(well, name, value)
+        return self._reforecast()
+
+    def insert_step(self, rig_name, index, step):
+        """Insert a program step, e.g. insert_step('Rig1', 2, {'drill': 'NNM-307, oil, 70'}), and re-forecast"""
+        program = self._program(rig_name)
+        table = program.table
+        program.insert_step(index, step)
+        return self._rerun_programs(program, table)
+
+    def remove_step(self, rig_name, index):
+        """Remove a program step and re-forecast"""
+        program = self._program(rig_name)
+        table = program.table
+        program.remove_step(index)
+        return self._rerun_programs(program, table)
+
+    def set_step_duration(self, rig_name, index, duration):
+        """Change the duration of a drill, move or standby step and re-forecast"""
+        program = self._program(rig_name)
+        table = program.table
+        step = program.steps[index]
+        if not hasattr(step, 'duration'):
+            raise ValueError("Step {} of {} has no duration".format(index, rig_name))
+        step.duration = int(duration)
+        return self._rerun_programs(program, table)
+
+    def _program(self, rig_name):
+        program = self.get_program(rig_name)
+        if program is None:
+            raise ValueError("No program for rig {}".format(rig_name))
+        return program
+
+    def _rerun_programs(self, program, table):
+        """Run the programs after an edit to one of them, and re-forecast. If they can't be run, the edit is
+        undone by going back to the program's StepTable from before it, and the previous schedule is
+        restored before the error is raised, so the wells and profiles are left as they were."""
+        try:
+            self.scheduler = Scheduler(self.programs)
+            self.waits = self.scheduler.run()
+        except Exception:
+            program.restore(table)
+            self.scheduler = Scheduler(self.programs)
+            self.waits = self.scheduler.run()
+            raise
+        return self._reforecast()
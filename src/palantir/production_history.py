@@ -0,0 +1,117 @@
+"""Summarise historical well production from a CSV file into facility configuration entries
+
+The CSV has a Date column and one column per well per phase named '<well> <Phase>', e.g. 'NNM-3 Oil',
+'NNM-3 Gas' or 'LJM-11 Condensate'. Blank values count as zero. A well with an oil column is an oil
+well, otherwise it is a gas well.
+"""
+
+import numpy as np
+import pandas as pd
+import yaml
+
+try:
+    from yaml import CSafeDumper as Dumper
+except ImportError:
+    from yaml import SafeDumper as Dumper
+
+HISTORY_PHASES = ('oil', 'gas', 'condensate')
+
+# Rows of the CSV read at a time
+DEFAULT_CHUNKSIZE = 100000
+
+# Gas in the CSV is in MMscf
+DEFAULT_GAS_SCALE = 1000000
+
+
+def summarise_production(filepath, chunksize=DEFAULT_CHUNKSIZE, gas_scale=DEFAULT_GAS_SCALE):
+    """Return each well's last rate and cumulative of each phase, reading the CSV a chunk at a time
+
+    Returns a DataFrame indexed by well name with a type column ('oil' or 'gas') and <phase>_rate and
+    <phase>_cumulative columns, in the order wells first appear in the CSV header.
+        - filepath: production CSV
+        - chunksize: rows read at a time
+        - gas_scale: multiplier applied to gas values
+    """
+    cumulative = None
+    last = None
+
+    for chunk in pd.read_csv(filepath, index_col='Date', chunksize=chunksize):
+        values = chunk.to_numpy(dtype=float, na_value=0.0)
+        cumulative = values.sum(axis=0) if cumulative is None else cumulative + values.sum(axis=0)
+        if len(values):
+            last = values[-1]
+            columns = chunk.columns
+
+    summary_columns = ['{}_{}'.format(phase, kind) for phase in HISTORY_PHASES for kind in ('rate', 'cumulative')]
+    if last is None:
+        return pd.DataFrame(columns=['type'] + summary_columns)
+
+    wells, phases = _split_columns(columns)
+    scale = np.where(phases == 'gas', gas_scale, 1.0)
+    by_phase = pd.DataFrame({'rate': last * scale, 'cumulative': cumulative * scale},
+                            index=pd.MultiIndex.from_arrays([wells, phases])).unstack()
+
+    summary = pd.DataFrame(index=pd.unique(wells))
+    for phase in HISTORY_PHASES:
+        for kind in ('rate', 'cumulative'):
+            summary['{}_{}'.format(phase, kind)] = by_phase[kind, phase] if (kind, phase) in by_phase else np.nan
+    summary.insert(0, 'type', np.where(summary['oil_rate'].notna(), 'oil', 'gas'))
+    return summary
+
+
+def read_production_history(filepath, chunksize=DEFAULT_CHUNKSIZE, gas_scale=DEFAULT_GAS_SCALE):
+    """Return the daily production of a CSV as a DataFrame indexed by date with (well, phase) columns
+
+    The file is read a chunk at a time into one array. Dates are day first, as in configuration files.
+    """
+    dates, chunks, columns = [], [], None
+    for chunk in pd.read_csv(filepath, index_col='Date', chunksize=chunksize):
+        dates.append(chunk.index.to_numpy())
+        chunks.append(chunk.to_numpy(dtype=float, na_value=0.0))
+        columns = chunk.columns
+    if columns is None:
+        raise ValueError("No production history in {}".format(filepath))
+
+    wells, phases = _split_columns(columns)
+    values = np.concatenate(chunks) * np.where(phases == 'gas', gas_scale, 1.0)
+    index = pd.DatetimeIndex(pd.to_datetime(np.concatenate(dates), dayfirst=True), name='date')
+    columns = pd.MultiIndex.from_arrays([wells, phases], names=['well', 'phase'])
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def _split_columns(columns):
+    """Split '<well> <Phase>' column names into arrays of well names and lower case phases"""
+    names = pd.Series(columns, dtype=str).str.rsplit(' ', n=1, expand=True)
+    if names.shape[1] != 2 or names[1].isna().any():
+        raise ValueError("Production columns must be named '<well> <Phase>'")
+    phases = names[1].str.lower()
+    unknown = sorted(set(phases) - set(HISTORY_PHASES))
+    if unknown:
+        raise ValueError("Unknown production phases: {}".format(', '.join(unknown)))
+    return names[0].to_numpy(), phases.to_numpy()
+
+
+def facilities_config(summary, asset, pex, whp):
+    """Return the facilities section of a configuration for the wells of a production summary, all on
+    one wellhead platform"""
+    wells = {}
+    for name, row in zip(summary.index, summary.to_dict('records')):
+        details = {'type': row['type']}
+        for phase in HISTORY_PHASES:
+            for kind in ('rate', 'cumulative'):
+                value = row['{}_{}'.format(phase, kind)]
+                if not pd.isna(value):
+                    details['{} {}'.format(phase, kind)] = int(value)
+        wells[name] = details
+    return {'facilities': {'asset': asset, 'pexes': {pex: {whp: wells}}}}
+
+
+def write_facilities(summary, output, asset, pex, whp):
+    """Write the facilities section for a production summary as YAML to a path or file object"""
+    text = yaml.dump(facilities_config(summary, asset, pex, whp), Dumper=Dumper, sort_keys=False,
+                     default_flow_style=False)
+    if hasattr(output, 'write'):
+        output.write(text)
+    else:
+        with open(output, 'w') as out_file:
+            out_file.write(text)
@@ -1,14 +1,41 @@
 """Classes that represent production profiles"""
 
+import warnings
+from collections import OrderedDict, namedtuple
+
 import numpy as np
-import pandas as pd
 from palantir.facilities import OilWell
-from scipy import optimize
+from palantir.profile_store import DAILY, MappedProfileStore, ProfileStore
 
-# Initial estimate of Di for newton.optimize
+# Initial estimate of Di for the decline rate solver
 OIL_WELL_INITIAL_DI = 0.000880626223092
 GAS_WELL_INITIAL_DI = 0.000880626223092  # TODO check this
 
+# Number of distinct well parameter sets whose decline solutions are kept
+DEFAULT_CACHE_SIZE = 256
+
+# Convergence settings for the batch decline rate solver
+SOLVER_TOLERANCE = 1.48e-8
+SOLVER_RELATIVE_TOLERANCE = 1e-10
+SOLVER_MAX_ITERATIONS = 100
+
+# Daily decline given to wells whose uor is no more than their first day's rate, which only an infinite
+# decline would reach. Production after the first day is then negligible.
+MAX_DI = 1e12
+
+# Curvature below which decline is exponential, and distance from 1 (or 0.5) within which it is harmonic
+# (or uses the b=0.5 moment integral). The hyperbolic forms are accurate to within this distance, and
+# the special cases differ from them by about this much.
+B_EXPONENTIAL = 1e-6
+B_HARMONIC = 1e-12
+
+# Curvature below which the moment integral is taken by parts, as the hyperbolic form cancels for small b
+B_SMALL_MOMENT = 0.25
+
+# Range of daily decline over which the closed-form cumulative is used instead of the discrete sum
+MAX_ANALYTIC_DI = 0.01
+MIN_ANALYTIC_DI_TAU = 1e-6
+
 
 def _decline(di, t, qoi, b):
     """Arp's equation for general decline in a well
@@ -16,7 +43,10 @@ def _decline(di, t, qoi, b):
         - di: initial decline rate
         - b: curvature (b=0 exponential)
     """
-    return qoi / ((1 + b * di * t) ** (1 / b))
+    b = np.asarray(b, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        hyperbolic = qoi / ((1 + b * di * t) ** (1 / b))
+    return np.where(b < B_EXPONENTIAL, qoi * np.exp(-di * np.asarray(t, dtype=float)), hyperbolic)
 
 
 def _zero_function(di, t, qoi, b, uor):
@@ -25,106 +55,462 @@ def _zero_function(di, t, qoi, b, uor):
     return qo.sum() - uor
 
 
-class Profiles:
-    """Represents aggregated production profiles"""
+def _arps_integral(di, qoi, b, tau):
+    """Integral of Arp's equation from 0 to tau, for hyperbolic, harmonic (b=1) and exponential (b=0) decline"""
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # written with expm1 and log1p so it keeps full precision as b approaches 1
+        hyperbolic = -qoi / ((1 - b) * di) * np.expm1((b - 1) / b * np.log1p(b * di * tau))
+        harmonic = qoi / di * np.log1p(di * tau)
+        exponential = -qoi / di * np.expm1(-di * tau)
+    return np.select([b < B_EXPONENTIAL, np.abs(b - 1) < B_HARMONIC], [exponential, harmonic], hyperbolic)
+
 
-    def __init__(self):
-        self.curves = pd.DataFrame()
+def _discrete_cumulative(di, qoi, b, n):
+    """Exact sum of daily rates for days 0..n-1 and its derivative with respect to di
+        - di, qoi, b, n: 1-d arrays with one entry per well
+    """
+    t = np.arange(int(n.max()) if n.size else 0, dtype=float)
+    mask = t < n[:, None]
+    q = _decline(di[:, None], t, qoi[:, None], b[:, None])
+    dq = -t * q / (1 + (b * di)[:, None] * t)
+    return np.where(mask, q, 0).sum(axis=1), np.where(mask, dq, 0).sum(axis=1)
 
-    def add(self, well):
-        # well_curves = Profile(well=well).curves
 
-        t = pd.Series(range(0, well.active_period))
+def cumulative_production(di, qoi, b, n, derivative=False):
+    """Cumulative production of days 0..n-1 of an Arps decline, in O(1) per well
 
-        if isinstance(well, OilWell):
+    The daily sum is the Arps integral plus an Euler-Maclaurin end correction, with a relative error
+    below 1e-10 for daily decline rates up to MAX_ANALYTIC_DI. Wells outside the range where the
+    expansion can be trusted (very steep or vanishing decline) fall back to the exact discrete sum.
+        - di, qoi, b, n: scalars or arrays, broadcast together
+        - derivative: also return the derivative of the cumulative with respect to di
+    """
+    di, qoi, b, n = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (di, qoi, b, n)))
+    tau = np.maximum(n - 1, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        u_end = 1 + b * di * tau
+        q_end = _decline(di, tau, qoi, b)
+        integral = _arps_integral(di, qoi, b, tau)
+        slope_start = -di * qoi
+        slope_end = -di * q_end / u_end
+        cumulative = integral + (qoi + q_end) / 2 + (slope_end - slope_start) / 12
+
+        if derivative:
+            d_q_end = -tau * q_end / u_end
+            d_integral = (tau * q_end - integral) / di
+            d_slope_end = -q_end / u_end + di * tau * q_end * (1 + b) / u_end ** 2
+            d_cumulative = d_integral + d_q_end / 2 + (d_slope_end + qoi) / 12
+
+    analytic = (n > 1) & (di > 0) & (di <= MAX_ANALYTIC_DI) & (di * tau >= MIN_ANALYTIC_DI_TAU)
+    cumulative = np.where(n > 0, cumulative, 0.0)
+    if derivative:
+        d_cumulative = np.where(n > 0, d_cumulative, 0.0)
+
+    fallback = ~analytic & (n > 0)
+    if fallback.any():
+        exact, d_exact = _discrete_cumulative(di[fallback], qoi[fallback], b[fallback], n[fallback])
+        cumulative[fallback] = exact
+        if derivative:
+            d_cumulative[fallback] = d_exact
+
+    if derivative:
+        return cumulative, d_cumulative
+    return cumulative
+
+
+def _arps_moment_integral(di, qoi, b, tau):
+    """Integral of t times Arp's equation from 0 to tau, for hyperbolic, harmonic and exponential decline"""
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x = b * di * tau
+        log_u = np.log1p(x)
+        scale = qoi / (b * di) ** 2
+        hyperbolic = scale * (np.expm1((2 - 1 / b) * log_u) / (2 - 1 / b) - np.expm1((1 - 1 / b) * log_u) / (1 - 1 / b))
+        by_parts = qoi / (di * (1 - b)) * (-np.expm1((2 - 1 / b) * log_u) / (di * (1 - 2 * b))
+                                           - tau * np.exp((1 - 1 / b) * log_u))
+        harmonic = scale * (x - log_u)
+        half = scale * (log_u + np.expm1(-log_u))
+        exponential = qoi / di ** 2 * (-np.expm1(-di * tau) - di * tau * np.exp(-di * tau))
+    return np.select([b < B_EXPONENTIAL, b < B_SMALL_MOMENT, np.abs(b - 1) < B_HARMONIC, np.abs(b - 0.5) < B_HARMONIC],
+                     [exponential, by_parts, harmonic, half], hyperbolic)
+
+
+def cumulative_moment(di, qoi, b, n):
+    """Sum of t times the daily rate for days 0..n-1 of an Arps decline, in O(1) per well
+
+    Used with cumulative_production to integrate a rate weighted by a ratio that varies linearly in
+    time, such as a gas oil ratio. Follows the same Euler-Maclaurin scheme and discrete-sum fallback.
+        - di, qoi, b, n: scalars or arrays, broadcast together
+    """
+    di, qoi, b, n = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (di, qoi, b, n)))
+    tau = np.maximum(n - 1, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        u_end = 1 + b * di * tau
+        q_end = _decline(di, tau, qoi, b)
+        integral = _arps_moment_integral(di, qoi, b, tau)
+        slope_end = q_end * (1 - di * tau / u_end)
+        moment = integral + tau * q_end / 2 + (slope_end - qoi) / 12
 
-            di = OIL_WELL_INITIAL_DI
-            b_oil = well.b_oil
+    analytic = (n > 1) & (di > 0) & (di <= MAX_ANALYTIC_DI) & (di * tau >= MIN_ANALYTIC_DI_TAU)
+    moment = np.where(n > 0, moment, 0.0)
+
+    fallback = ~analytic & (n > 0)
+    if fallback.any():
+        t = np.arange(int(n[fallback].max()), dtype=float)
+        mask = t < n[fallback][:, None]
+        q = _decline(di[fallback][:, None], t, qoi[fallback][:, None], b[fallback][:, None])
+        moment[fallback] = np.where(mask, t * q, 0).sum(axis=1)
+
+    return moment
+
+
+def well_table_rows(wells):
+    """Return (table, rows) if every well is held in the same WellTable, otherwise (None, None)"""
+    tables = {id(well._table) for well in wells}
+    if len(tables) != 1 or wells[0]._table is None:
+        return None, None
+    return wells[0]._table, np.array([well._row for well in wells], dtype=int)
+
+
+def decline_inputs(wells):
+    """Return arrays of (qoi, b, uor, active_period) for the primary phase of each well"""
+    table, rows = well_table_rows(wells)
+    if table is not None:
+        return table.decline_inputs(rows)
+
+    qoi, b, uor, active_period = [], [], [], []
+
+    for well in wells:
+        if isinstance(well, OilWell):
+            b.append(well.b_oil)
             if well.is_new_well:
-                initial_oil_rate = well.initial_oil_rate
-                ultimate_oil_recovery = well.ultimate_oil_recovery
+                qoi.append(well.initial_oil_rate)
+                uor.append(well.ultimate_oil_recovery)
             else:
-                initial_oil_rate = well.oil_rate
-                ultimate_oil_recovery = well.ultimate_oil_recovery - well.oil_cumulative
-
-            # calculate di_oil
-            di_oil = optimize.newton(
-                    _zero_function,
-                    di, args=(
-                        t,
-                        initial_oil_rate,
-                        b_oil,
-                        ultimate_oil_recovery))
+                qoi.append(well.oil_rate)
+                uor.append(well.ultimate_oil_recovery - well.oil_cumulative)
+        else:
+            qoi.append(well.initial_gas_rate)
+            b.append(well.b_gas)
+            uor.append(well.ultimate_gas_recovery)
+        active_period.append(well.active_period)
+
+    return (np.array(qoi, dtype=float), np.array(b, dtype=float),
+            np.array(uor, dtype=float), np.array(active_period, dtype=int))
+
+
+def solve_decline_rates(qoi, b, uor, active_period, di=OIL_WELL_INITIAL_DI,
+                        tol=SOLVER_TOLERANCE, rtol=SOLVER_RELATIVE_TOLERANCE, maxiter=SOLVER_MAX_ITERATIONS):
+    """Solve di for every well at once so that cumulative production over the active period equals uor
+
+    Uses Newton's method safeguarded by bisection on a bracket [0, hi], where the cumulative is
+    monotonically decreasing in di. Only wells that have not yet converged are iterated.
+        - qoi, b, uor, active_period: arrays with one entry per well
+        - di: initial estimate, scalar or array
+    Returns (di, converged). Wells whose uor cannot be reached are returned with the nearest bounding
+    di and converged=False: 0 if uor >= qoi * active period, or MAX_DI if uor <= qoi.
+    """
+    qoi, b, uor = (np.atleast_1d(np.asarray(x, dtype=float)) for x in (qoi, b, uor))
+    active_period = np.atleast_1d(np.asarray(active_period, dtype=int))
+    n = len(qoi)
+
+    x = np.broadcast_to(np.asarray(di, dtype=float), (n,)).copy()
+    lo = np.zeros(n)
+    hi = x.copy()
+    converged = np.zeros(n, dtype=bool)
+
+    if n == 0:
+        return x, converged
+
+    # wells that cannot reach uor for any non-negative di
+    too_large = uor >= qoi * active_period
+    too_small = (uor <= qoi) & ~too_large
+    x[too_large] = 0.0
+    x[too_small] = MAX_DI
+    converged[too_large & (uor == qoi * active_period)] = True
+    active = ~(too_large | too_small)
+
+    # expand the upper bracket until the cumulative falls below uor
+    idx = np.flatnonzero(active)
+    for _ in range(maxiter):
+        if idx.size == 0:
+            break
+        f = cumulative_production(hi[idx], qoi[idx], b[idx], active_period[idx]) - uor[idx]
+        above = f > 0
+        lo[idx[above]] = hi[idx[above]]
+        hi[idx[above]] *= 10
+        idx = idx[above]
+    x[active] = hi[active]
+
+    idx = np.flatnonzero(active)
+    for _ in range(maxiter):
+        if idx.size == 0:
+            break
+        cumulative, dfdi = cumulative_production(x[idx], qoi[idx], b[idx], active_period[idx], derivative=True)
+        f = cumulative - uor[idx]
+
+        # tighten the bracket
+        positive = f > 0
+        lo[idx[positive]] = x[idx[positive]]
+        hi[idx[~positive]] = x[idx[~positive]]
+
+        # newton step, falling back to bisection when it leaves the bracket
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_new = x[idx] - f / dfdi
+        outside = ~((x_new > lo[idx]) & (x_new < hi[idx]))
+        x_new[outside] = 0.5 * (lo[idx[outside]] + hi[idx[outside]])
+
+        done = (np.abs(x_new - x[idx]) <= tol * np.abs(x[idx])) | (np.abs(f) <= rtol * uor[idx])
+        x[idx] = x_new
+        converged[idx[done]] = True
+        idx = idx[~done]
+
+    return x, converged
+
+
+DeclineSolution = namedtuple('DeclineSolution', ['di', 'converged', 'curves'])
+
+
+class DeclineCache:
+    """Bounded LRU cache of decline solutions for wells sharing identical parameters
+
+    Entries hold the solved di, whether it converged, and once built a read-only daily base curve
+    array (phases x active period) that can be shifted to any start date.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(well):
+        """(well type, qoi, b, uor, active period, GOR/CGR) for a well"""
+        qoi, b, uor, active_period = (float(inputs[0]) for inputs in decline_inputs([well]))
+        if isinstance(well, OilWell):
+            ratio = tuple(well.gas_oil_ratio)
+        else:
+            ratio = well.gas_condensate_ratio
+        return type(well).__name__, qoi, b, uor, int(active_period), ratio
+
+    @classmethod
+    def keys(cls, wells):
+        """Keys for many wells, read from WellTable columns when the wells share a table"""
+        table, rows = well_table_rows(wells)
+        if table is not None:
+            return table.decline_keys(rows)
+        return [cls.key(well) for well in wells]
+
+    def get(self, key):
+        """Return the cached DeclineSolution for a key, or None"""
+        solution = self._entries.get(key)
+        if solution is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return solution
+
+    def peek(self, key):
+        """Return the cached DeclineSolution for a key, or None, without counting a hit or a miss"""
+        solution = self._entries.get(key)
+        if solution is not None:
+            self._entries.move_to_end(key)
+        return solution
+
+    def put(self, key, di, converged, curves=None):
+        """Cache a solution, evicting the least recently used entry when full"""
+        if curves is not None:
+            curves = np.array(curves, dtype=float)
+            curves.setflags(write=False)
+        solution = DeclineSolution(float(di), bool(converged), curves)
+        self._entries[key] = solution
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return solution
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class Profiles:
+    """Represents aggregated production profiles
+
+    Curves are held in memory, or in a memory-mapped file at path if one is given (see MappedProfileStore).
+    """
+
+    def __init__(self, start_date=None, time_step=DAILY, cache=None, path=None):
+        if path is None:
+            self.store = ProfileStore(start_date=start_date, time_step=time_step)
+        else:
+            self.store = MappedProfileStore(path, start_date=start_date, time_step=time_step)
+        self.cache = DeclineCache() if cache is None else cache
+        self.rows = {}
+        self._curves = None
+        self._rollups = {}
+
+    @property
+    def time_step(self):
+        return self.store.time_step
+
+    def set_hierarchy(self, asset):
+        """Take the pex, wellhead platform and well lookup tables from an Asset tree"""
+        self.store.set_hierarchy(asset)
+
+    @property
+    def curves(self):
+        if self._curves is None:
+            self._curves = self.store.to_frame()
+        return self._curves
+
+    def solve(self, wells, keys=None):
+        """Return (di, converged) arrays for wells, solving each distinct parameter set once in one batch
+            - keys: the wells' cache keys, if already known
+        """
+        keys = self.cache.keys(wells) if keys is None else keys
+        solutions = {key: self.cache.get(key) for key in set(keys)}
+
+        missing = [key for key, solution in solutions.items() if solution is None]
+        if missing:
+            first = {}
+            for well, key in zip(wells, keys):
+                first.setdefault(key, well)
+            unsolved = [first[key] for key in missing]
+            initial_di = [OIL_WELL_INITIAL_DI if isinstance(well, OilWell) else GAS_WELL_INITIAL_DI
+                          for well in unsolved]
+            di, converged = solve_decline_rates(*decline_inputs(unsolved), di=initial_di)
+            for key, well_di, ok in zip(missing, di, converged):
+                solutions[key] = self.cache.put(key, well_di, ok)
+
+        return (np.array([solutions[key].di for key in keys]),
+                np.array([solutions[key].converged for key in keys], dtype=bool))
+
+    def add(self, well, di=None, key=None):
+        """Add a well's curves. If di is not given it is solved for this well alone. The well's cache key
+        may be given if already known.
+
+        With a daily time step the curves are daily rates, and a new well is held as a reference to
+        the type curve it shares with identical new wells rather than as its own curves. With a coarser
+        step they are volumes per calendar period, integrated analytically rather than generated daily.
+        """
+
+        if key is None and self.time_step == DAILY:
+            key = self.cache.key(well)
+        if di is None:
+            solution, converged = self.solve([well], keys=None if key is None else [key])
+            if not converged[0]:
+                warnings.warn("Decline rate for well {} did not converge".format(well.name), RuntimeWarning)
+            di = solution[0]
+
+        labels = (well.asset.name, well.pex.name, well.whp.name, well.name)
+        offset = self.store.offset(well.start_date)
+
+        if self.time_step == DAILY and well.is_new_well:
+            # new wells of a type share its curve, and the rollups convolve their drilling counts with it
+            self.rows[well.name] = self.store.append_type((key, float(di)), self.base_curves(well, di, key),
+                                                          offset, labels)
+        elif self.time_step == DAILY:
+            # reuse the base curve of a well with identical parameters, shifted to this start date
+            self.rows[well.name] = self.store.append(self.base_curves(well, di, key), offset, labels)
+        else:
+            curves = self._well_curves(well, di, self.store.period_edges(well.start_date, well.active_period))
+            self.rows[well.name] = self.store.append(curves, offset, labels)
+        self._curves = None
+        self._rollups = {}
+
+    def remove(self, well_name):
+        """Remove a well's curves, patching the rollups"""
+        self.store.remove(self.rows.pop(well_name))
+        self._curves = None
+        self._rollups = {}
+
+    def replace(self, well, di=None, key=None):
+        """Replace a well's curves after its parameters or start date have changed"""
+        if well.name in self.rows:
+            self.remove(well.name)
+        self.add(well, di=di, key=key)
+
+    def base_curves(self, well, di, key=None):
+        """Return a well's daily qo, qg, qc curves from its first day, whatever the time step.
+        The read-only array is shared with wells of identical parameters through the cache. Reading it
+        isn't counted in the cache statistics, as solving the well's di already was.
+            - key: the well's cache key, if already known
+        """
+        key = self.cache.key(well) if key is None else key
+        solution = self.cache.peek(key)
+        if solution is None or solution.di != di:
+            return self._well_curves(well, di)
+        if solution.curves is None:
+            solution = self.cache.put(key, di, solution.converged, self._well_curves(well, di))
+        return solution.curves
+
+    def _well_curves(self, well, di, edges=None):
+        """Return a well's qo, qg, qc curves as a phases x steps array: daily rates, or volumes between
+        the day offsets of period edges"""
+
+        qoi, b, _, _ = (inputs[0] for inputs in decline_inputs([well]))
+
+        # generate the primary phase curve, and its time-weighted curve for ratios that vary in time
+        if edges is None:
+            t = np.arange(well.active_period)
+            primary = _decline(di, t, qoi, b)
+            weighted = t * primary
+        else:
+            primary = np.diff(cumulative_production(di, qoi, b, edges))
+            weighted = np.diff(cumulative_moment(di, qoi, b, edges))
+
+        if isinstance(well, OilWell):
 
             # generate oil curve
-            qo = _decline(
-                    di_oil,
-                    t,
-                    initial_oil_rate,
-                    b_oil)
+            qo = primary
 
-            # generate gas curve
-            gor = well.gas_oil_ratio[0] + (
-                    well.gas_oil_ratio[1] - well.gas_oil_ratio[0]) * t / well.active_period
-            qg = qo * gor
+            # generate gas curve from a gas oil ratio varying linearly over the active period
+            gor_start, gor_end = well.gas_oil_ratio
+            qg = gor_start * primary + (gor_end - gor_start) / well.active_period * weighted
 
             # generate condensate curve
-            qc = pd.Series(np.zeros(well.active_period))
+            qc = np.zeros_like(primary)
 
         else:  # it's a gas well
 
-            # calculate di_gas
-            di_gas = optimize.newton(
-                    _zero_function,
-                    GAS_WELL_INITIAL_DI, args=(
-                        t,
-                        well.initial_gas_rate,
-                        well.b_gas,
-                        well.ultimate_gas_recovery))
-
             # generate gas curve
-            qg = _decline(
-                    di_gas,
-                    t,
-                    well.initial_gas_rate,
-                    well.b_gas)
+            qg = primary
 
             # generate condensate curve
             qc = qg * well.gas_condensate_ratio
 
             # generate oil curve
-            qo = pd.Series(np.zeros(well.active_period))
-
-        # pack into dataframe
-        well_dict = {
-            'asset': [well.asset.name.lower()] * well.active_period,
-            'pex': [well.pex.name.lower()] * well.active_period,
-            'whp': [well.whp.name.lower()] * well.active_period,
-            'well': [well.name.lower()] * well.active_period,
-            'date': pd.date_range(well.start_date, periods=well.active_period),
-            'qo': qo,
-            'qg': qg,
-            'qc': qc
-        }
-
-        df = pd.DataFrame(well_dict)
-        df.index = df['date']
-        del df['date']
-
-        self.curves = self.curves.append(df)
+            qo = np.zeros_like(primary)
+
+        return np.vstack([qo, qg, qc])
+
+    def _rollup(self, level):
+        """Return the cached rollup frame for a hierarchy level (None for the field), built from the store's
+        running totals, or its rows for the well level"""
+        if level not in self._rollups:
+            self._rollups[level] = self.store.rollup_frame(level)
+        return self._rollups[level]
 
     @property
     def field_production(self):
-        return self.curves.groupby(['date'])['qo', 'qg', 'qc'].sum()
+        return self._rollup(None)
 
     @property
     def pex_production(self):
-        return self.curves.groupby(['date', 'pex'])['qo', 'qg', 'qc'].sum().unstack(fill_value=0)
+        return self._rollup('pex')
 
     @property
     def whp_production(self):
-        return self.curves.groupby(['date', 'whp'])['qo', 'qg', 'qc'].sum().unstack(fill_value=0)
+        return self._rollup('whp')
 
     @property
     def well_production(self):
-        return self.curves.groupby(['date', 'well'])['qo', 'qg', 'qc'].sum().unstack(fill_value=0)
+        return self._rollup('well')
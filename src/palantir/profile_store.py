@@ -0,0 +1,619 @@
+"""Array-backed storage for well production profiles"""
+
+import numpy as np
+import pandas as pd
+
+PHASES = ('qo', 'qg', 'qc')
+LEVELS = ('asset', 'pex', 'whp', 'well')
+
+# Leading levels of LEVELS whose totals are kept as running rollups. Each well is its own group at the
+# well level, so its totals would be a second copy of the wells' values; it is built when asked for.
+ROLLUP_LEVELS = LEVELS[:3]
+
+DEFAULT_CAPACITY = 16
+
+# Initial number of values per phase in a MappedProfileStore file, and wells read per rollup chunk
+DEFAULT_VALUES_CAPACITY = 1 << 16
+DEFAULT_CHUNK_SIZE = 64
+
+# Drilling counts are convolved with their type curve by FFT unless shifting a copy of the curve for
+# each nonzero count is expected to be cheaper; this weights the FFT's n log n cost against that
+FFT_COST = 4
+
+# Time steps of the profile calendar and the pandas period frequency of each
+DAILY = 'daily'
+TIME_STEPS = {
+    DAILY: 'D',
+    'monthly': 'M',
+    'quarterly': 'Q',
+    'annual': 'Y',
+}
+
+
+def convolve_counts(counts, curve, out):
+    """Add the production of wells that share a curve into out, by convolving their drilling counts
+    with the curve
+        - counts: {(group, step): number of wells starting at that step}
+        - curve: phases x length array
+        - out: groups x phases x steps array, added to in place
+    """
+    steps = out.shape[2]
+    entries = [(group, step, count) for (group, step), count in counts.items() if step < steps]
+    if not entries:
+        return
+    length = min(curve.shape[1], steps)
+    groups, starts, number = (np.array(column) for column in zip(*entries))
+    used, rows = np.unique(groups, return_inverse=True)
+    span = starts.max() + length
+    if len(entries) * length <= FFT_COST * len(used) * span * np.log2(max(span, 2)):
+        for group, start, count in entries:
+            n = min(length, steps - start)
+            out[group, :, start:start + n] += count * curve[:, :n]
+    else:
+        dense = np.zeros((len(used), starts.max() + 1))
+        np.add.at(dense, (rows, starts), number)
+        n = min(span, steps)
+        size = 1 << int(span - 1).bit_length()
+        result = np.fft.irfft(np.fft.rfft(dense, size)[:, None, :] * np.fft.rfft(curve[:, :length], size), size)
+        out[used, :, :n] += result[:, :, :n]
+
+
+class Rollup:
+    """Running production totals for each group at one hierarchy level on the store's calendar
+
+    Wells are slice-added straight into the totals, and slice-subtracted when removed, so a rollup is
+    kept current without re-aggregating. The time axis grows by doubling when a well ends beyond it.
+    Wells that share a type curve are only counted, per group and start step, and their production is
+    convolved from the counts when values are requested.
+        - type_curves: the store's list of type curves, indexed by the curve ids of counted wells
+    """
+
+    def __init__(self, level, type_curves=()):
+        self.level = level
+        self.totals = np.zeros((0, len(PHASES), 0))
+        self.members = np.zeros(0, dtype=int)
+        self.type_curves = type_curves
+        self.counts = {}
+
+    @property
+    def observed(self):
+        return self.members > 0
+
+    def add(self, rates, offset, group):
+        """Add a well's rates (phases x steps) starting at a step offset into a group's totals"""
+        end = offset + rates.shape[1]
+        if group >= self.totals.shape[0] or end > self.totals.shape[2]:
+            self._grow(group + 1, end)
+
+        self.totals[group, :, offset:end] += rates
+        self.members[group] += 1
+
+    def remove(self, rates, offset, group):
+        """Subtract a well previously added with the same rates, offset and group"""
+        self.totals[group, :, offset:offset + rates.shape[1]] -= rates
+        self.members[group] -= 1
+        if not self.members[group]:
+            self.totals[group] = 0
+
+    def add_count(self, curve_id, offset, group, change=1):
+        """Count a well of a type curve starting at a step offset in a group, or uncount it if change is -1"""
+        counts = self.counts.setdefault(curve_id, {})
+        key = (int(group), int(offset))
+        counts[key] = counts.get(key, 0) + change
+        if not counts[key]:
+            del counts[key]
+        if group >= len(self.members):
+            self._grow_members(group + 1)
+        self.members[group] += change
+        if not self.members[group] and group < self.totals.shape[0]:
+            self.totals[group] = 0
+
+    def build(self, data, lengths, offsets, groups):
+        """Rebuild the totals from scratch by scatter-adding every well onto the calendar
+            - data: wells x phases x time array
+            - lengths, offsets, groups: per-well length, step offset and group code
+        """
+        self.totals = np.zeros((0, len(PHASES), 0))
+        self.members = np.zeros(0, dtype=int)
+        self.counts = {}
+        if not len(lengths):
+            return
+        self._grow(groups.max() + 1, (offsets + lengths).max())
+
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        t = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        self.scatter(data[rows, :, t], groups[rows], offsets[rows] + t)
+        np.add.at(self.members, groups[lengths > 0], 1)
+
+    def build_counts(self, curve_ids, offsets, groups):
+        """Count wells of type curves, given their curve ids, step offsets and group codes"""
+        for curve_id, offset, group in zip(curve_ids, offsets, groups):
+            self.add_count(curve_id, offset, group)
+
+    def scatter(self, values, groups, steps, unique=False):
+        """Add values (n x phases) into the totals at (group, step) pairs, which must be within the totals
+            - unique: whether no (group, step) pair repeats, so values can be added without np.add.at
+        """
+        for i in range(len(PHASES)):
+            if unique:
+                self.totals[groups, i, steps] += values[:, i]
+            else:
+                np.add.at(self.totals[:, i, :], (groups, steps), values[:, i])
+
+    def _grow(self, groups, steps):
+        if groups > self.totals.shape[0]:
+            groups = max(groups, 2 * self.totals.shape[0])
+        else:
+            groups = self.totals.shape[0]
+        if steps > self.totals.shape[2]:
+            steps = max(steps, 2 * self.totals.shape[2])
+        else:
+            steps = self.totals.shape[2]
+        totals = np.zeros((groups, len(PHASES), steps))
+        totals[:self.totals.shape[0], :, :self.totals.shape[2]] = self.totals
+        self.totals = totals
+        self._grow_members(groups)
+
+    def _grow_members(self, groups):
+        members = np.zeros(max(groups, len(self.members)), dtype=int)
+        members[:len(self.members)] = self.members
+        self.members = members
+
+    def values(self, steps):
+        """Return every group's production over a number of calendar steps, shaped groups x phases x steps,
+        including the wells held as counts"""
+        values = np.zeros((len(self.members), len(PHASES), steps))
+        n = min(steps, self.totals.shape[2])
+        values[:self.totals.shape[0], :, :n] = self.totals[:, :, :n]
+        for curve_id, counts in self.counts.items():
+            convolve_counts(counts, self.type_curves[curve_id], values)
+        return values
+
+    def to_frame(self, categories, index):
+        """Return a DataFrame on a calendar index with (phase, name) columns for each observed group"""
+        steps = len(index)
+        groups = np.flatnonzero(self.observed)
+        values = self.values(steps)[groups]
+        columns = pd.MultiIndex.from_product([PHASES, [categories[group] for group in groups]],
+                                             names=[None, self.level])
+        return pd.DataFrame(values.transpose(2, 1, 0).reshape(steps, len(columns)), index=index, columns=columns)
+
+    def to_total_frame(self, index):
+        """Return the sum over all groups on a calendar index with one column per phase"""
+        values = self.values(len(index)).sum(axis=0)
+        return pd.DataFrame(values.T, index=index, columns=list(PHASES))
+
+
+class ProfileStore:
+    """Preallocated store of well profiles shaped wells x phases x time
+
+    Each well is held as its rates plus an integer step offset from the store's start date, so all
+    wells share one calendar and no per-well dates are ever built. With a daily time step values are
+    daily rates; with a coarser step they are volumes per period and the calendar starts at the
+    beginning of the period containing the start date. Wells are appended into spare
+    capacity, which doubles when full, so adding a well is amortized O(1). The asset/pex/whp/well
+    hierarchy is held once per well as integer codes into per-level lookup tables. The asset, pex
+    and whp levels are kept as running Rollups; the well level is read from the wells' own rows. A
+    labelled DataFrame is only built when requested.
+
+    Wells added with append_type share a type curve instead of holding their own rates: each is a
+    curve id and offset, and the rollups count them rather than adding their rates, so a campaign of
+    identical wells costs about as much as one well. Their values are read from the type curve.
+    """
+
+    def __init__(self, start_date=None, time_step=DAILY, periods=0, capacity=DEFAULT_CAPACITY):
+        if time_step not in TIME_STEPS:
+            raise ValueError("Unknown time step {}".format(time_step))
+        self.time_step = time_step
+        self.start_date = None
+        if start_date is not None:
+            self._set_start_date(start_date)
+        self.count = 0
+        self.steps = 0
+        self.filled = 0
+        self.data = np.zeros((capacity, len(PHASES), periods))
+        self.lengths = np.zeros(capacity, dtype=int)
+        self.offsets = np.zeros(capacity, dtype=int)
+        self.slots = np.zeros(capacity, dtype=int)
+        self.curve_ids = np.full(capacity, -1, dtype=int)
+        self.codes = np.zeros((capacity, len(LEVELS)), dtype=np.int32)
+        self.categories = {level: [] for level in LEVELS}
+        self._lookup = {level: {} for level in LEVELS}
+        self.type_curves = []
+        self._type_ids = {}
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self.rollups = {level: Rollup(level, self.type_curves) for level in ROLLUP_LEVELS}
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.lengths)
+
+    @property
+    def periods(self):
+        return self.data.shape[2]
+
+    @property
+    def frequency(self):
+        return TIME_STEPS[self.time_step]
+
+    @property
+    def index(self):
+        """The shared calendar as a DatetimeIndex of the start of each step"""
+        if self.start_date is None:
+            return pd.DatetimeIndex([], name='date')
+        if self.time_step == DAILY:
+            return pd.date_range(self.start_date, periods=self.steps, name='date')
+        periods = pd.period_range(pd.Period(self.start_date, self.frequency), periods=self.steps)
+        return pd.DatetimeIndex(periods.to_timestamp(), name='date')
+
+    def _set_start_date(self, date):
+        if self.time_step != DAILY:
+            date = pd.Period(date, self.frequency).start_time
+        self.start_date = np.datetime64(date, 'D')
+
+    def set_hierarchy(self, asset):
+        """Seed the lookup tables from an Asset tree so codes follow the tree order"""
+        self.code('asset', asset.name)
+        for pex in asset.pexes:
+            self.code('pex', pex.name)
+        for whp in asset.wellhead_platforms:
+            self.code('whp', whp.name)
+        for well in asset.wells:
+            self.code('well', well.name)
+
+    def code(self, level, name):
+        """Return the integer code of a name at a hierarchy level, adding it to the lookup table if new"""
+        name = name.lower()
+        lookup = self._lookup[level]
+        if name not in lookup:
+            lookup[name] = len(self.categories[level])
+            self.categories[level].append(name)
+        return lookup[name]
+
+    def offset(self, date):
+        """Return the step offset of a date on the calendar, starting the calendar there if it is unset"""
+        if self.start_date is None:
+            self._set_start_date(date)
+        if self.time_step == DAILY:
+            return int((np.datetime64(date, 'D') - self.start_date).astype(int))
+        return (pd.Period(date, self.frequency) - pd.Period(self.start_date, self.frequency)).n
+
+    def period_edges(self, date, days):
+        """Return the boundaries, in days from a well's start date, of each calendar step it produces in
+            - date: well start date
+            - days: active period in days
+        """
+        if self.time_step == DAILY:
+            return np.arange(days + 1)
+        start = pd.Timestamp(date).normalize()
+        periods = pd.period_range(pd.Period(start, self.frequency),
+                                  pd.Period(start + pd.Timedelta(days=max(days - 1, 0)), self.frequency))
+        boundaries = (periods[1:].to_timestamp() - start).days.to_numpy()
+        return np.concatenate([[0], boundaries, [days]])
+
+    def append(self, rates, offset, labels):
+        """Add a well
+            - rates: array shaped phases x active period
+            - offset: step offset of the first value from the start date
+            - labels: (asset, pex, whp, well) names
+        """
+        rates = np.asarray(rates, dtype=float)
+        length = rates.shape[1]
+        row, offset = self._new_row(length, offset, labels)
+
+        if self.filled == self.data.shape[0] or length > self.periods:
+            slots = max(2 * self.data.shape[0], 1) if self.filled == self.data.shape[0] else self.data.shape[0]
+            self._grow(self.capacity, max(self.periods, length), slots)
+
+        self.data[self.filled, :, :length] = rates
+        self.slots[row] = self.filled
+        self.filled += 1
+        for level, group in zip(ROLLUP_LEVELS, self.codes[row]):
+            self.rollups[level].add(rates, offset, group)
+        return row
+
+    def append_type(self, key, rates, offset, labels):
+        """Add a well whose rates are a type curve shared with other wells, without copying them
+            - key: hashable identifying the type curve; the rates of the first well with a key are kept
+            - rates, offset, labels: as append
+        """
+        curve_id = self._type_ids.get(key)
+        if curve_id is None:
+            curve_id = self._type_ids[key] = len(self.type_curves)
+            self.type_curves.append(np.asarray(rates, dtype=float))
+        curve = self.type_curves[curve_id]
+        row, offset = self._new_row(curve.shape[1], offset, labels)
+
+        self.curve_ids[row] = curve_id
+        for level, group in zip(ROLLUP_LEVELS, self.codes[row]):
+            self.rollups[level].add_count(curve_id, offset, group)
+        return row
+
+    def _new_row(self, length, offset, labels):
+        """Index a new well, returning its row and its offset, which is moved if the calendar starts later"""
+        if offset < 0:
+            self._shift(-offset)
+            offset = 0
+        if self.count == self.capacity:
+            self._grow(max(2 * self.capacity, 1), self.periods)
+
+        row = self.count
+        self.lengths[row] = length
+        self.offsets[row] = offset
+        self.slots[row] = -1
+        self.curve_ids[row] = -1
+        self.codes[row] = [self.code(level, name) for level, name in zip(LEVELS, labels)]
+        self.steps = max(self.steps, offset + length)
+        self.count += 1
+        return row, offset
+
+    def remove(self, row):
+        """Remove a well, subtracting it from the rollups. Its row is kept but has no length."""
+        length = self.lengths[row]
+        if not length:
+            return
+        if self.curve_ids[row] >= 0:
+            for level, group in zip(ROLLUP_LEVELS, self.codes[row]):
+                self.rollups[level].add_count(self.curve_ids[row], self.offsets[row], group, change=-1)
+        else:
+            rates = self.data[self.slots[row], :, :length]
+            for level, group in zip(ROLLUP_LEVELS, self.codes[row]):
+                self.rollups[level].remove(rates, self.offsets[row], group)
+        self.lengths[row] = 0
+        self._trim(self.offsets[row] + length)
+
+    def _trim(self, end):
+        """Shorten the calendar to the end of the latest remaining well, after removing a well that ended
+        at step end"""
+        if end < self.steps:
+            return
+        ends = self.offsets[:self.count] + self.lengths[:self.count]
+        live = self.lengths[:self.count] > 0
+        self.steps = int(ends[live].max()) if live.any() else 0
+
+    def _shift(self, steps):
+        """Move the start date earlier by a number of steps and rebuild the rollups"""
+        if self.time_step == DAILY:
+            self.start_date -= np.timedelta64(steps, 'D')
+        else:
+            self._set_start_date((pd.Period(self.start_date, self.frequency) - steps).start_time)
+        self.offsets[:self.count] += steps
+        self.steps += steps
+        typed = self.curve_ids[:self.count] >= 0
+        rows = np.flatnonzero(~typed)
+        counted = np.flatnonzero(typed & (self.lengths[:self.count] > 0))
+        for i, level in enumerate(ROLLUP_LEVELS):
+            self.rollups[level].build(self.data[self.slots[rows]], self.lengths[rows], self.offsets[rows],
+                                      self.codes[rows, i])
+            self.rollups[level].build_counts(self.curve_ids[counted], self.offsets[counted], self.codes[counted, i])
+
+    def _grow(self, capacity, periods, slots=None):
+        """Grow the index to a number of wells, and the rates array to a number of periods and (if given)
+        a number of wells that hold their own rates"""
+        slots = self.data.shape[0] if slots is None else slots
+        data = np.zeros((slots, len(PHASES), periods))
+        data[:self.filled, :, :self.periods] = self.data[:self.filled]
+        self.data = data
+        for name in ('lengths', 'offsets', 'slots', 'curve_ids'):
+            column = np.full(capacity, -1 if name == 'curve_ids' else 0, dtype=int)
+            column[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, column)
+        codes = np.zeros((capacity, len(LEVELS)), dtype=np.int32)
+        codes[:self.count] = self.codes[:self.count]
+        self.codes = codes
+
+    def rollup(self, level):
+        """Return the Rollup of a hierarchy level. The well level is built from the store's rows each time."""
+        if level not in ROLLUP_LEVELS:
+            return self._build_rollup(level)
+        return self.rollups[level]
+
+    def _build_rollup(self, level):
+        """Build the Rollup of a hierarchy level by streaming over the wells a chunk at a time"""
+        rollup = Rollup(level)
+        i = LEVELS.index(level)
+        live = self.lengths[:self.count] > 0
+        groups = self.codes[:self.count, i]
+        if live.any():
+            rollup._grow(groups.max() + 1, self.steps)
+            # a well's steps are distinct, so no value repeats a (group, step) pair if no group has two wells
+            unique = len(np.unique(groups[live])) == live.sum()
+            for rows, t, steps, values in self.chunks():
+                rollup.scatter(values, self.codes[rows, i], steps, unique)
+            np.add.at(rollup.members, groups[live], 1)
+        return rollup
+
+    def chunks(self):
+        """Yield (rows, t, steps, values) for the stored values a chunk of wells at a time"""
+        for first in range(0, self.count, self.chunk_size):
+            wells = np.arange(first, min(first + self.chunk_size, self.count))
+            lengths = self.lengths[wells]
+            rows = np.repeat(wells, lengths)
+            t = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            yield rows, t, self.offsets[rows] + t, self.gather(rows, t)
+
+    def rollup_frame(self, level=None):
+        """Return the production of every group at a hierarchy level, or of the field if level is None"""
+        if level is None:
+            return self.rollup('asset').to_total_frame(self.index)
+        return self.rollup(level).to_frame(self.categories[level], self.index)
+
+    def gather(self, rows, t):
+        """Return the values at step t of each well in rows, shaped n x phases"""
+        curve_ids = self.curve_ids[rows]
+        typed = curve_ids >= 0
+        if not typed.any():
+            return self.data[self.slots[rows], :, t]
+        values = np.empty((len(rows), len(PHASES)))
+        values[~typed] = self.data[self.slots[rows[~typed]], :, t[~typed]]
+        for curve_id in np.unique(curve_ids[typed]):
+            selected = curve_ids == curve_id
+            values[selected] = self.type_curves[curve_id][:, t[selected]].T
+        return values
+
+    def long_rows(self, start=None, end=None):
+        """Return (rows, t, steps) arrays addressing every value in long format, one entry per well per
+        step, ordered by well then step
+            - start, end: optional window of calendar steps to keep, end exclusive
+        """
+        lengths = self.lengths[:self.count]
+        rows = np.repeat(np.arange(self.count), lengths)
+        t = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        steps = self.offsets[rows] + t
+        if start is not None or end is not None:
+            keep = (steps >= (start or 0)) & (steps < (self.steps if end is None else end))
+            rows, t, steps = rows[keep], t[keep], steps[keep]
+        return rows, t, steps
+
+    def to_frame(self):
+        """Return a long DataFrame indexed by date with one row per well per step and categorical names"""
+        rows, t, steps = self.long_rows()
+        values = self.gather(rows, t)
+
+        frame = {level: pd.Categorical.from_codes(self.codes[rows, i], categories=self.categories[level])
+                 for i, level in enumerate(LEVELS)}
+        for i, phase in enumerate(PHASES):
+            frame[phase] = values[:, i]
+
+        return pd.DataFrame(frame, index=self.index[steps] if self.count else self.index)
+
+
+class MappedProfileStore(ProfileStore):
+    """ProfileStore whose well values live in a memory-mapped file on disk
+
+    Each well's values are appended as one contiguous block of a flat values x phases file, which
+    doubles in size when full. Only a small index is held in memory: each well's position in the file,
+    length, step offset and hierarchy codes. Rollups are not kept as running totals; a level is built
+    when first requested by streaming over the wells a chunk at a time, and, except for the well level,
+    cached until wells are added or removed, so peak memory depends on the chunk size and the size of
+    the result rather than on the number of wells.
+        - path: file for the values. The index is written beside it, at path + '.npz', by flush().
+        - chunk_size: number of wells read from the file at a time when building rollups
+    """
+
+    def __init__(self, path, start_date=None, time_step=DAILY, capacity=DEFAULT_CAPACITY,
+                 values_capacity=DEFAULT_VALUES_CAPACITY, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(start_date=start_date, time_step=time_step, capacity=capacity)
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self.positions = np.zeros(capacity, dtype=np.int64)
+        self.used = 0
+        self.values = np.memmap(self.path, dtype=np.float64, mode='w+', shape=(max(values_capacity, 1), len(PHASES)))
+        self.rollups = {}
+
+    @property
+    def capacity(self):
+        return len(self.lengths)
+
+    @property
+    def periods(self):
+        return int(self.lengths[:self.count].max(initial=0))
+
+    def append(self, rates, offset, labels):
+        """Add a well, writing its rates to the end of the file"""
+        rates = np.asarray(rates, dtype=float)
+        length = rates.shape[1]
+
+        if offset < 0:
+            self._shift(-offset)
+            offset = 0
+        if self.count == self.capacity:
+            self._grow(max(2 * self.capacity, 1))
+        if self.used + length > len(self.values):
+            self._reserve(self.used + length)
+
+        self.values[self.used:self.used + length] = rates.T
+        self.positions[self.count] = self.used
+        self.lengths[self.count] = length
+        self.offsets[self.count] = offset
+        self.codes[self.count] = [self.code(level, name) for level, name in zip(LEVELS, labels)]
+        self.used += length
+        self.steps = max(self.steps, offset + length)
+        self.rollups = {}
+        self.count += 1
+        return self.count - 1
+
+    def append_type(self, key, rates, offset, labels):
+        """Add a well of a type curve. Its rates are written to the file like any other well's."""
+        return self.append(rates, offset, labels)
+
+    def remove(self, row):
+        """Remove a well. Its values stay in the file but are no longer addressed."""
+        length = self.lengths[row]
+        self.lengths[row] = 0
+        self._trim(self.offsets[row] + length)
+        self.rollups = {}
+
+    def _shift(self, steps):
+        if self.time_step == DAILY:
+            self.start_date -= np.timedelta64(steps, 'D')
+        else:
+            self._set_start_date((pd.Period(self.start_date, self.frequency) - steps).start_time)
+        self.offsets[:self.count] += steps
+        self.steps += steps
+        self.rollups = {}
+
+    def _grow(self, capacity, periods=None):
+        """Grow the in-memory index to a number of wells"""
+        for name in ('lengths', 'offsets', 'positions'):
+            column = np.zeros(capacity, dtype=getattr(self, name).dtype)
+            column[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, column)
+        codes = np.zeros((capacity, len(LEVELS)), dtype=np.int32)
+        codes[:self.count] = self.codes[:self.count]
+        self.codes = codes
+
+    def _reserve(self, size):
+        """Grow the file to hold at least size values per phase"""
+        size = max(size, 2 * len(self.values))
+        self.values.flush()
+        del self.values
+        with open(self.path, 'r+b') as values_file:
+            values_file.truncate(size * len(PHASES) * np.dtype(np.float64).itemsize)
+        self.values = np.memmap(self.path, dtype=np.float64, mode='r+', shape=(size, len(PHASES)))
+
+    def gather(self, rows, t):
+        return self.values[self.positions[rows] + t]
+
+    def rollup(self, level):
+        """Return the Rollup of a hierarchy level, streaming over the file to build it if needed. Levels
+        other than the well level are cached until wells are added or removed."""
+        if level not in ROLLUP_LEVELS:
+            return self._build_rollup(level)
+        if level not in self.rollups:
+            self.rollups[level] = self._build_rollup(level)
+        return self.rollups[level]
+
+    def flush(self):
+        """Write the values to disk and save the index beside them"""
+        self.values.flush()
+        np.savez(self.path + '.npz', positions=self.positions[:self.count], lengths=self.lengths[:self.count],
+                 offsets=self.offsets[:self.count], codes=self.codes[:self.count], used=self.used,
+                 steps=self.steps, time_step=self.time_step,
+                 start_date=np.datetime64('NaT') if self.start_date is None else self.start_date,
+                 **{'categories_' + level: np.array(self.categories[level], dtype=str) for level in LEVELS})
+
+    @classmethod
+    def open(cls, path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Reopen a store saved with flush(), mapping its values read-only"""
+        index = np.load(str(path) + '.npz')
+        start_date = None if np.isnat(index['start_date']) else index['start_date']
+        store = cls.__new__(cls)
+        ProfileStore.__init__(store, start_date=start_date, time_step=str(index['time_step']),
+                              capacity=len(index['lengths']))
+        store.path = str(path)
+        store.chunk_size = chunk_size
+        store.count = len(index['lengths'])
+        store.positions, store.lengths, store.offsets = index['positions'], index['lengths'], index['offsets']
+        store.codes = index['codes']
+        store.used, store.steps = int(index['used']), int(index['steps'])
+        for level in LEVELS:
+            for name in index['categories_' + level].tolist():
+                store.code(level, name)
+        store.values = np.memmap(store.path, dtype=np.float64, mode='r')
+        store.values = store.values.reshape(-1, len(PHASES))
+        store.rollups = {}
+        return store
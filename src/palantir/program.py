@@ -1,8 +1,6 @@
 """Classes that represent a Rig and associated rig Program"""
 from datetime import datetime, timedelta
 
-from palantir.facilities import GasWell, OilWell
-
 
 class Rig:
     """Represents a drilling rig"""
@@ -13,19 +11,47 @@ class Rig:
 
 
 class Program:
-    """Represents a rig program"""
+    """Represents a rig program
+
+    The configuration steps are compiled into a StepTable, which the scheduler runs. Step objects are
+    only built when the steps are first read or edited, and the table is then recompiled from them.
+    """
 
     def __init__(self, asset=None, config=None, rig_name=None, steps=None):
+        # imported here so configs can be parsed without loading numpy
+        from palantir.step_table import StepTable
+
         self.asset = asset
         self.config = config
         self.rig = Rig(name=rig_name)
         self.start_date = None
         self.elapsed_time = None
-        self.steps = []
-
-        self._parse_program_steps(steps)
-
-    def _parse_program_steps(self, steps):
+        self.table = StepTable(steps or ())
+        self.wells = {}
+        self._steps = None
+        self._drilled = set()
+
+    @property
+    def steps(self):
+        """The program's Step objects"""
+        if self._steps is None:
+            self._steps = [self.parse_step(self.table.step(row)) for row in range(len(self.table))]
+        return self._steps
+
+    def compile(self):
+        """Return the StepTable of the program, recompiled if the Step objects may have been changed"""
+        if self._steps is not None:
+            from palantir.step_table import StepTable
+            self.table = StepTable([step.config() for step in self._steps])
+        return self.table
+
+    def restore(self, table):
+        """Go back to a StepTable returned by an earlier compile, discarding later edits to the steps"""
+        self.table = table
+        self._steps = None
+
+    def parse_step(self, step):
+        """Build a Step from a configuration entry such as {'drill': 'NNM-305, oil, 70'}"""
         commands = {
             'start': StartStep,
             'move': MoveStep,
@@ -33,19 +59,61 @@ class Program:
             'standby': StandbyStep
         }
 
-        for step in steps:
-            elements = list(step.items())[0]
-            action = elements[0].lower()  # 'start'
-            parameters = elements[1]  # '01/01/2018'
+        elements = list(step.items())[0]
+        action = elements[0].lower()  # 'start'
+        parameters = elements[1]  # '01/01/2018'
 
-            step = commands[action](parameters=parameters, program=self)
-            self.add_step(step)
+        return commands[action](parameters=parameters, program=self)
 
     def add_step(self, step):
         self.steps.append(step)
 
+    def insert_step(self, index, step):
+        """Insert a Step or a configuration step. A drill wells step is inserted as its drill steps."""
+        self.steps[index:index] = ([self.parse_step(single) for single in expand_step(step)]
+                                   if isinstance(step, dict) else [step])
+
+    def remove_step(self, index):
+        return self.steps.pop(index)
+
     def execute(self):
+        """Run every step. Wells drilled by an earlier run are updated in place, and wells whose drill
+        step no longer exists are detached from the asset."""
+        self.reset()
         [step.execute() for step in self.steps]
+        self.finish()
+
+    def reset(self):
+        """Prepare to run the steps again"""
+        self._drilled = set()
+
+    def finish(self):
+        """Detach wells drilled by an earlier run that no step drilled this time"""
+        for well_name in set(self.wells) - self._drilled:
+            self.wells.pop(well_name).parent = None
+
+    def drill(self, well_name, well_type, start_date):
+        """Drill a well at the rig's location. A well drilled by an earlier run is updated in place."""
+        # imported here so configs can be parsed without loading the facility classes and numpy
+        from palantir.facilities import GasWell, OilWell
+
+        well_class = OilWell if well_type == 'oil' else GasWell
+        well = self.wells.get(well_name)
+        if type(well) is well_class:
+            well.start_date = start_date
+        else:
+            if well is not None:
+                well.parent = None
+            well = well_class(name=well_name, start_date=start_date, well_defaults=self.config)
+        if well.parent is not self.rig.location:
+            self.rig.location.add_well(well)
+        self.drilled(well)
+        return well
+
+    def drilled(self, well):
+        """Record a well drilled by this program"""
+        self.wells[well.name] = well
+        self._drilled.add(well.name)
 
 
 def get_parameters(string):
@@ -55,6 +123,85 @@ def get_parameters(string):
         return string.strip()
 
 
+def parse_date(value):
+    return value if isinstance(value, datetime) else datetime.strptime(value, "%d/%m/%Y")
+
+
+# Types of the parameters of each program step. A drill wells step drills a number of wells of one
+# type and duration, named from a pattern, e.g. 'drill wells: 20, NNM-4{i:02d}, oil, 70' drills
+# NNM-401 to NNM-420. Its last parameter, the number of the first well, is optional.
+STEP_PARAMETERS = {
+    'start': (parse_date, str),
+    'drill': (str, str, int),
+    'drill wells': (int, str, str, int, int),
+    'move': (str, int),
+    'standby': (int,),
+}
+
+# Default values of optional trailing parameters
+STEP_DEFAULTS = {
+    'drill wells': (1,),
+}
+
+
+def parse_parameters(action, parameters):
+    """Return a step's parameters as a tuple of typed values. Parameters may be a configuration string
+    such as 'NNM-305, oil, 70', a single value, or an already parsed tuple."""
+    if isinstance(parameters, str):
+        values = [parameter.strip() for parameter in parameters.split(',')]
+    elif isinstance(parameters, (tuple, list)):
+        values = parameters
+    else:
+        values = [parameters]
+
+    types = STEP_PARAMETERS[action]
+    defaults = STEP_DEFAULTS.get(action, ())
+    missing = len(types) - len(values)
+    if not 0 <= missing <= len(defaults):
+        raise ValueError("Step {} takes {} parameters, not {}".format(action, len(types), parameters))
+    values = list(values) + list(defaults[len(defaults) - missing:])
+    return tuple(parameter_type(value) for parameter_type, value in zip(types, values))
+
+
+def well_names(pattern, count, first=1):
+    """Return a generator of the names of count wells numbered from first, e.g. 'NNM-4{i:02d}' gives
+    NNM-401, NNM-402, ..."""
+    if count < 0:
+        raise ValueError("Can't drill {} wells".format(count))
+    try:
+        numbered = pattern.format(i=first) != pattern.format(i=first + 1)
+    except (KeyError, IndexError, ValueError):
+        numbered = False
+    if not numbered:
+        raise ValueError("Well name pattern {} doesn't number wells with {{i}}".format(pattern))
+    return (pattern.format(i=i) for i in range(first, first + count))
+
+
+def expand_step(step):
+    """Generate the single steps of a configuration step: a drill step for each well of a drill wells
+    step, or the step itself"""
+    (action, parameters), = step.items()
+    if action.lower() != 'drill wells':
+        yield step
+        return
+    count, pattern, well_type, duration, first = parse_parameters('drill wells', parameters)
+    for well_name in well_names(pattern, count, first):
+        yield {'drill': (well_name, well_type, duration)}
+
+
+def compile_step(step):
+    """Return a configuration step with its parameters parsed, e.g. {'drill': ('NNM-305', 'oil', 70)}"""
+    action, parameters = list(step.items())[0]
+    action = action.lower()
+    if action not in STEP_PARAMETERS:
+        raise ValueError("Unknown program step {}".format(action))
+    parameters = parse_parameters(action, parameters)
+    if action == 'drill wells':
+        count, pattern, _, _, first = parameters
+        well_names(pattern, count, first)
+    return {action: parameters}
+
+
 class Step:
     def __init__(self, program=None):
         self.asset = None
@@ -64,6 +211,10 @@ class Step:
     def execute(self):
         raise NotImplementedError
 
+    def config(self):
+        """Return the step as a configuration step"""
+        raise NotImplementedError
+
 
 # TODO refactor parameter setting
 
@@ -75,9 +226,7 @@ class StartStep(Step):
         self.location = None
 
         if parameters:
-            date_string, wellhead_platform_name = get_parameters(parameters)
-            self.start_date = datetime.strptime(date_string, "%d/%m/%Y")
-            self.location = wellhead_platform_name
+            self.start_date, self.location = parse_parameters('start', parameters)
 
     def execute(self):
         self.elapsed_time = 0
@@ -85,6 +234,9 @@ class StartStep(Step):
         self.program.start_date = self.start_date
         self.program.rig.location = self.program.asset.get_wellhead_platform_by_name(self.location)
 
+    def config(self):
+        return {'start': (self.start_date, self.location)}
+
     def __str__(self):
         return "START: {}, {}".format(self.start_date, self.location)
 
@@ -98,23 +250,17 @@ class DrillStep(Step):
         self.duration = None
 
         if parameters:
-            well_name, type, duration = get_parameters(parameters)
-            self.well_name = well_name
-            self.type = type
-            self.duration = int(duration)
+            self.well_name, self.type, self.duration = parse_parameters('drill', parameters)
 
     def execute(self):
-
         self.elapsed_time = self.program.elapsed_time
         well_start_date = self.program.start_date + timedelta(days=self.elapsed_time)
-
-        if self.type == 'oil':
-            well = OilWell(name=self.well_name, start_date=well_start_date, well_defaults=self.program.config)
-        else:
-            well = GasWell(name=self.well_name, start_date=well_start_date, well_defaults=self.program.config)
-        self.program.rig.location.add_well(well)
+        self.program.drill(self.well_name, self.type, well_start_date)
         self.program.elapsed_time += self.duration
 
+    def config(self):
+        return {'drill': (self.well_name, self.type, self.duration)}
+
     def __str__(self):
         return "DRILL: {}, {}, {}".format(self.well_name, self.type, self.duration)
 
@@ -127,15 +273,16 @@ class MoveStep(Step):
         self.duration = None
 
         if parameters:
-            wellhead_platform_name, duration = get_parameters(parameters)
-            self.destination = wellhead_platform_name
-            self.duration = int(duration)
+            self.destination, self.duration = parse_parameters('move', parameters)
 
     def execute(self):
         self.elapsed_time = self.program.elapsed_time
         self.program.rig.location = self.program.asset.get_wellhead_platform_by_name(self.destination)
         self.program.elapsed_time += self.duration
 
+    def config(self):
+        return {'move': (self.destination, self.duration)}
+
     def __str__(self):
         return "MOVE: {}, {}".format(self.destination, self.duration)
 
@@ -147,11 +294,14 @@ class StandbyStep(Step):
         self.duration = None
 
         if parameters:
-            self.duration = int(parameters)
+            self.duration, = parse_parameters('standby', parameters)
 
     def execute(self):
         self.elapsed_time = self.program.elapsed_time
         self.program.elapsed_time += self.duration
 
+    def config(self):
+        return {'standby': (self.duration,)}
+
     def __str__(self):
         return "STANDBY: {}".format(self.duration)
@@ -0,0 +1,143 @@
+"""Run the programs of several rigs together on one clock
+
+Each rig's next start or move step is an event in a heap ordered by time, so steps of all rigs run in
+date order. A wellhead platform holds one rig at a time: a rig that starts at, or moves to, a platform
+occupied by another rig waits until that rig moves away, starts again elsewhere or finishes its
+program, and its later steps are delayed by the wait. A moving rig leaves its platform when it sets
+off, so waiting rigs hold no platform and can't block each other. A drill step needs a free slot on the rig's platform.
+"""
+
+import heapq
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from palantir.step_table import MOVE, START, WELL_TYPES
+
+# A rig waiting for another rig to leave a wellhead platform
+Wait = namedtuple('Wait', ['rig', 'platform', 'date', 'days'])
+
+
+class Scheduler:
+    """Runs rig programs as discrete events on a shared clock
+
+    Programs are run from their compiled StepTables. The clock counts days from the earliest program
+    start date. Each event is a rig ready to run a start or move step; the drill steps that follow
+    it, up to the rig's next move, start on the days StepTable.drills gives them, delayed by any waits
+    so far. Events at the same time run in program order, so earlier programs win ties for a platform.
+    Waiting rigs queue per platform in order of when they became ready.
+        - programs: Programs, each beginning with a start step
+    """
+
+    def __init__(self, programs):
+        self.programs = [program for program in programs if len(program.compile())]
+        self.waits = []
+        self._events = []
+        self._occupant = {}
+        self._waiting = {}
+        self._reference = None
+
+        # per program: each step's start day with the end day appended, the rows of its start and move
+        # steps, the (well name, type, day) of the drill steps after each of those, and its platforms
+        self._days, self._travels, self._drills, self._platforms = [], [], [], []
+        for program in self.programs:
+            table = program.table
+            opcodes = table.columns['opcode']
+            if opcodes[0] != START:
+                raise ValueError("Program for {} doesn't begin with a start step".format(program.rig.name))
+            days, end = table.days()
+            travels = np.flatnonzero(np.isin(opcodes, (START, MOVE)))
+            drills = table.drills()
+            events = list(zip([table.wells[well] for well in drills.wells.tolist()],
+                              [WELL_TYPES[code] for code in drills.types.tolist()], drills.days.tolist()))
+            bounds = np.searchsorted(drills.rows, travels[1:]).tolist()
+            self._days.append(np.append(days, end).tolist())
+            self._travels.append(travels.tolist())
+            self._drills.append([events[first:last] for first, last in zip([0] + bounds, bounds + [len(events)])])
+            self._platforms.append([self._platform(program, name) for name in table.platforms])
+        if self.programs:
+            self._reference = min(days[0] for days in self._days)
+
+    @staticmethod
+    def _platform(program, name):
+        platform = program.asset.get_wellhead_platform_by_name(name)
+        if platform is None:
+            raise ValueError("Program for {} goes to unknown wellhead platform {}".format(program.rig.name, name))
+        return platform
+
+    def run(self):
+        """Run every program's steps in time order. Returns the Waits rigs spent queueing for platforms."""
+        self.waits = []
+        self._events = [(days[0] - self._reference, index, 0) for index, days in enumerate(self._days)]
+        heapq.heapify(self._events)
+        self._occupant = {}
+        self._waiting = {}
+        for program in self.programs:
+            program.reset()
+
+        while self._events:
+            now, index, travel = heapq.heappop(self._events)
+            self._travel(now, index, travel)
+
+        for platform, queue in self._waiting.items():
+            if queue:
+                rigs = ', '.join(self.programs[index].rig.name for _, index, _ in sorted(queue))
+                raise ValueError("Rigs {} never got wellhead platform {}".format(rigs, platform.name))
+        return self.waits
+
+    def _travel(self, now, index, travel):
+        """Run a program's start or move step, and its steps after that up to its next move"""
+        program = self.programs[index]
+        travels = self._travels[index]
+        if travel == len(travels):
+            # the rig has finished its program and leaves its platform
+            self._release(program, program.rig.location, now)
+            program.finish()
+            return
+
+        table = program.table
+        row = travels[travel]
+        platform = self._platforms[index][table.columns['target'][row]]
+        if platform is not program.rig.location:
+            # a move, or a later start step elsewhere, leaves the rig's platform
+            self._release(program, program.rig.location, now)
+        if self._occupant.get(platform, program) is not program:
+            heapq.heappush(self._waiting.setdefault(platform, []), (now, index, travel))
+            return
+        self._occupant[platform] = program
+
+        days = self._days[index]
+        delay = now - (days[row] - self._reference)
+        if table.columns['opcode'][row] == START:
+            program.start_date = datetime.fromordinal(days[row])
+        program.rig.location = platform
+
+        end = travels[travel + 1] if travel + 1 < len(travels) else len(days) - 1
+        for well_name, well_type, day in self._drills[index][travel]:
+            self._check_slot(program, well_name)
+            program.drill(well_name, well_type, datetime.fromordinal(day + delay))
+
+        program.elapsed_time = days[end] + delay - days[0]
+        heapq.heappush(self._events, (days[end] - self._reference + delay, index, travel + 1))
+
+    def _release(self, program, platform, now):
+        """Free a program's platform, handing it to the rig that has waited longest"""
+        if self._occupant.get(platform) is not program:
+            return
+        del self._occupant[platform]
+        queue = self._waiting.get(platform)
+        if queue:
+            ready, index, travel = heapq.heappop(queue)
+            self._occupant[platform] = self.programs[index]
+            if now > ready:
+                self.waits.append(Wait(self.programs[index].rig.name, platform.name,
+                                       datetime.fromordinal(self._reference + ready), now - ready))
+            heapq.heappush(self._events, (now, index, travel))
+
+    @staticmethod
+    def _check_slot(program, well_name):
+        location = program.rig.location
+        well = program.wells.get(well_name)
+        if (well is None or well.parent is not location) and location.remaining_slots < 1:
+            raise ValueError("No free slot on wellhead platform {} for well {}".format(location.name, well_name))
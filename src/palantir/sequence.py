@@ -0,0 +1,281 @@
+"""Optimise the order in which rigs drill their wells
+
+The drill steps of every rig program are reordered, and may be moved between rigs, by simulated
+annealing to maximise the discounted production of the drilled wells. Each well keeps its wellhead
+platform, so slot use doesn't change, and each rig keeps its start date and platform. Moves are
+inserted wherever a rig changes platform, and rigs share platforms by the rules of palantir.schedule.
+
+A candidate is scored without re-solving any declines: each well's daily base curve is weighted,
+discounted and summed once up front, and a well starting on day s then contributes
+d^s * P[horizon - s], where d is the daily discount factor and P the running sum of its discounted
+curve.
+"""
+
+import heapq
+import math
+import random
+import statistics
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+from palantir.profile_store import PHASES
+from palantir.program import DrillStep, MoveStep, StandbyStep, StartStep
+
+# Annual discount rate applied to production
+DEFAULT_DISCOUNT_RATE = 0.1
+
+# Value of a unit of each phase. Oil only by default.
+DEFAULT_WEIGHTS = {'qo': 1.0}
+
+# Candidate sequences tried by the annealing
+DEFAULT_ITERATIONS = 20000
+
+# The annealing temperature falls geometrically from its initial value to this fraction of it
+FINAL_TEMPERATURE = 1e-3
+
+Job = namedtuple('Job', ['well_name', 'type', 'duration', 'platform'])
+
+SequenceResult = namedtuple('SequenceResult', ['programs', 'score', 'initial_score', 'start_dates', 'evaluations'])
+
+
+class SequenceOptimiser:
+    """Searches for the drilling sequence of a forecast's rig programs that produces the most value
+
+    Score is the sum over drilled wells of their production, weighted by phase and discounted to the
+    config's start date, up to a horizon.
+        - manager: a Manager whose programs have been run
+        - weights: value of a unit of each phase, e.g. {'qo': 1, 'qg': 1 / 6000}
+        - discount_rate: annual discount rate
+        - horizon: days after the config's start date that production counts for, all of it if None
+        - move_duration: days a rig takes to move between platforms. If None, the median of the
+          programs' move steps, or 0 if they have none.
+        - reassign: whether wells may be moved from one rig to another
+    """
+
+    def __init__(self, manager, weights=None, discount_rate=DEFAULT_DISCOUNT_RATE, horizon=None,
+                 move_duration=None, reassign=True):
+        self.reference = manager.config['start date']
+        self.reassign = reassign
+        self.rigs = []
+        self.jobs = []
+        self.sequences = []
+        self._starts = []
+        self._standby = []
+
+        moves = []
+        for program in manager.programs:
+            if not program.steps:
+                continue
+            if not isinstance(program.steps[0], StartStep):
+                raise ValueError("Program for {} doesn't begin with a start step".format(program.rig.name))
+            start = program.steps[0]
+            location = start.location
+            sequence, standby = [], 0
+            for step in program.steps[1:]:
+                if isinstance(step, MoveStep):
+                    location = step.destination
+                    moves.append(step.duration)
+                elif isinstance(step, DrillStep):
+                    sequence.append(len(self.jobs))
+                    self.jobs.append(Job(step.well_name, step.type, step.duration, location))
+                elif isinstance(step, StandbyStep):
+                    standby += step.duration
+            self.rigs.append(program.rig.name)
+            self._starts.append((start.start_date, (start.start_date - self.reference).days, start.location))
+            self.sequences.append(sequence)
+            self._standby.append(standby)
+
+        if move_duration is None:
+            move_duration = statistics.median(moves) if moves else 0
+        self.move_duration = int(move_duration)
+        self._durations = [job.duration for job in self.jobs]
+        self._platforms = [job.platform for job in self.jobs]
+        self._value_table(manager, DEFAULT_WEIGHTS if weights is None else weights, discount_rate, horizon)
+
+    def _value_table(self, manager, weights, discount_rate, horizon):
+        """Running sums of each distinct well curve's weighted, discounted production"""
+        unknown = sorted(set(weights) - set(PHASES))
+        if unknown:
+            raise ValueError("Unknown phases {}, expected some of {}".format(', '.join(unknown), ', '.join(PHASES)))
+        wells = [manager.asset.get_well_by_name(job.well_name) for job in self.jobs]
+        keys = manager.profiles.cache.keys(wells)
+        di, _ = manager.profiles.solve(wells, keys=keys)
+
+        rows, curves = {}, []
+        for well, well_di, key in zip(wells, di, keys):
+            if key not in rows:
+                rows[key] = len(curves)
+                curves.append(manager.profiles.base_curves(well, well_di, key))
+        self._rows = np.array([rows[key] for key in keys], dtype=np.intp)
+
+        length = max((curve.shape[1] for curve in curves), default=0)
+        self._daily_discount = (1 + discount_rate) ** (-1 / 365)
+        discount = self._daily_discount ** np.arange(length)
+        self._running = np.zeros((len(curves), length + 1))
+        for row, curve in enumerate(curves):
+            value = sum(weight * curve[PHASES.index(phase)] for phase, weight in weights.items())
+            self._running[row, 1:curve.shape[1] + 1] = np.cumsum(value * discount[:curve.shape[1]])
+            self._running[row, curve.shape[1] + 1:] = self._running[row, curve.shape[1]]
+        self._length = length
+        self.horizon = horizon
+
+    def start_days(self, sequences=None):
+        """Return the day, counted from the config's start date, on which each job's well starts, for
+        per-rig sequences of job indices (the current ones if None)"""
+        sequences = self.sequences if sequences is None else sequences
+        starts = [0] * len(self.jobs)
+
+        # each rig's runs of consecutive jobs on one platform, beginning at its start platform
+        segments = []
+        for (_, _, start_platform), sequence in zip(self._starts, sequences):
+            rig_segments = [(start_platform, [])]
+            for job in sequence:
+                if self._platforms[job] != rig_segments[-1][0]:
+                    rig_segments.append((self._platforms[job], []))
+                rig_segments[-1][1].append(job)
+            segments.append(rig_segments)
+
+        events = [(offset, rig, 0) for rig, (_, offset, _) in enumerate(self._starts)]
+        heapq.heapify(events)
+        occupant, waiting, location = {}, {}, [None] * len(self.rigs)
+
+        def release(rig, now):
+            platform = location[rig]
+            if occupant.get(platform) != rig:
+                return
+            del occupant[platform]
+            queue = waiting.get(platform)
+            if queue:
+                _, next_rig, segment = heapq.heappop(queue)
+                occupant[platform] = next_rig
+                heapq.heappush(events, (now, next_rig, segment))
+
+        while events:
+            now, rig, segment = heapq.heappop(events)
+            rig_segments = segments[rig]
+            if segment == len(rig_segments):
+                release(rig, now)
+                continue
+            platform, jobs = rig_segments[segment]
+            if segment:
+                release(rig, now)
+            if occupant.get(platform, rig) != rig:
+                heapq.heappush(waiting.setdefault(platform, []), (now, rig, segment))
+                continue
+            occupant[platform] = rig
+            location[rig] = platform
+
+            t = now + self.move_duration if segment else now
+            for job in jobs:
+                starts[job] = t
+                t += self._durations[job]
+            if segment + 1 == len(rig_segments):
+                t += self._standby[rig]
+            heapq.heappush(events, (t, rig, segment + 1))
+
+        return starts
+
+    def score(self, sequences=None):
+        """Value of the drilled wells for per-rig sequences of job indices (the current ones if None)"""
+        if not self.jobs:
+            return 0.0
+        starts = np.array(self.start_days(sequences))
+        horizon = self._length if self.horizon is None else self.horizon
+        counted = np.clip(horizon - starts, 0, self._length)
+        return float((self._daily_discount ** starts * self._running[self._rows, counted]).sum())
+
+    def optimise(self, iterations=DEFAULT_ITERATIONS, temperature=None, seed=None):
+        """Improve the sequences by simulated annealing and return a SequenceResult of the best found
+
+        Each iteration moves one well to another position, on the same rig or (if reassign) another,
+        or swaps two wells, and keeps the change if it scores better, or worse with the Metropolis
+        probability at the current temperature.
+            - temperature: initial temperature, by default a hundredth of the mean value of a well
+            - seed: random seed
+        """
+        rng = random.Random(seed)
+        initial_score = current = best = self.score()
+        best_sequences = [list(sequence) for sequence in self.sequences]
+        if temperature is None:
+            temperature = 0.01 * abs(initial_score) / max(len(self.jobs), 1)
+        cooling = FINAL_TEMPERATURE ** (1 / max(iterations, 1))
+        rigs = range(len(self.sequences))
+
+        evaluations = 0
+        for _ in range(iterations if len(self.jobs) > 1 else 0):
+            undo = self._propose(rng, rigs)
+            if undo is None:
+                continue
+            candidate = self.score()
+            evaluations += 1
+            if candidate >= current or (temperature > 0 and
+                                        rng.random() < math.exp((candidate - current) / temperature)):
+                current = candidate
+                if current > best:
+                    best = current
+                    best_sequences = [list(sequence) for sequence in self.sequences]
+            else:
+                undo()
+            temperature *= cooling
+
+        self.sequences = best_sequences
+        starts = self.start_days()
+        return SequenceResult(self.programs(), best, initial_score,
+                              {job.well_name: self.reference + timedelta(days=day)
+                               for job, day in zip(self.jobs, starts)},
+                              evaluations)
+
+    def _propose(self, rng, rigs):
+        """Change the sequences in place, returning a function that undoes the change"""
+        sequences = self.sequences
+        busy = [rig for rig in rigs if sequences[rig]]
+        source = rng.choice(busy)
+        i = rng.randrange(len(sequences[source]))
+
+        if rng.random() < 0.5:
+            # swap with a well of a rig that has one
+            target = rng.choice(busy) if self.reassign else source
+            j = rng.randrange(len(sequences[target]))
+            if target == source and i == j:
+                return None
+            sequences[source][i], sequences[target][j] = sequences[target][j], sequences[source][i]
+
+            def undo():
+                sequences[source][i], sequences[target][j] = sequences[target][j], sequences[source][i]
+        else:
+            # move the well to any rig, which may have none
+            target = rng.choice(rigs) if self.reassign else source
+            job = sequences[source].pop(i)
+            j = rng.randrange(len(sequences[target]) + 1)
+            sequences[target].insert(j, job)
+
+            def undo():
+                sequences[target].pop(j)
+                sequences[source].insert(i, job)
+        return undo
+
+    def programs(self):
+        """The programs section of a config for the current sequences, with a move wherever a rig changes
+        platform and each rig's standby at the end of its program"""
+        programs = {}
+        for rig_name, (start_date, _, location), sequence, standby in zip(self.rigs, self._starts, self.sequences,
+                                                                          self._standby):
+            steps = [{'start': (start_date, location)}]
+            for job in (self.jobs[index] for index in sequence):
+                if job.platform != location:
+                    location = job.platform
+                    steps.append({'move': (location, self.move_duration)})
+                steps.append({'drill': (job.well_name, job.type, job.duration)})
+            if standby:
+                steps.append({'standby': (standby,)})
+            programs[rig_name] = {'program': steps}
+        return programs
+
+
+def optimise_sequence(manager, iterations=DEFAULT_ITERATIONS, seed=None, **options):
+    """Optimise the drilling sequence of a forecast's programs, see SequenceOptimiser. Returns a
+    SequenceResult whose programs can replace the config's, e.g.
+    Manager(config=dict(manager.config, programs=result.programs))"""
+    return SequenceOptimiser(manager, **options).optimise(iterations=iterations, seed=seed)
@@ -0,0 +1,124 @@
+"""Columnar storage for the steps of a rig program"""
+
+from collections import namedtuple
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+
+from palantir.program import STEP_PARAMETERS, parse_parameters, well_names
+from palantir.well_table import GAS, OIL
+
+# Step opcodes
+START = 0
+DRILL = 1
+MOVE = 2
+STANDBY = 3
+ACTIONS = ('start', 'drill', 'move', 'standby')
+
+WELL_TYPES = ('oil', 'gas')
+WELL_TYPE_CODES = {'oil': OIL, 'gas': GAS}
+
+# Column dtypes. target indexes the platforms table for start and move steps and the wells table for
+# drill steps, and is -1 for standby steps. date is the ordinal of a start step's date, 0 otherwise.
+COLUMNS = {
+    'opcode': np.int8,
+    'target': np.int32,
+    'well_type': np.int8,
+    'duration': np.int32,
+    'date': np.int32,
+}
+
+# The drill steps of a program: step rows, well indexes, type codes and start day ordinals
+Drills = namedtuple('Drills', ['rows', 'wells', 'types', 'days'])
+
+
+class StepTable:
+    """Structure-of-arrays form of a program's steps, compiled once from its configuration
+
+    Each step is one row of an opcode, a target index into the platform or well name table, a well
+    type code, a duration and a date ordinal, so a program's timings are worked out for every step
+    at once with cumulative sums rather than by running the steps one at a time. A drill wells step
+    becomes a drill row for each of its wells, whose names are generated into wells as the table is built.
+        - steps: configuration steps, e.g. {'drill': 'NNM-305, oil, 70'} or {'drill': ('NNM-305', 'oil', 70)}
+    """
+
+    def __init__(self, steps=()):
+        self.platforms = []
+        self.wells = []
+        self._platform_index = {}
+        rows = []
+
+        for step in steps:
+            action, parameters = next(iter(step.items()))
+            action = action.lower()
+            if action not in STEP_PARAMETERS:
+                raise ValueError("Unknown program step {}".format(action))
+            parameters = parse_parameters(action, parameters)
+
+            if action == 'drill':
+                well_name, type_name, duration = parameters
+                if type_name not in WELL_TYPE_CODES:
+                    raise ValueError("Well {} has unknown type {}".format(well_name, type_name))
+                rows.append((DRILL, len(self.wells), WELL_TYPE_CODES[type_name], duration, 0))
+                self.wells.append(well_name)
+            elif action == 'drill wells':
+                # one drill row per well, named from the pattern now rather than when the step is run
+                count, pattern, type_name, duration, first = parameters
+                if type_name not in WELL_TYPE_CODES:
+                    raise ValueError("Wells {} have unknown type {}".format(pattern, type_name))
+                rows.extend(zip(repeat(DRILL, count), range(len(self.wells), len(self.wells) + count),
+                                repeat(WELL_TYPE_CODES[type_name]), repeat(duration), repeat(0)))
+                self.wells.extend(well_names(pattern, count, first))
+            elif action == 'move':
+                destination, duration = parameters
+                rows.append((MOVE, self._platform(destination), -1, duration, 0))
+            elif action == 'start':
+                start_date, location = parameters
+                rows.append((START, self._platform(location), -1, 0, start_date.toordinal()))
+            else:
+                rows.append((STANDBY, -1, -1, parameters[0], 0))
+
+        columns = zip(*rows) if rows else [()] * len(COLUMNS)
+        self.columns = {name: np.array(values, dtype=COLUMNS[name]) for name, values in zip(COLUMNS, columns)}
+
+    def __len__(self):
+        return len(self.columns['opcode'])
+
+    def _platform(self, name):
+        if name not in self._platform_index:
+            self._platform_index[name] = len(self.platforms)
+            self.platforms.append(name)
+        return self._platform_index[name]
+
+    def step(self, row):
+        """Return a row as a configuration step, e.g. {'drill': ('NNM-305', 'oil', 70)}"""
+        opcode, target, well_type, duration, date = (int(self.columns[name][row]) for name in COLUMNS)
+        if opcode == START:
+            return {'start': (datetime.fromordinal(date), self.platforms[target])}
+        if opcode == DRILL:
+            return {'drill': (self.wells[target], WELL_TYPES[well_type], duration)}
+        if opcode == MOVE:
+            return {'move': (self.platforms[target], duration)}
+        return {'standby': (duration,)}
+
+    def _last_start(self):
+        """Row of the start step each row follows, 0 for rows before any start step"""
+        rows = np.where(self.columns['opcode'] == START, np.arange(len(self)), 0)
+        return np.maximum.accumulate(rows) if len(self) else rows
+
+    def days(self):
+        """Return the day ordinal on which each step begins, and the day the program ends"""
+        duration = self.columns['duration'].astype(np.int64)
+        finished = np.cumsum(duration)
+        last_start = self._last_start()
+        begun = finished - duration
+        days = self.columns['date'][last_start] + begun - begun[last_start]
+        end = days[-1] + duration[-1] if len(self) else 0
+        return days, end
+
+    def drills(self):
+        """Return the Drills of the program, with the day ordinal each well starts on"""
+        rows = np.flatnonzero(self.columns['opcode'] == DRILL)
+        days, _ = self.days()
+        return Drills(rows, self.columns['target'][rows], self.columns['well_type'][rows], days[rows])
@@ -0,0 +1,172 @@
+"""Columnar storage for the wells of an Asset"""
+
+import numpy as np
+
+DEFAULT_CAPACITY = 64
+
+# Well type codes
+OIL = 0
+GAS = 1
+FREE = -1
+
+# Column dtypes. Missing values are NaN for floats, NaT for dates and -1 for integers.
+COLUMNS = {
+    'type_code': np.int8,
+    'platform': np.int32,
+    'start_date': 'datetime64[s]',
+    'active_period': np.int64,
+    'choke': np.float64,
+    'is_new_well': np.bool_,
+    'initial_oil_rate': np.float64,
+    'oil_rate': np.float64,
+    'oil_cumulative': np.float64,
+    'ultimate_oil_recovery': np.float64,
+    'b_oil': np.float64,
+    'gas_oil_ratio_start': np.float64,
+    'gas_oil_ratio_end': np.float64,
+    'initial_gas_rate': np.float64,
+    'gas_rate': np.float64,
+    'gas_cumulative': np.float64,
+    'ultimate_gas_recovery': np.float64,
+    'b_gas': np.float64,
+    'gas_condensate_ratio': np.float64,
+    'condensate_rate': np.float64,
+    'condensate_cumulative': np.float64,
+}
+
+MISSING = {
+    np.dtype(np.int8): FREE,
+    np.dtype(np.int32): -1,
+    np.dtype(np.int64): -1,
+    np.dtype(np.float64): np.nan,
+    np.dtype('datetime64[s]'): np.datetime64('NaT'),
+    np.dtype(np.bool_): False,
+}
+
+
+class WellTable:
+    """Structure-of-arrays store of well attributes
+
+    Each attached well owns one row. Rows of detached wells are freed and reused. The Asset tree's
+    well nodes read and write their attributes here, and the profile engine reads whole columns.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.columns = {name: self._empty(name, capacity) for name in COLUMNS}
+        self.wells = [None] * capacity
+        self.platforms = []
+        self._platform_index = {}
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return int((self.columns['type_code'] != FREE).sum())
+
+    @staticmethod
+    def _empty(name, capacity):
+        dtype = np.dtype(COLUMNS[name])
+        return np.full(capacity, MISSING[dtype], dtype=dtype)
+
+    @property
+    def capacity(self):
+        return len(self.wells)
+
+    @property
+    def rows(self):
+        """Rows of every attached well"""
+        return np.flatnonzero(self.columns['type_code'] != FREE)
+
+    def _grow(self):
+        capacity = max(2 * self.capacity, 1)
+        for name, column in self.columns.items():
+            grown = self._empty(name, capacity)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.wells.extend([None] * (capacity - self.capacity))
+
+    def platform_code(self, wellhead_platform):
+        """Return the index of a wellhead platform in the platform lookup table"""
+        if wellhead_platform not in self._platform_index:
+            self._platform_index[wellhead_platform] = len(self.platforms)
+            self.platforms.append(wellhead_platform)
+        return self._platform_index[wellhead_platform]
+
+    def get(self, name, row):
+        value = self.columns[name][row]
+        if value.dtype.kind == 'b':
+            return bool(value)
+        if (value.dtype.kind == 'i' and value == MISSING[value.dtype]) or value != value:
+            return None
+        return value.item()
+
+    def set(self, name, row, value):
+        column = self.columns[name]
+        column[row] = MISSING[column.dtype] if value is None else value
+
+    def adopt(self, well, type_code):
+        """Give a well a row and move its attribute values into the table"""
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        values = well._values
+        well._table, well._row, well._values = self, row, None
+
+        self.wells[row] = well
+        self.columns['type_code'][row] = type_code
+        self.columns['platform'][row] = self.platform_code(well.parent)
+        for name, value in values.items():
+            setattr(well, name, value)
+        return row
+
+    def extend(self, type_codes, platforms, values):
+        """Allocate rows for many wells at once and fill their columns from arrays. Returns the rows,
+        which are bound to well nodes with Well.from_table_row.
+            - type_codes: OIL or GAS for each well
+            - platforms: the wellhead platform of each well
+            - values: dict of column name to an array of values, one per well
+        """
+        count = len(type_codes)
+        while len(self._free) < count:
+            self._grow()
+        start = len(self._free) - count
+        rows = np.array(self._free[start:][::-1], dtype=int)
+        del self._free[start:]
+
+        self.columns['type_code'][rows] = type_codes
+        self.columns['platform'][rows] = [self.platform_code(platform) for platform in platforms]
+        for name, column in values.items():
+            self.columns[name][rows] = column
+        return rows
+
+    def release(self, well):
+        """Free a well's row, moving its attribute values back onto the well"""
+        row = well._row
+        values = {name: getattr(well, name) for name in well.table_attributes()}
+        for name in self.columns:
+            self.columns[name][row] = MISSING[self.columns[name].dtype]
+        self.wells[row] = None
+        self._free.append(row)
+        well._table, well._row, well._values = None, None, values
+
+    def decline_inputs(self, rows):
+        """Return arrays of (qoi, b, uor, active_period) for the primary phase of the wells in rows"""
+        c = {name: column[rows] for name, column in self.columns.items()}
+        oil = c['type_code'] == OIL
+        new = c['is_new_well']
+        qoi = np.where(oil, np.where(new, c['initial_oil_rate'], c['oil_rate']), c['initial_gas_rate'])
+        b = np.where(oil, c['b_oil'], c['b_gas'])
+        uor = np.where(oil, c['ultimate_oil_recovery'] - np.where(new, 0, c['oil_cumulative']),
+                       c['ultimate_gas_recovery'])
+        return qoi.astype(float), b.astype(float), uor.astype(float), c['active_period'].astype(int)
+
+    def decline_keys(self, rows):
+        """Return the decline cache key of each well in rows: (type, qoi, b, uor, active period, GOR/CGR)"""
+        qoi, b, uor, active_period = self.decline_inputs(rows)
+        type_code = self.columns['type_code'][rows]
+        gor_start = self.columns['gas_oil_ratio_start'][rows]
+        gor_end = self.columns['gas_oil_ratio_end'][rows]
+        cgr = self.columns['gas_condensate_ratio'][rows]
+        return [('OilWell', q, b_, u, n, (gs, ge)) if t == OIL else ('GasWell', q, b_, u, n, r)
+                for t, q, b_, u, n, gs, ge, r in zip(type_code.tolist(), qoi.tolist(), b.tolist(), uor.tolist(),
+                                                     active_period.tolist(), gor_start.tolist(), gor_end.tolist(),
+                                                     cgr.tolist())]
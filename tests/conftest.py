@@ -7,6 +7,13 @@ from palantir import make_temp_file
 from palantir.manager import Manager
 
 
+@pytest.fixture(autouse=True)
+def config_cache_dir(tmp_path, monkeypatch):
+    """Keep compiled config caches out of the user's cache directory"""
+    monkeypatch.setenv('PALANTIR_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
 @pytest.fixture()
 def manager():
     data = '''
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+import pytest
+
+from palantir.cli import main
+
+CONFIGURATION = os.path.join(os.path.dirname(__file__), os.pardir, 'bin', 'configuration.yaml')
+
+
+class TestCommands:
+
+    def test_run(self, tmp_path):
+        output = tmp_path / 'field.csv'
+        assert main(['run', CONFIGURATION, '-o', str(output), '--time-step', 'monthly']) == 0
+        field = pd.read_csv(output, index_col='date', parse_dates=True)
+        assert list(field.columns) == ['qo', 'qg', 'qc']
+        assert field.index[0] == pd.Timestamp('2018-01-01')
+        assert field['qo'].iloc[0] > 0
+
+    def test_run_level(self, tmp_path):
+        output = tmp_path / 'whp.csv'
+        main(['run', CONFIGURATION, '-o', str(output), '--time-step', 'annual', '--level', 'whp'])
+        assert pd.read_csv(output, header=[0, 1], index_col=0).columns.get_level_values(1).tolist()[:2] == [
+            'aep', 'whp3']
+
+    def test_validate(self, capsys):
+        assert main(['validate', CONFIGURATION]) == 0
+        assert 'is valid' in capsys.readouterr().out
+
+    def test_validate_reports_problems(self, tmp_path, capsys):
+        with open(CONFIGURATION) as configuration:
+            text = configuration.read()
+        filepath = tmp_path / 'configuration.yaml'
+        filepath.write_text(text.replace('NNM-306, oil', 'NNM-3, water').replace('start: 01/01/2018, WHP3',
+                                                                                 'start: 01/01/2018, WHP9'))
+        assert main(['validate', str(filepath)]) == 1
+        out = capsys.readouterr().out
+        assert 'unknown wellhead platform WHP9' in out
+        assert 'unknown type water' in out
+        assert 'Well NNM-3 is defined 2 times' in out
+
+    def test_summarise(self, capsys):
+        assert main(['summarise', CONFIGURATION]) == 0
+        out = capsys.readouterr().out
+        assert 'Existing wells: 1 oil, 0 gas' in out
+        assert 'Rig1: 3 steps, 2 wells drilled over 140 days' in out
+
+    def test_missing_section(self, tmp_path, capsys):
+        filepath = tmp_path / 'configuration.yaml'
+        filepath.write_text('facilities: {}\n')
+        assert main(['summarise', str(filepath)]) == 1
+        assert "has no 'description' section" in capsys.readouterr().err
+
+    def test_version(self, capsys):
+        with pytest.raises(SystemExit):
+            main(['--version'])
+        assert capsys.readouterr().out.startswith('palantir ')
+
+
+class TestStartup:
+
+    def test_quick_commands_skip_heavy_imports(self):
+        script = textwrap.dedent('''
+            import sys
+            from palantir.cli import main
+            main(['validate', {!r}])
+            main(['summarise', {!r}])
+            heavy = {{'numpy', 'pandas', 'scipy', 'anytree', 'pkg_resources'}} & set(sys.modules)
+            print('heavy imports:', ','.join(sorted(heavy)))
+        ''').format(CONFIGURATION, CONFIGURATION)
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        assert result.stdout.splitlines()[-1] == 'heavy imports: '
@@ -0,0 +1,127 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from palantir import make_temp_file
+from palantir.configuration_manager import DEFAULT_SLOTS, ConfigurationManager, validate_config, well_slots
+from palantir.program import compile_step
+
+data = '''
+description:
+    start date: 01/01/2018
+defaults:
+    well:
+        choke: 100
+        active period: 3650
+        oil well:
+            ultimate oil recovery: 8000000
+            initial oil rate: 5000
+            gas oil ratio: [2000, 4000]
+            b oil: 1.0
+        gas well:
+            ultimate gas recovery: 100000000
+            initial gas rate: 10000000
+            gas condensate ratio: 3.1415
+            b gas: 0.5
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            AEP:
+programs:
+    Rig1:
+        program:
+            - start: 01/01/2018, AEP
+            - drill: NNM-305, oil, 70
+            - move: WHP4, 30
+            - standby: 100
+'''
+
+
+@pytest.fixture()
+def configuration_file():
+    configuration_file = make_temp_file(data)
+    yield configuration_file.name
+    os.remove(configuration_file.name)
+
+
+class TestConfigurationManager:
+
+    def test_compiled_program_steps(self, configuration_file):
+        config = ConfigurationManager(configuration_file).config
+        assert config['start date'] == datetime(2018, 1, 1)
+        assert config['programs']['Rig1']['program'] == [
+            {'start': (datetime(2018, 1, 1), 'AEP')},
+            {'drill': ('NNM-305', 'oil', 70)},
+            {'move': ('WHP4', 30)},
+            {'standby': (100,)},
+        ]
+
+    def test_cache_written_and_read(self, configuration_file, config_cache_dir):
+        config = ConfigurationManager(configuration_file).config
+        entries = os.listdir(config_cache_dir)
+        assert len(entries) == 1
+
+        with open(os.path.join(config_cache_dir, entries[0]), 'wb') as cache_file:
+            cache_file.write(b'not a pickle')
+        assert ConfigurationManager(configuration_file).config == config
+
+    def test_cache_hit_skips_parsing(self, configuration_file, monkeypatch):
+        expected = ConfigurationManager(configuration_file).config
+        monkeypatch.setattr(ConfigurationManager, 'compile', staticmethod(lambda cfg: pytest.fail('parsed again')))
+        assert ConfigurationManager(configuration_file).config == expected
+
+    def test_changed_file_misses_cache(self, configuration_file, config_cache_dir):
+        ConfigurationManager(configuration_file)
+        with open(configuration_file, 'a') as f:
+            f.write('    Rig2:\n        program:\n            - standby: 10\n')
+        config = ConfigurationManager(configuration_file).config
+        assert 'Rig2' in config['programs']
+        assert len(os.listdir(config_cache_dir)) == 2
+
+    def test_no_cache(self, configuration_file, config_cache_dir):
+        ConfigurationManager(configuration_file, use_cache=False)
+        assert not os.path.exists(config_cache_dir)
+
+    def test_unknown_step(self):
+        with pytest.raises(ValueError):
+            compile_step({'drilll': 'NNM-305, oil, 70'})
+
+    def test_wrong_parameter_count(self):
+        with pytest.raises(ValueError):
+            compile_step({'drill': 'NNM-305, 70'})
+
+    def test_drill_wells_step(self):
+        assert compile_step({'drill wells': '3, NNM-4{i:02d}, oil, 70'}) == \
+            {'drill wells': (3, 'NNM-4{i:02d}', 'oil', 70, 1)}
+        assert compile_step({'drill wells': '3, NNM-4{i:02d}, oil, 70, 5'})['drill wells'][-1] == 5
+
+    def test_drill_wells_pattern_not_numbered(self):
+        with pytest.raises(ValueError, match="doesn't number wells"):
+            compile_step({'drill wells': '3, NNM-401, oil, 70'})
+
+    def test_well_slots(self, configuration_file):
+        config = ConfigurationManager(configuration_file).config
+        assert well_slots(config, 'AEP') == DEFAULT_SLOTS
+
+        with open(configuration_file) as f:
+            text = f.read()
+        with open(configuration_file, 'w') as f:
+            f.write(text.replace('facilities:\n', 'facilities:\n    well slots:\n        AEP: 12\n')
+                    .replace('defaults:\n', 'defaults:\n    wellhead platform:\n        well slots: 4\n'))
+        config = ConfigurationManager(configuration_file).config
+        assert well_slots(config, 'AEP') == 12
+        assert well_slots(config, 'WHP4') == 4
+
+
+class TestValidateConfig:
+
+    def test_platform_overflow(self, configuration_file):
+        config = ConfigurationManager(configuration_file).config
+        config['pexes']['Nene']['WHP4'] = None
+        config['programs']['Rig1']['program'].append(compile_step({'drill wells': '6, NNM-4{i:02d}, oil, 70'}))
+        assert validate_config(config) == []
+
+        config['programs']['Rig1']['program'].append(compile_step({'drill': 'NNM-407, oil, 70'}))
+        assert validate_config(config) == ["Wellhead platform WHP4 has 6 well slots for 7 wells"]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from palantir import make_temp_file
+from palantir.ensemble import Ensemble, QuantileAccumulator, perturb_asset, perturb_config
+from palantir.manager import Manager
+
+DATA = """
+description:
+    start date: 01/01/2018
+defaults:
+    well:
+        choke: 100
+        active period: 3650 # days
+        oil well:
+            ultimate oil recovery: 8000000
+            initial oil rate: 5000
+            gas oil ratio: [2000, 4000]
+            b oil: 1.0
+        gas well:
+            ultimate gas recovery: 100000000
+            initial gas rate: 10000000
+            gas condensate ratio: 3.1415
+            b gas: 0.5
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            AEP:
+                NNM-3:
+                    type: oil
+                    oil rate: 5000
+                    oil cumulative: 0
+                    gas oil ratio: [2000, 4000]
+            WHP3:
+programs:
+    Rig1:
+        program:
+            - start: 01/01/2018, WHP3
+            - drill: NNM-305, oil, 70
+            - drill: NNM-306, oil, 70
+"""
+
+
+class Constant:
+    """A degenerate distribution"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def rvs(self, size=None, random_state=None):
+        return np.full(size, self.value)
+
+
+@pytest.fixture()
+def configuration_file():
+    configuration_file = make_temp_file(DATA)
+    yield configuration_file.name
+    configuration_file.close()
+
+
+class TestQuantileAccumulator:
+
+    def test_matches_percentiles(self):
+        data = np.random.default_rng(1).normal(10, 1, size=(500, 20, 3))
+        accumulator = QuantileAccumulator(0.5)
+        for values in data:
+            accumulator.add(values)
+        assert np.allclose(accumulator.value, np.percentile(data, 50, axis=0), atol=0.15)
+
+    def test_exact_below_five_realisations(self):
+        accumulator = QuantileAccumulator(0.5)
+        for value in [1, 3, 2]:
+            accumulator.add(np.full((4, 3), value))
+        assert np.all(accumulator.value == 2)
+
+
+class TestEnsemble:
+
+    def test_unknown_parameter(self, configuration_file):
+        with pytest.raises(ValueError):
+            Ensemble(configuration_file, distributions={'choke': Constant(1)})
+
+    def test_perturb_config(self, configuration_file):
+        config = Ensemble(configuration_file).config
+        perturbed = perturb_config(config, {'ultimate oil recovery': 0.5, 'drill duration': 2})
+        assert perturbed['ultimate oil recovery'] == 4000000
+        assert perturbed['programs']['Rig1']['program'][1] == {'drill': ('NNM-305', 'oil', 140)}
+        assert config['ultimate oil recovery'] == 8000000
+
+    def test_perturb_asset_scales_well_values(self, configuration_file):
+        ensemble = Ensemble(configuration_file)
+        well = ensemble.asset.get_well_by_name('NNM-3')
+        well.ultimate_oil_recovery, well.b_oil = 6000000, 0.7
+        factors = {'ultimate oil recovery': 0.5}
+        perturbed = perturb_asset(ensemble.asset, perturb_config(ensemble.config, factors), factors)
+        perturbed_well = perturbed.get_well_by_name('NNM-3')
+        assert perturbed_well.ultimate_oil_recovery == 3000000
+        assert perturbed_well.b_oil == 0.7
+        assert well.ultimate_oil_recovery == 6000000
+
+    def test_unperturbed_matches_manager(self, configuration_file):
+        ensemble = Ensemble(configuration_file, distributions={'b oil': Constant(1.0)})
+        percentiles = ensemble.run(6, processes=1)
+        expected = Manager(configuration_file).profiles.field_production
+        for name in ('P10', 'P50', 'P90'):
+            assert np.allclose(percentiles[name].values, expected.values)
+
+    def test_percentiles_ordered(self, configuration_file):
+        distributions = {
+            'ultimate oil recovery': stats.uniform(0.8, 0.4),
+            'drill duration': stats.uniform(0.5, 1.0),
+        }
+        percentiles = Ensemble(configuration_file, distributions=distributions).run(12, processes=2, seed=0)
+        total = {name: frame.qo.sum() for name, frame in percentiles.items()}
+        assert total['P90'] < total['P50'] < total['P10']
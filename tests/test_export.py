@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from palantir.export import read_parquet, to_arrow, write_parquet
+from palantir.profile_store import ProfileStore
+
+pa = pytest.importorskip('pyarrow')
+
+
+class TestArrow:
+
+    def test_matches_curves(self, manager):
+        table = to_arrow(manager.profiles, dtype=np.float64)
+        curves = manager.profiles.curves
+        assert table.num_rows == len(curves)
+        assert table.column_names == ['date', 'asset', 'pex', 'whp', 'well', 'qo', 'qg', 'qc']
+        np.testing.assert_array_equal(table['qo'].to_numpy(), curves['qo'].to_numpy())
+        assert table['well'].to_pylist() == list(curves['well'])
+        assert table['date'].to_pylist()[0] == curves.index[0].date()
+
+    def test_dictionary_encoded_float32(self, manager):
+        table = to_arrow(manager.profiles)
+        assert pa.types.is_dictionary(table.schema.field('pex').type)
+        assert table.schema.field('qo').type == pa.float32()
+
+    def test_rate_columns_not_copied(self, manager):
+        # the phase columns wrap consecutive rows of one phase-major buffer
+        table = to_arrow(manager.profiles)
+        addresses = [table[phase].chunk(0).buffers()[1].address for phase in ('qo', 'qg', 'qc')]
+        assert np.diff(addresses).tolist() == [4 * table.num_rows] * 2
+
+    def test_date_window(self, manager):
+        table = to_arrow(manager.profiles, start=datetime(2019, 1, 1), end=datetime(2019, 2, 1))
+        dates = set(table['date'].to_pylist())
+        assert min(dates) == datetime(2019, 1, 1).date()
+        assert max(dates) == datetime(2019, 1, 31).date()
+
+    def test_monthly_dates(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 15), time_step='monthly')
+        store.append(np.ones((3, 3)), 1, ('mxii', 'nene', 'aep', 'nnm-3'))
+        table = to_arrow(store)
+        assert table['date'].to_pylist() == [datetime(2018, 2, 1).date(), datetime(2018, 3, 1).date(),
+                                             datetime(2018, 4, 1).date()]
+
+    def test_empty_store(self):
+        assert to_arrow(ProfileStore()).num_rows == 0
+
+
+class TestParquet:
+
+    def test_partitioned_round_trip(self, manager, tmp_path):
+        write_parquet(manager.profiles, tmp_path / 'profiles')
+        assert (tmp_path / 'profiles' / 'pex=nene' / 'whp=aep').is_dir()
+        table = read_parquet(tmp_path / 'profiles')
+        assert table.num_rows == len(manager.profiles.curves)
+
+    def test_read_partition_and_dates(self, manager, tmp_path):
+        write_parquet(manager.profiles, tmp_path / 'profiles')
+        table = read_parquet(tmp_path / 'profiles', whp='AEP', start=datetime(2019, 1, 1), end=datetime(2019, 1, 2))
+        assert sorted(table['well'].to_pylist()) == ['nnm-3', 'nnm-5', 'nnm-6']
+        curves = manager.profiles.curves
+        expected = curves[(curves['whp'] == 'aep')].loc['2019-01-01', 'qo'].sum()
+        assert np.isclose(sum(table['qo'].to_pylist()), expected, rtol=1e-6)
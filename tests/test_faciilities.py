@@ -1,8 +1,9 @@
 from datetime import datetime
 
 import pytest
+from anytree import findall
 
-from palantir.facilities import Asset, OilWell, Pex, WellHeadPlatform
+from palantir.facilities import Asset, OilWell, Pex, Well, WellHeadPlatform
 
 
 class TestAsset:
@@ -169,3 +170,78 @@ class TestGasWell:
         assert well.initial_gas_rate == 10000000
         assert well.gas_condensate_ratio == 3.1415
         assert well.b_gas == 0.5
+
+
+class TestAssetIndexes:
+    """Ensure the name and type indexes follow the tree as nodes attach and detach"""
+
+    def test_index_matches_tree(self, manager):
+        asset = manager.asset
+        assert set(asset.wells) == set(findall(asset, filter_=lambda node: isinstance(node, Well)))
+        assert set(asset.wellhead_platforms) == set(
+            findall(asset, filter_=lambda node: isinstance(node, WellHeadPlatform)))
+
+    def test_attach_subtree(self, manager):
+        pex = Pex(name='Djeno')
+        whp = WellHeadPlatform(name='DJ1')
+        pex.add_wellhead_platform(whp)
+        well = OilWell(name='DJ-1', start_date=datetime(2018, 1, 1), well_defaults=manager.config)
+        whp.add_well(well)
+        manager.asset.add_pex(pex)
+        assert manager.asset.get_wellhead_platform_by_name('DJ1') is whp
+        assert manager.asset.get_well_by_name('DJ-1') is well
+
+    def test_detach(self, manager):
+        well = manager.asset.get_well_by_name('NNM-3')
+        well_count = len(manager.asset.wells)
+        well.parent = None
+        assert manager.asset.get_well_by_name('NNM-3') is None
+        assert len(manager.asset.wells) == well_count - 1
+
+    def test_move_between_platforms(self, manager):
+        well = manager.asset.get_well_by_name('NNM-3')
+        manager.asset.get_wellhead_platform_by_name('WHP4').add_well(well)
+        assert manager.asset.get_well_by_name('NNM-3') is well
+        assert well.whp.name == 'WHP4'
+
+
+class TestSlotAccounting:
+    """Ensure slot counts and the platform capacity index follow wells attaching and detaching"""
+
+    def test_well_count(self, manager):
+        whp = manager.asset.get_wellhead_platform_by_name('AEP')
+        assert whp.well_count == len(whp.wells) == 3
+        manager.asset.get_well_by_name('NNM-3').parent = None
+        assert whp.well_count == 2
+        assert whp.remaining_slots == 4
+
+    def test_platforms_with_capacity(self, manager):
+        # AEP has 3 wells, WHP4 6, WHP3 6 and LTC1 3
+        names = [whp.name for whp in manager.asset.platforms_with_capacity()]
+        assert sorted(names) == ['AEP', 'LTC1']
+        assert manager.asset.platforms_with_capacity(slots=4) == []
+
+    def test_index_follows_changes(self, manager):
+        asset = manager.asset
+        whp4 = asset.get_wellhead_platform_by_name('WHP4')
+        asset.get_well_by_name('NNM-401').parent = None
+        asset.get_well_by_name('NNM-402').parent = None
+        assert whp4 in asset.platforms_with_capacity(slots=2)
+        whp4.well_slots = 10
+        assert asset.find_platform_with_capacity() is whp4
+        assert asset.platforms_with_capacity(slots=6) == [whp4]
+
+    def test_find_platform_near(self, manager):
+        asset = manager.asset
+        aep = asset.get_wellhead_platform_by_name('AEP')
+        whp3 = asset.get_wellhead_platform_by_name('WHP3')
+        assert asset.find_platform_with_capacity(near=aep) is aep
+        assert asset.find_platform_with_capacity(near=whp3) is aep
+        assert asset.find_platform_with_capacity(slots=5) is None
+
+    def test_find_platform_prefers_same_pex(self, manager):
+        asset = manager.asset
+        ltc1 = asset.get_wellhead_platform_by_name('LTC1')
+        ltc1.well_slots = 10
+        assert asset.find_platform_with_capacity() is ltc1
+        assert asset.find_platform_with_capacity(near=asset.get_wellhead_platform_by_name('WHP3')).name == 'AEP'
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from palantir.history_match import fit_decline, history_arrays, match_history
+from palantir.manager import Manager
+from palantir.production_history import read_production_history
+from palantir.profile import _decline
+
+# (qoi, di, b) of the synthetic history of each well
+WELLS = {
+    ('NNM-3', 'oil'): (4000, 0.002, 0.8),
+    ('NNM-6', 'oil'): (3000, 0.001, 0.0),
+    ('LJM-11', 'gas'): (40, 0.0015, 0.5),
+}
+
+
+def arps(qoi, di, b, t):
+    return _decline(di, t, qoi, b)
+
+
+@pytest.fixture()
+def history_csv(tmp_path):
+    dates = pd.date_range('2016-01-01', '2017-12-31')
+    t = np.arange(len(dates))
+    frame = pd.DataFrame({'Date': dates.strftime('%d/%m/%Y')})
+    for (well, phase), (qoi, di, b) in WELLS.items():
+        frame['{} {}'.format(well, phase.capitalize())] = arps(qoi, di, b, t)
+    frame.loc[100:110, 'NNM-3 Oil'] = 0  # shut in
+    filepath = tmp_path / 'history.csv'
+    frame.to_csv(filepath, index=False)
+    return str(filepath)
+
+
+class TestFitDecline:
+
+    def test_recovers_parameters(self):
+        rng = np.random.default_rng(1)
+        qoi, di, b = rng.uniform(100, 5000, 50), rng.uniform(5e-4, 5e-3, 50), rng.uniform(0, 1.5, 50)
+        t = np.tile(np.arange(365.0), (50, 1))
+        fit = fit_decline(t, arps(qoi[:, None], di[:, None], b[:, None], t), chunk_size=16)
+        assert fit.converged.all()
+        assert np.allclose(fit.qoi, qoi, rtol=1e-4)
+        assert np.allclose(fit.di, di, rtol=1e-3)
+        assert np.allclose(fit.b, b, atol=1e-3)
+
+    def test_ignores_shut_in_days(self):
+        t = np.arange(365.0)
+        q = arps(1000, 0.002, 0.5, t)
+        q[50:60] = 0
+        q[70] = np.nan
+        fit = fit_decline(t, q)
+        assert np.isclose(fit.b[0], 0.5, atol=1e-3)
+
+    def test_too_little_history(self):
+        fit = fit_decline(np.arange(5.0), [100, 0, 0, 90, 0])
+        assert not fit.converged[0]
+
+
+class TestMatchHistory:
+
+    def test_history_arrays_start_at_first_production(self):
+        history = pd.DataFrame({('w', 'oil'): [0, 0, 5, 4]}, index=pd.date_range('2018-01-01', periods=4))
+        t, q, end = history_arrays(history, [('w', 'oil')])
+        assert t[0].tolist() == [-2, -1, 0, 1]
+        assert q[0].tolist() == [0, 0, 5, 4]
+        assert end.tolist() == [2]
+
+    def test_writes_fitted_parameters(self, manager, history_csv):
+        fits = match_history(manager.asset, history_csv)
+        assert list(fits.index) == ['NNM-3', 'NNM-6', 'LJM-11']
+        assert fits['converged'].all()
+
+        qoi, di, b = WELLS['NNM-3', 'oil']
+        well = manager.asset.get_well_by_name('NNM-3')
+        assert np.isclose(well.b_oil, b, atol=1e-3)
+        assert np.isclose(well.oil_rate, arps(qoi, di, b, 731), rtol=1e-4)
+        gas_well = manager.asset.get_well_by_name('LJM-11')
+        assert np.isclose(gas_well.initial_gas_rate, arps(40, 0.0015, 0.5, 731) * 1e6, rtol=1e-4)
+
+    def test_forecast_continues_fitted_decline(self, manager, history_csv):
+        with pytest.warns(RuntimeWarning):
+            matched = Manager(config=manager.config, history=read_production_history(history_csv))
+        qoi, di, b = WELLS['NNM-3', 'oil']
+        curves = matched.profiles.curves
+        qo = curves[curves['well'] == 'nnm-3']['qo'].to_numpy()
+        assert np.allclose(qo[:365], arps(qoi, di, b, np.arange(731, 731 + 365)), rtol=1e-4)
+        assert matched.asset.get_well_by_name('NNM-5').b_oil == manager.config['b oil']
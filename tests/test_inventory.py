@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from palantir.facilities import GasWell, OilWell
+from palantir.inventory import add_inventory, read_inventory
+from palantir.manager import Manager, build_asset
+
+
+def inventory_of(asset):
+    """An inventory table of the existing wells of an asset"""
+    rows = []
+    for well in asset.wells:
+        if well.is_new_well:
+            continue
+        row = {'pex': well.pex.name, 'whp': well.whp.name, 'well': well.name}
+        if isinstance(well, OilWell):
+            row.update({'type': 'oil', 'oil_rate': well.oil_rate, 'oil_cumulative': well.oil_cumulative,
+                        'gas_oil_ratio_start': well.gas_oil_ratio[0], 'gas_oil_ratio_end': well.gas_oil_ratio[1]})
+        else:
+            row.update({'type': 'gas', 'gas_rate': well.gas_rate, 'gas_cumulative': well.gas_cumulative,
+                        'condensate_rate': well.condensate_rate,
+                        'condensate_cumulative': well.condensate_cumulative})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class TestInventory:
+
+    def test_builds_same_wells_as_config(self, manager):
+        config = dict(manager.config, pexes={})
+        asset = build_asset(config, inventory=inventory_of(manager.asset))
+        expected = {well.name: well for well in manager.asset.wells if not well.is_new_well}
+        assert sorted(well.name for well in asset.wells) == sorted(expected)
+        for well in asset.wells:
+            original = expected[well.name]
+            assert type(well) is type(original)
+            assert well.whp.name == original.whp.name
+            assert well.start_date == original.start_date
+            assert well.is_new_well is False
+            for name in type(well).table_attributes():
+                assert getattr(well, name) == getattr(original, name)
+
+    def test_csv_forecast_matches_config(self, manager, tmp_path):
+        filepath = tmp_path / 'inventory.csv'
+        inventory_of(manager.asset).to_csv(filepath, index=False)
+        config = dict(manager.config, pexes={})
+        with pytest.warns(RuntimeWarning):
+            from_inventory = Manager(config=config, inventory=str(filepath))
+        pd.testing.assert_frame_equal(from_inventory.profiles.field_production, manager.profiles.field_production)
+
+    def test_slots_counted(self, manager):
+        asset = build_asset(dict(manager.config, pexes={}), inventory=inventory_of(manager.asset))
+        assert asset.get_wellhead_platform_by_name('AEP').well_count == 3
+
+    def test_adds_to_existing_platforms(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Nene', 'whp': 'AEP', 'well': 'NNM-7', 'type': 'Oil',
+                                   'oil rate': 100, 'oil cumulative': 1000}])
+        asset = build_asset(manager.config, inventory=inventory)
+        well = asset.get_well_by_name('NNM-7')
+        assert well.whp is asset.get_wellhead_platform_by_name('AEP')
+        assert well.gas_oil_ratio == manager.config['gas oil ratio']
+        assert well.oil_rate == 100
+
+    def test_gas_well_defaults(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Litchendjili', 'whp': 'LTC2', 'well': 'LJM-21', 'type': 'gas'}])
+        asset = build_asset(dict(manager.config, pexes={}), inventory=inventory)
+        well = asset.get_well_by_name('LJM-21')
+        assert isinstance(well, GasWell)
+        assert well.gas_condensate_ratio == manager.config['gas condensate ratio']
+        assert well.gas_rate is None
+
+    def test_missing_column(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Nene', 'well': 'NNM-7', 'type': 'oil'}])
+        with pytest.raises(ValueError):
+            build_asset(manager.config, inventory=inventory)
+
+    def test_missing_oil_rate(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Nene', 'whp': 'AEP', 'well': 'NNM-7', 'type': 'oil'}])
+        with pytest.raises(ValueError):
+            build_asset(manager.config, inventory=inventory)
+
+    def test_unknown_type(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Nene', 'whp': 'AEP', 'well': 'NNM-7', 'type': 'water'}])
+        with pytest.raises(ValueError):
+            build_asset(manager.config, inventory=inventory)
+
+    def test_duplicate_well(self, manager):
+        inventory = pd.DataFrame([{'pex': 'Nene', 'whp': 'AEP', 'well': 'NNM-3', 'type': 'oil',
+                                   'oil_rate': 1, 'oil_cumulative': 1}])
+        with pytest.raises(ValueError):
+            add_inventory(build_asset(manager.config), inventory)
+
+    def test_parquet(self, manager, tmp_path):
+        pytest.importorskip('pyarrow')
+        filepath = tmp_path / 'inventory.parquet'
+        inventory_of(manager.asset).to_parquet(filepath)
+        assert len(read_inventory(filepath)) == len(inventory_of(manager.asset))
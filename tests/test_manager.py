@@ -1,4 +1,9 @@
+import numpy as np
+import pytest
+
+from palantir import make_temp_file
 from palantir.facilities import Asset
+from palantir.manager import Manager
 from palantir.program import Program
 
 class TestInitialise:
@@ -17,3 +22,104 @@ class TestDefaults:
 
     def test_choke(self, manager):
         assert manager.config['choke'] == 100
+
+
+class TestIncrementalReforecast:
+    """Ensure edits re-forecast only affected wells and match a freshly built forecast"""
+
+    header = '''
+description:
+    start date: 01/01/2018
+defaults:
+    well:
+        choke: 100
+        active period: 3650 # days
+        oil well:
+            ultimate oil recovery: 8000000
+            initial oil rate: 5000
+            gas oil ratio: [2000, 4000]
+            b oil: 1.0
+        gas well:
+            ultimate gas recovery: 100000000
+            initial gas rate: 10000000
+            gas condensate ratio: 3.1415
+            b gas: 0.5
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            AEP:
+                NNM-3:
+                    type: oil
+                    oil rate: {oil_rate}
+                    oil cumulative: 0
+                    gas oil ratio: [2000, 4000]
+            WHP3:
+            WHP4:
+programs:
+    Rig1:
+        program:
+'''
+
+    def build(self, steps, oil_rate=5000):
+        data = self.header.format(oil_rate=oil_rate) + ''.join('            - {}\n'.format(step) for step in steps)
+        configuration_file = make_temp_file(data)
+        return Manager(configuration_file.name)
+
+    steps = ['start: 01/01/2018, WHP3', 'drill: NNM-305, oil, 70', 'move: WHP4, 30', 'drill: NNM-405, oil, 70']
+
+    def assert_same_forecast(self, manager, expected):
+        actual = manager.profiles.well_production
+        expected = expected.profiles.well_production
+        assert sorted(actual.columns) == sorted(expected.columns)
+        assert actual.index.equals(expected.index)
+        assert np.allclose(actual[expected.columns].values, expected.values)
+        field = expected.T.groupby(level=0).sum().T[['qo', 'qg', 'qc']]
+        assert np.allclose(manager.profiles.field_production.values, field.values)
+
+    def test_update_well(self):
+        manager = self.build(self.steps)
+        changed = manager.update_well('NNM-3', oil_rate=3000)
+        assert changed == ['NNM-3']
+        self.assert_same_forecast(manager, self.build(self.steps, oil_rate=3000))
+
+    def test_unknown_parameter(self):
+        manager = self.build(self.steps)
+        with pytest.raises(ValueError):
+            manager.update_well('NNM-3', flow_rate=3000)
+
+    def test_set_step_duration(self):
+        manager = self.build(self.steps)
+        changed = manager.set_step_duration('Rig1', 2, 60)
+        assert changed == ['NNM-405']
+        expected = self.build(['start: 01/01/2018, WHP3', 'drill: NNM-305, oil, 70', 'move: WHP4, 60',
+                               'drill: NNM-405, oil, 70'])
+        self.assert_same_forecast(manager, expected)
+
+    def test_remove_step(self):
+        manager = self.build(self.steps)
+        changed = manager.remove_step('Rig1', 1)
+        assert sorted(changed) == ['NNM-305', 'NNM-405']
+        assert manager.asset.get_well_by_name('NNM-305') is None
+        self.assert_same_forecast(manager, self.build(['start: 01/01/2018, WHP3', 'move: WHP4, 30',
+                                                       'drill: NNM-405, oil, 70']))
+
+    def test_insert_step(self):
+        manager = self.build(self.steps)
+        changed = manager.insert_step('Rig1', 2, {'drill': 'NNM-306, gas, 70'})
+        assert sorted(changed) == ['NNM-306', 'NNM-405']
+        self.assert_same_forecast(manager, self.build(['start: 01/01/2018, WHP3', 'drill: NNM-305, oil, 70',
+                                                       'drill: NNM-306, gas, 70', 'move: WHP4, 30',
+                                                       'drill: NNM-405, oil, 70']))
+
+    def test_failed_edit_is_undone(self):
+        manager = self.build(self.steps)
+        manager.asset.get_wellhead_platform_by_name('WHP4').well_slots = 1
+        with pytest.raises(ValueError, match='No free slot'):
+            manager.insert_step('Rig1', 4, {'drill': 'NNM-406, oil, 70'})
+        assert [str(step) for step in manager.get_program('Rig1').steps][-1] == 'DRILL: NNM-405, oil, 70'
+        assert manager.asset.get_well_by_name('NNM-406') is None
+        self.assert_same_forecast(manager, self.build(self.steps))
+
+        changed = manager.set_step_duration('Rig1', 2, 60)
+        assert changed == ['NNM-405']
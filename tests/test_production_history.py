@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from palantir.cli import main
+from palantir.configuration_manager import ConfigurationManager
+from palantir.manager import build_asset
+from palantir.production_history import facilities_config, summarise_production
+
+history = '''Date,NNM-3 Oil,NNM-3 Gas,NNM-5 Oil,NNM-5 Gas,LJM-11 Gas,LJM-11 Condensate
+01/01/2018,100,0.5,50,0.25,10,1
+02/01/2018,110,0.5,,0.25,10,2
+03/01/2018,120,0.75,40,,12,3
+04/01/2018,130,1.0,30,0.25,14,4
+05/01/2018,140,1.0,20,0.5,16,5
+'''
+
+
+@pytest.fixture()
+def production_csv(tmp_path):
+    filepath = tmp_path / 'production.csv'
+    filepath.write_text(history)
+    return str(filepath)
+
+
+class TestSummariseProduction:
+
+    def test_chunks_match_whole_file(self, production_csv):
+        whole = summarise_production(production_csv)
+        chunked = summarise_production(production_csv, chunksize=2)
+        pd.testing.assert_frame_equal(whole, chunked)
+
+    def test_rates_and_cumulatives(self, production_csv):
+        summary = summarise_production(production_csv, chunksize=2)
+        assert list(summary.index) == ['NNM-3', 'NNM-5', 'LJM-11']
+        assert summary.loc['NNM-3', 'oil_rate'] == 140
+        assert summary.loc['NNM-3', 'oil_cumulative'] == 600
+        assert summary.loc['NNM-5', 'oil_cumulative'] == 140
+        assert summary.loc['NNM-5', 'gas_cumulative'] == 1250000
+        assert summary.loc['LJM-11', 'condensate_rate'] == 5
+        assert summary.loc['LJM-11', 'gas_rate'] == 16000000
+        assert np.isnan(summary.loc['LJM-11', 'oil_rate'])
+
+    def test_well_types(self, production_csv):
+        summary = summarise_production(production_csv)
+        assert summary['type'].tolist() == ['oil', 'oil', 'gas']
+
+    def test_unknown_phase(self, tmp_path):
+        filepath = tmp_path / 'production.csv'
+        filepath.write_text('Date,NNM-3 Water\n01/01/2018,1\n')
+        with pytest.raises(ValueError):
+            summarise_production(str(filepath))
+
+    def test_facilities_config(self, production_csv):
+        config = facilities_config(summarise_production(production_csv), 'MXII', 'Nene', 'AEP')
+        wells = config['facilities']['pexes']['Nene']['AEP']
+        assert wells['NNM-3'] == {'type': 'oil', 'oil rate': 140, 'oil cumulative': 600, 'gas rate': 1000000,
+                                  'gas cumulative': 3750000}
+        assert wells['LJM-11']['condensate cumulative'] == 15
+
+
+class TestProductionCommand:
+
+    def test_writes_loadable_facilities(self, production_csv, tmp_path):
+        output = tmp_path / 'facilities.yaml'
+        assert main(['production', production_csv, '-o', str(output), '--asset', 'MXII', '--pex', 'Nene',
+                     '--whp', 'AEP', '--chunksize', '2']) == 0
+        facilities = yaml.safe_load(output.read_text())
+        assert list(facilities['facilities']['pexes']['Nene']['AEP']) == ['NNM-3', 'NNM-5', 'LJM-11']
+
+        # a config using the generated section builds its wells
+        configuration = tmp_path / 'configuration.yaml'
+        header = {'description': {'start date': '01/01/2018'}, 'defaults': {'well': {
+            'choke': 100, 'active period': 3650,
+            'oil well': {'ultimate oil recovery': 8000000, 'initial oil rate': 5000, 'gas oil ratio': [2000, 4000],
+                         'b oil': 1.0},
+            'gas well': {'ultimate gas recovery': 100000000, 'initial gas rate': 10000000,
+                         'gas condensate ratio': 3.1415, 'b gas': 0.5}}}}
+        configuration.write_text(yaml.safe_dump(header) + output.read_text())
+        asset = build_asset(ConfigurationManager(str(configuration)).config)
+        assert asset.get_well_by_name('NNM-5').oil_rate == 20
+        assert asset.get_well_by_name('NNM-5').gas_oil_ratio == [2000, 4000]
+        assert asset.get_well_by_name('LJM-11').condensate_rate == 5
+
+    def test_stdout(self, production_csv, capsys):
+        main(['production', production_csv])
+        assert 'NNM-3:' in capsys.readouterr().out
@@ -1,12 +1,16 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import pytest
 from palantir.manager import Manager
+from palantir.profile import (MAX_DI, OIL_WELL_INITIAL_DI, DeclineCache, _decline, _zero_function,
+                              cumulative_moment, cumulative_production, solve_decline_rates)
 from pytest import approx
+from scipy import optimize
 
 
-def generate_manager(data):
+def generate_manager(data, **kwargs):
     header = '''
 description:
     start date: 01/01/2018
@@ -31,7 +35,7 @@ defaults:
     with open(file_path, 'w') as file:
         file.write(header + data)
 
-    return Manager(file_path)
+    return Manager(file_path, **kwargs)
 
 
 class TestProfile:
@@ -40,6 +44,98 @@ class TestProfile:
         assert isinstance(profile_single_existing_well.profiles.curves, pd.DataFrame)
 
 
+class TestDeclineRateSolver:
+    """Ensure the batch solver matches a per-well Newton solve"""
+
+    def test_matches_newton(self):
+        # GIVEN several wells that converge individually
+        # WHEN solving them together
+        # THEN each di matches the per-well solution
+        qoi = np.array([5000, 1964, 4000, 10000000])
+        b = np.array([1.0, 1.0, 1.0, 0.5])
+        uor = np.array([8000000, 5948760, 7492167, 100000000])
+        active_period = np.array([3650, 3650, 3650, 3650])
+
+        di, converged = solve_decline_rates(qoi, b, uor, active_period)
+
+        assert converged.all()
+        t = pd.Series(range(0, 3650))
+        for i in range(len(qoi)):
+            expected = optimize.newton(_zero_function, OIL_WELL_INITIAL_DI, args=(t, qoi[i], b[i], uor[i]))
+            assert di[i] == approx(expected, rel=1e-6)
+
+    def test_unreachable_recovery(self):
+        # GIVEN a well that cannot produce its uor within the active period
+        # WHEN solving
+        # THEN it is reported as not converged with zero decline
+        di, converged = solve_decline_rates([198], [1.0], [7541355], [3650])
+        assert not converged[0]
+        assert di[0] == 0
+
+    def test_recovery_within_first_day(self):
+        # GIVEN a well whose uor is less than its first day's rate
+        # WHEN solving
+        # THEN it is reported as not converged with the largest decline, producing little after day one
+        di, converged = solve_decline_rates([5000, 5000], [1.0, 0.0], [4000, 5000], [3650, 3650])
+        assert not converged.any()
+        assert di.tolist() == [MAX_DI, MAX_DI]
+        assert cumulative_production(di, 5000, [1.0, 0.0], 3650) == approx([5000, 5000], rel=1e-6)
+
+    def test_manager_reports_unconverged_wells(self):
+        well_data = """
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            AEP:
+                NNM-3:
+                    type: oil
+                    oil rate: 5000
+                    oil cumulative: 0
+                    gas oil ratio: [2000, 4000]
+                NNM-5:
+                    type: oil
+                    oil rate: 198
+                    oil cumulative: 458645
+                    gas oil ratio: [2000, 4000]
+        """
+        with pytest.warns(RuntimeWarning):
+            manager = generate_manager(well_data)
+        assert manager.unconverged_wells == ['NNM-5']
+
+
+class TestCumulativeProduction:
+    """Ensure the closed-form cumulative matches the discrete daily sum"""
+
+    @pytest.mark.parametrize('b', [0.0, 0.5, 1.0, 1.5, 1 - 2e-6, 1 + 2e-6, 1 + 5e-7, 0.5 + 2e-6,
+                                   1.3e-6, 2e-6, 1e-4, 1e-3, 1e-2, 0.2])
+    def test_matches_discrete_sum(self, b):
+        t = np.arange(3650)
+        for di in [2e-7, 1e-4, 1e-3, 5e-3]:
+            expected = _decline(di, t, 5000, b).sum()
+            assert cumulative_production(di, 5000, b, 3650) == approx(expected, rel=1e-10)
+            expected_moment = (t * _decline(di, t, 5000, b)).sum()
+            assert cumulative_moment(di, 5000, b, 3650) == approx(expected_moment, rel=1e-10)
+
+    def test_fallback_for_steep_decline(self):
+        t = np.arange(3650)
+        expected = _decline(0.2, t, 10000000, 0.5).sum()
+        assert cumulative_production(0.2, 10000000, 0.5, 3650) == approx(expected, rel=1e-12)
+
+    def test_derivative(self):
+        di = np.array([1e-3, 2e-3])
+        _, d_cumulative = cumulative_production(di, 5000, 1.0, 3650, derivative=True)
+        step = 1e-9
+        numeric = (cumulative_production(di + step, 5000, 1.0, 3650) -
+                   cumulative_production(di - step, 5000, 1.0, 3650)) / (2 * step)
+        assert d_cumulative == approx(numeric, rel=1e-5)
+
+    def test_exponential_solve(self):
+        di, converged = solve_decline_rates([5000], [0.0], [8000000], [3650])
+        assert converged[0]
+        assert _decline(di[0], np.arange(3650), 5000, 0.0).sum() == approx(8000000)
+
+
 class TestSingleExistingOilWell:
     """Ensure an oil well generates the correct oil ang gas profiles"""
 
@@ -293,3 +389,116 @@ facilities:
         mxii_o = profiles.field_production.qo
         assert mxii_o.iloc[0] == 20000
         assert mxii_o.iloc[365] == approx(14970, abs=1)
+
+
+class TestRollupCache:
+
+    def test_rollup_cached_until_add(self, profile_single_existing_well):
+        profiles = profile_single_existing_well.profiles
+        assert profiles.pex_production is profiles.pex_production
+        first = profiles.field_production
+        profiles.add(profile_single_existing_well.asset.wells[0])
+        assert profiles.field_production is not first
+        assert profiles.field_production.qo.iloc[0] == 2 * first.qo.iloc[0]
+
+    def test_well_rollup_cached_until_remove(self, profile_single_existing_well):
+        profiles = profile_single_existing_well.profiles
+        wells = profiles.well_production
+        assert profiles.well_production is wells
+        profiles.remove(profile_single_existing_well.asset.wells[0].name)
+        assert profiles.well_production is not wells
+
+
+class TestCoarseTimeStep:
+    """Ensure coarse time steps integrate the same volumes as the daily profile"""
+
+    well_data = """
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            AEP:
+                NNM-3:
+                    type: oil
+                    oil rate: 5000
+                    oil cumulative: 0
+                    gas oil ratio: [2000, 4000]
+            WHP3:
+programs:
+    Rig1:
+        program:
+            - start: 01/01/2018, WHP3
+            - standby: 45
+            - drill: NNM-305, oil, 70
+        """
+
+    @pytest.mark.parametrize('time_step, frequency', [('monthly', 'MS'), ('quarterly', 'QS'), ('annual', 'YS')])
+    def test_matches_resampled_daily(self, time_step, frequency):
+        daily = generate_manager(self.well_data).profiles.field_production
+        coarse = generate_manager(self.well_data, time_step=time_step).profiles.field_production
+        resampled = daily.resample(frequency).sum()
+        assert list(coarse.index) == list(resampled.index)
+        assert np.allclose(coarse.values, resampled.values, rtol=1e-8)
+
+    def test_monthly_well_volumes(self):
+        profiles = generate_manager(self.well_data, time_step='monthly').profiles
+        assert profiles.well_production.index[0] == datetime(2018, 1, 1)
+        assert profiles.well_production.qo['nnm-305'].iloc[0] == 0
+        assert profiles.well_production.qo['nnm-305'].iloc[1] == approx(5000 * 14, rel=1e-2)
+        assert len(profiles.field_production) == 122
+
+    def test_unknown_time_step(self):
+        with pytest.raises(ValueError):
+            generate_manager(self.well_data, time_step='weekly')
+
+
+class TestDeclineCache:
+    """Ensure wells sharing identical parameters reuse one decline solution"""
+
+    def test_drilling_campaign_solves_once(self):
+        well_data = """
+facilities:
+    asset: MXII
+    pexes:
+        Nene:
+            WHP3:
+programs:
+    Rig1:
+        program:
+            - start: 01/01/2018, WHP3
+            - drill: NNM-305, oil, 70
+            - drill: NNM-306, oil, 70
+            - drill: NNM-307, oil, 70
+            - drill: L14, gas, 70
+            - drill: L15, gas, 70
+        """
+        profiles = generate_manager(well_data).profiles
+        assert len(profiles.cache) == 2
+        well_production = profiles.well_production
+        assert well_production.qo['nnm-306'].iloc[70] == well_production.qo['nnm-305'].iloc[0]
+        assert well_production.qg['l15'].iloc[210] == well_production.qg['l14'].iloc[140]
+
+    def test_base_curves_read_only(self, profile_single_existing_well):
+        profiles = profile_single_existing_well.profiles
+        key = profiles.cache.key(profile_single_existing_well.asset.wells[0])
+        curves = profiles.cache.get(key).curves
+        with pytest.raises(ValueError):
+            curves[0, 0] = 0
+
+    def test_each_parameter_set_counted_once(self, manager):
+        cache = manager.profiles.cache
+        keys = cache.keys(manager.asset.wells)
+        assert (cache.hits, cache.misses) == (0, len(set(keys)))
+        manager.update_well('NNM-3', oil_rate=1500)
+        assert (cache.hits, cache.misses) == (0, len(set(keys)) + 1)
+
+    def test_lru_eviction_and_counters(self):
+        cache = DeclineCache(maxsize=2)
+        cache.put('a', 0.1, True)
+        cache.put('b', 0.2, True)
+        assert cache.get('a').di == 0.1
+        cache.put('c', 0.3, True)
+        assert cache.get('b') is None
+        assert cache.get('c').di == 0.3
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (2, 1)
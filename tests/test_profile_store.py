@@ -0,0 +1,213 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from palantir.manager import Manager
+from palantir.profile_store import MappedProfileStore, ProfileStore, Rollup, convolve_counts
+
+
+def rates(length, value=1.0):
+    return np.vstack([np.full(length, value), np.full(length, 2 * value), np.zeros(length)])
+
+
+class TestProfileStore:
+
+    def test_append(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('mxii', 'nene', 'aep', 'nnm-3'))
+        assert len(store) == 1
+        assert store.data[0, 1, 9] == 2.0
+
+    def test_capacity_doubles(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1), capacity=2)
+        for i in range(5):
+            store.append(rates(10, i), 0, ('mxii', 'nene', 'aep', 'w{}'.format(i)))
+        assert len(store) == 5
+        assert store.capacity == 8
+        assert store.data[4, 0, 0] == 4
+
+    def test_longer_well_extends_time_axis(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('mxii', 'nene', 'aep', 'nnm-3'))
+        store.append(rates(20), 0, ('mxii', 'nene', 'aep', 'nnm-5'))
+        assert store.periods == 20
+        assert store.data[0, 0, 15] == 0
+
+    def test_to_frame(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('mxii', 'nene', 'aep', 'nnm-3'))
+        store.append(rates(5, 3.0), 30, ('mxii', 'nene', 'whp3', 'nnm-305'))
+        frame = store.to_frame()
+        assert isinstance(frame, pd.DataFrame)
+        assert len(frame) == 15
+        assert list(frame.columns) == ['asset', 'pex', 'whp', 'well', 'qo', 'qg', 'qc']
+        assert frame.index[10] == datetime(2018, 1, 31)
+        assert frame.well.iloc[10] == 'nnm-305'
+        assert frame.qg.iloc[10] == 6.0
+
+    def test_hierarchy_codes(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('MXII', 'Nene', 'AEP', 'NNM-3'))
+        store.append(rates(10), 0, ('MXII', 'Nene', 'WHP3', 'NNM-301'))
+        assert store.codes[:2].tolist() == [[0, 0, 0, 0], [0, 0, 1, 1]]
+        assert store.categories['whp'] == ['aep', 'whp3']
+
+    def test_frame_labels_are_categorical(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('MXII', 'Nene', 'AEP', 'NNM-3'))
+        frame = store.to_frame()
+        assert isinstance(frame.well.dtype, pd.CategoricalDtype)
+        assert frame.well.iloc[0] == 'nnm-3'
+
+    def test_set_hierarchy(self, manager):
+        store = ProfileStore()
+        store.set_hierarchy(manager.asset)
+        assert store.categories['pex'] == ['nene', 'litchendjili']
+        assert store.categories['whp'] == ['aep', 'whp4', 'whp3', 'ltc1']
+        assert len(store.categories['well']) == 18
+
+    def test_rollups_match_groupby(self, manager):
+        profiles = manager.profiles
+        expected = profiles.curves.groupby(['date', 'whp'], observed=True)[['qo', 'qg', 'qc']].sum()
+        expected = expected.unstack(fill_value=0).reindex(profiles.whp_production.index, fill_value=0)
+        assert np.allclose(profiles.whp_production.values, expected.values)
+        field = profiles.curves.groupby('date')[['qo', 'qg', 'qc']].sum()
+        assert np.allclose(profiles.field_production.loc[field.index].values, field.values)
+
+    def test_well_level_read_from_rows(self, manager):
+        profiles = manager.profiles
+        assert 'well' not in profiles.store.rollups
+        expected = profiles.curves.groupby(['date', 'well'], observed=True)[['qo', 'qg', 'qc']].sum()
+        expected = expected.unstack(fill_value=0).reindex(profiles.well_production.index, fill_value=0)
+        actual = profiles.well_production[expected.columns]
+        assert np.allclose(actual.values, expected.values)
+
+    def test_rollup_added_incrementally(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 10, ('mxii', 'nene', 'aep', 'nnm-3'))
+        store.append(rates(10), 0, ('mxii', 'nene', 'whp3', 'nnm-301'))
+        store.append(rates(30), 5, ('mxii', 'nene', 'aep', 'nnm-5'))
+        whp = store.rollup_frame('whp')
+        assert whp.index[0] == datetime(2018, 1, 1)
+        assert len(whp) == 35
+        assert whp.qo.aep.iloc[10] == 2
+        assert whp.qo.whp3.iloc[10] == 0
+        assert store.rollup_frame().qo.iloc[5] == 2
+
+    def test_offsets_share_calendar(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 1))
+        store.append(rates(10), store.offset(datetime(2018, 1, 31)), ('mxii', 'nene', 'aep', 'nnm-3'))
+        assert store.offsets[0] == 30
+        assert store.steps == 40
+        assert store.index[0] == datetime(2018, 1, 1)
+        assert store.rollup_frame().qo.iloc[29] == 0
+        assert store.rollup_frame().qo.iloc[30] == 1
+
+    def test_earlier_well_shifts_calendar(self):
+        store = ProfileStore(start_date=datetime(2018, 1, 11))
+        store.append(rates(10), 0, ('mxii', 'nene', 'aep', 'nnm-3'))
+        store.append(rates(10), store.offset(datetime(2018, 1, 1)), ('mxii', 'nene', 'whp3', 'nnm-301'))
+        assert store.start_date == np.datetime64('2018-01-01')
+        assert store.offsets[:2].tolist() == [10, 0]
+        whp = store.rollup_frame('whp')
+        assert whp.qo.aep.iloc[10] == 1
+        assert whp.qo.whp3.iloc[10] == 0
+
+    def test_build_matches_incremental(self, manager):
+        store = manager.profiles.store
+        typed = store.curve_ids[:store.count] >= 0
+        rows, counted = np.flatnonzero(~typed), np.flatnonzero(typed)
+        rollup = Rollup('whp', store.type_curves)
+        rollup.build(store.data[store.slots[rows]], store.lengths[rows], store.offsets[rows], store.codes[rows, 2])
+        rollup.build_counts(store.curve_ids[counted], store.offsets[counted], store.codes[counted, 2])
+        groups = len(store.categories['whp'])
+        assert np.allclose(rollup.values(store.steps)[:groups], store.rollups['whp'].values(store.steps)[:groups])
+
+
+class TestTypeCurveWells:
+    """Ensure wells sharing a type curve are counted and convolved to the same profiles as stored wells"""
+
+    wells = [(0, 'aep'), (3, 'aep'), (3, 'whp3'), (-2, 'whp3'), (8, 'aep')]
+
+    def stores(self):
+        stored = ProfileStore(start_date=datetime(2018, 1, 3))
+        typed = ProfileStore(start_date=datetime(2018, 1, 3))
+        for i, (offset, whp) in enumerate(self.wells):
+            labels = ('mxii', 'nene', whp, 'w{}'.format(i))
+            stored.append(rates(10, 1 + i % 2), offset, labels)
+            typed.append_type(i % 2, rates(10, 1 + i % 2), offset, labels)
+        return stored, typed
+
+    def test_curves_not_copied(self):
+        _, typed = self.stores()
+        assert len(typed.type_curves) == 2
+        assert typed.filled == 0
+        assert typed.curve_ids[:5].tolist() == [0, 1, 0, 1, 0]
+
+    def test_matches_stored_wells(self):
+        stored, typed = self.stores()
+        for store in (stored, typed):
+            store.remove(1)
+        for level in (None, 'pex', 'whp', 'well'):
+            pd.testing.assert_frame_equal(typed.rollup_frame(level), stored.rollup_frame(level))
+        pd.testing.assert_frame_equal(typed.to_frame(), stored.to_frame())
+
+    def test_fft_matches_direct(self):
+        rng = np.random.default_rng(0)
+        curve = rng.uniform(size=(3, 400))
+        counts = {(int(group), int(step)): 1 for group, step in zip(rng.integers(0, 2, 300), rng.integers(0, 500, 300))}
+        fft = np.zeros((2, 3, 600))
+        convolve_counts(counts, curve, fft)
+        direct = np.zeros((2, 3, 600))
+        for (group, step), count in counts.items():
+            n = min(400, 600 - step)
+            direct[group, :, step:step + n] += count * curve[:, :n]
+        assert np.allclose(fft, direct)
+
+    def test_new_wells_use_type_curves(self, manager):
+        store = manager.profiles.store
+        new_wells = [well for well in manager.asset.wells if well.is_new_well]
+        assert store.filled == len(manager.asset.wells) - len(new_wells)
+        assert len(store.type_curves) == 2
+
+
+class TestMappedProfileStore:
+
+    def test_append_grows_file(self, tmp_path):
+        store = MappedProfileStore(tmp_path / 'profiles', start_date=datetime(2018, 1, 1), capacity=1,
+                                   values_capacity=4)
+        for i in range(3):
+            store.append(rates(10, i), i, ('mxii', 'nene', 'aep', 'w{}'.format(i)))
+        assert len(store) == 3
+        assert len(store.values) >= 30
+        assert store.positions[:3].tolist() == [0, 10, 20]
+        assert store.gather(np.array([2]), np.array([9])).tolist() == [[2.0, 4.0, 0.0]]
+
+    def test_rollups_streamed_in_chunks(self, tmp_path):
+        memory = ProfileStore(start_date=datetime(2018, 1, 11))
+        mapped = MappedProfileStore(tmp_path / 'profiles', start_date=datetime(2018, 1, 11), chunk_size=2)
+        wells = [(rates(10, 1), 0, 'aep'), (rates(30, 2), 5, 'whp3'), (rates(10, 3), -10, 'aep'),
+                 (rates(20, 4), 2, 'whp4')]
+        for store in (memory, mapped):
+            for i, (values, offset, whp) in enumerate(wells):
+                store.append(values, offset, ('mxii', 'nene', whp, 'w{}'.format(i)))
+            store.remove(1)
+        for level in (None, 'pex', 'whp', 'well'):
+            pd.testing.assert_frame_equal(mapped.rollup_frame(level), memory.rollup_frame(level))
+        pd.testing.assert_frame_equal(mapped.to_frame(), memory.to_frame())
+
+    def test_manager_forecast_matches_memory(self, manager, tmp_path):
+        mapped = Manager(config=manager.config, profile_path=tmp_path / 'profiles')
+        assert isinstance(mapped.profiles.store, MappedProfileStore)
+        pd.testing.assert_frame_equal(mapped.profiles.field_production, manager.profiles.field_production)
+        pd.testing.assert_frame_equal(mapped.profiles.whp_production, manager.profiles.whp_production)
+
+    def test_flush_and_open(self, tmp_path):
+        store = MappedProfileStore(tmp_path / 'profiles', start_date=datetime(2018, 1, 1))
+        store.append(rates(10), 0, ('mxii', 'nene', 'aep', 'nnm-3'))
+        store.append(rates(5, 3.0), 30, ('mxii', 'nene', 'whp3', 'nnm-305'))
+        store.flush()
+        reopened = MappedProfileStore.open(tmp_path / 'profiles')
+        pd.testing.assert_frame_equal(reopened.to_frame(), store.to_frame())
+        pd.testing.assert_frame_equal(reopened.rollup_frame('whp'), store.rollup_frame('whp'))
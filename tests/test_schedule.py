@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+from palantir.manager import Manager
+from palantir.program import compile_step
+from palantir.schedule import Wait
+
+
+def run(manager, **programs):
+    """Forecast the manager's config with other programs, given as lists of configuration steps"""
+    config = dict(manager.config, programs={rig_name: {'program': [compile_step(step) for step in steps]}
+                                            for rig_name, steps in programs.items()})
+    return Manager(config=config)
+
+
+class TestScheduler:
+
+    def test_single_rig_matches_program(self, program_steps):
+        assert program_steps.waits == []
+        assert program_steps.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 4, 11)
+
+    def test_rigs_share_clock(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'drill': 'NNM-7, oil, 70'}],
+                      Rig2=[{'start': '01/02/2018, WHP4'}, {'drill': 'NNM-402, gas, 70'}])
+        assert manager.waits == []
+        assert manager.asset.get_well_by_name('NNM-7').start_date == datetime(2018, 1, 1)
+        assert manager.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 2, 1)
+
+    def test_rig_waits_for_platform(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'drill': 'NNM-7, oil, 70'}, {'move': 'WHP4, 30'},
+                            {'drill': 'NNM-402, gas, 70'}],
+                      Rig2=[{'start': '11/01/2018, AEP'}, {'drill': 'NNM-8, oil, 40'}, {'standby': 10}])
+        # Rig2 waits for Rig1 to leave AEP on day 70
+        assert manager.waits == [Wait('Rig2', 'AEP', datetime(2018, 1, 11), 60)]
+        assert manager.asset.get_well_by_name('NNM-8').start_date == datetime(2018, 3, 12)
+        assert manager.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 4, 11)
+
+    def test_later_start_leaves_platform(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'drill': 'NNM-7, oil, 70'},
+                            {'start': '01/06/2018, WHP4'}, {'drill': 'NNM-402, gas, 70'}],
+                      Rig2=[{'start': '01/02/2018, AEP'}, {'drill': 'NNM-8, oil, 40'}])
+        # Rig1 stays at AEP until it starts again at WHP4
+        assert manager.waits == [Wait('Rig2', 'AEP', datetime(2018, 2, 1), 120)]
+        assert manager.asset.get_well_by_name('NNM-8').start_date == datetime(2018, 6, 1)
+        assert manager.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 6, 1)
+
+    def test_move_waits_for_rig_to_finish(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'standby': 5}, {'move': 'WHP4, 10'},
+                            {'drill': 'NNM-402, gas, 70'}],
+                      Rig2=[{'start': '01/01/2018, WHP4'}, {'drill': 'NNM-403, gas, 50'}])
+        assert manager.waits == [Wait('Rig1', 'WHP4', datetime(2018, 1, 6), 45)]
+        assert manager.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 3, 2)
+
+    def test_no_free_slot(self, program_steps):
+        with pytest.raises(ValueError, match='No free slot on wellhead platform WHP4'):
+            run(program_steps, Rig1=[{'start': '01/01/2018, WHP4'}] +
+                [{'drill': 'NNM-41{}, oil, 10'.format(i)} for i in range(6)])
+
+    def test_platform_well_slots(self, program_steps):
+        manager = Manager(config=dict(program_steps.config, **{
+            'platform well slots': {'WHP4': 7},
+            'programs': {'Rig1': {'program': [compile_step(step) for step in [{'start': '01/01/2018, WHP4'}] +
+                                              [{'drill': 'NNM-41{}, oil, 10'.format(i)} for i in range(6)]]}}}))
+        assert manager.asset.get_wellhead_platform_by_name('WHP4').remaining_slots == 0
+
+    def test_unknown_platform(self, program_steps):
+        with pytest.raises(ValueError, match='unknown wellhead platform WHP9'):
+            run(program_steps, Rig1=[{'start': '01/01/2018, WHP9'}])
+
+    def test_rigs_swap_platforms(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'standby': 10}, {'move': 'WHP4, 10'}],
+                      Rig2=[{'start': '01/01/2018, WHP4'}, {'standby': 10}, {'move': 'AEP, 10'}])
+        assert manager.waits == []
+
+    def test_rerun_after_edit(self, program_steps):
+        manager = run(program_steps,
+                      Rig1=[{'start': '01/01/2018, AEP'}, {'drill': 'NNM-7, oil, 70'}, {'move': 'WHP4, 30'}],
+                      Rig2=[{'start': '01/01/2018, AEP'}, {'drill': 'NNM-8, oil, 40'}])
+        assert manager.asset.get_well_by_name('NNM-8').start_date == datetime(2018, 3, 12)
+        manager.set_step_duration('Rig1', 1, 20)
+        assert manager.asset.get_well_by_name('NNM-8').start_date == datetime(2018, 1, 21)
+        assert manager.waits == [Wait('Rig2', 'AEP', datetime(2018, 1, 1), 20)]
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from palantir.manager import Manager
+from palantir.program import compile_step
+from palantir.sequence import SequenceOptimiser, optimise_sequence
+
+PROGRAMS = {
+    'Rig1': [{'start': '01/01/2018, AEP'}, {'drill': 'G1, gas, 70'}, {'drill': 'O1, oil, 70'},
+             {'move': 'WHP4, 30'}, {'drill': 'O2, oil, 50'}, {'standby': 20}],
+    'Rig2': [{'start': '01/03/2018, WHP4'}, {'drill': 'G2, gas, 60'}, {'move': 'AEP, 30'}, {'drill': 'O3, oil, 40'}],
+}
+
+
+def build(manager, programs):
+    config = dict(manager.config, programs={rig_name: {'program': [compile_step(step) for step in steps]}
+                                            for rig_name, steps in programs.items()})
+    return Manager(config=config)
+
+
+@pytest.fixture()
+def two_rigs(program_steps):
+    return build(program_steps, PROGRAMS)
+
+
+def start_dates(manager):
+    return {well.name: well.start_date for well in manager.asset.wells if well.is_new_well}
+
+
+class TestSequenceOptimiser:
+
+    def test_start_days_follow_scheduler(self, two_rigs):
+        optimiser = SequenceOptimiser(two_rigs)
+        start = two_rigs.config['start date']
+        expected = start_dates(two_rigs)
+        assert [start + timedelta(days=day) for day in optimiser.start_days()] == \
+            [expected[job.well_name] for job in optimiser.jobs]
+
+    def test_score_is_discounted_production(self, two_rigs):
+        optimiser = SequenceOptimiser(two_rigs, discount_rate=0.0, horizon=365)
+        wells = two_rigs.profiles.well_production
+        oil = wells.qo[['o1', 'o2', 'o3']].iloc[:365].to_numpy().sum()
+        assert np.isclose(optimiser.score(), oil)
+        assert SequenceOptimiser(two_rigs, horizon=0).score() == 0
+
+    def test_optimise_improves_and_matches_forecast(self, two_rigs):
+        result = optimise_sequence(two_rigs, iterations=2000, seed=1)
+        assert result.score > result.initial_score
+        assert result.evaluations > 0
+
+        optimised = Manager(config=dict(two_rigs.config, programs=result.programs))
+        assert start_dates(optimised) == result.start_dates
+        assert np.isclose(SequenceOptimiser(optimised).score(), result.score)
+
+    def test_oil_wells_first(self, two_rigs):
+        result = optimise_sequence(two_rigs, iterations=2000, seed=1, reassign=False)
+        rig1 = [parameters[0] for step in result.programs['Rig1']['program']
+                for action, parameters in step.items() if action == 'drill']
+        assert sorted(rig1) == ['G1', 'O1', 'O2']
+        assert rig1[-1] == 'G1'
+        assert result.programs['Rig1']['program'][-1] == {'standby': (20,)}
+
+    def test_unknown_phase(self, two_rigs):
+        with pytest.raises(ValueError, match='Unknown phases qw'):
+            SequenceOptimiser(two_rigs, weights={'qw': 1})
+
+    def test_rig_without_wells(self, program_steps):
+        manager = build(program_steps, dict(PROGRAMS, Rig3=[{'start': '01/02/2018, WHP4'}, {'standby': 30}]))
+        result = optimise_sequence(manager, iterations=2000, seed=1)
+        assert result.score >= result.initial_score
+        assert sorted(well for well in result.start_dates) == ['G1', 'G2', 'O1', 'O2', 'O3']
+
+    def test_many_seeds(self, two_rigs):
+        # rigs left without wells mustn't be picked to swap with
+        optimiser = SequenceOptimiser(two_rigs)
+        for seed in range(10):
+            optimiser.sequences = [[0, 1, 2], [3, 4]]
+            result = optimiser.optimise(seed=seed)
+            assert result.score >= result.initial_score
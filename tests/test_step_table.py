@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from palantir.manager import Manager
+from palantir.program import compile_step
+from palantir.step_table import DRILL, MOVE, START, STANDBY, StepTable
+from palantir.well_table import GAS, OIL
+
+STEPS = [{'start': '01/01/2018, AEP'}, {'drill': 'NNM-7, oil, 70'}, {'move': 'WHP4, 30'},
+         {'drill': ('NNM-402', 'gas', 70)}, {'standby': 100}, {'start': '01/01/2019, AEP'},
+         {'drill': 'NNM-8, oil, 10'}]
+
+
+class TestStepTable:
+
+    def test_columns(self):
+        table = StepTable(STEPS)
+        assert len(table) == 7
+        assert table.columns['opcode'].tolist() == [START, DRILL, MOVE, DRILL, STANDBY, START, DRILL]
+        assert table.platforms == ['AEP', 'WHP4']
+        assert table.wells == ['NNM-7', 'NNM-402', 'NNM-8']
+        assert table.columns['target'].tolist() == [0, 0, 1, 1, -1, 0, 2]
+
+    def test_days(self):
+        days, end = StepTable(STEPS).days()
+        start = datetime(2018, 1, 1).toordinal()
+        restart = datetime(2019, 1, 1).toordinal()
+        assert (days - start).tolist()[:5] == [0, 0, 70, 100, 170]
+        assert (days - restart).tolist()[5:] == [0, 0]
+        assert end == restart + 10
+
+    def test_drills(self):
+        drills = StepTable(STEPS).drills()
+        assert drills.rows.tolist() == [1, 3, 6]
+        assert drills.types.tolist() == [OIL, GAS, OIL]
+        assert drills.days.tolist() == [datetime(2018, 1, 1).toordinal(), datetime(2018, 4, 11).toordinal(),
+                                        datetime(2019, 1, 1).toordinal()]
+
+    def test_step_round_trip(self):
+        table = StepTable(STEPS)
+        assert table.step(0) == {'start': (datetime(2018, 1, 1), 'AEP')}
+        assert table.step(3) == {'drill': ('NNM-402', 'gas', 70)}
+        assert table.step(4) == {'standby': (100,)}
+        copied = StepTable([table.step(row) for row in range(len(table))])
+        for name, column in table.columns.items():
+            assert copied.columns[name].tolist() == column.tolist()
+
+    def test_drill_wells(self):
+        table = StepTable([{'start': '01/01/2018, AEP'}, {'drill wells': '3, NNM-4{i:02d}, oil, 70, 8'},
+                           {'drill': 'NNM-7, gas, 10'}])
+        explicit = StepTable([{'start': '01/01/2018, AEP'}]
+                             + [{'drill': 'NNM-4{:02d}, oil, 70'.format(i)} for i in range(8, 11)]
+                             + [{'drill': 'NNM-7, gas, 10'}])
+        assert table.wells == ['NNM-408', 'NNM-409', 'NNM-410', 'NNM-7']
+        for name, column in explicit.columns.items():
+            assert table.columns[name].tolist() == column.tolist()
+        assert table.days()[1] == explicit.days()[1]
+
+    def test_empty(self):
+        table = StepTable()
+        days, end = table.days()
+        assert len(table) == 0
+        assert len(days) == 0 and end == 0
+
+    def test_unknown_step(self):
+        with pytest.raises(ValueError, match='Unknown program step jump'):
+            StepTable([{'jump': 'AEP'}])
+
+    def test_unknown_well_type(self):
+        with pytest.raises(ValueError, match='Well NNM-7 has unknown type water'):
+            StepTable([{'drill': 'NNM-7, water, 70'}])
+
+
+class TestProgramTable:
+
+    def test_steps_built_lazily(self, program_steps):
+        program = program_steps.programs[0]
+        assert program._steps is None
+        assert str(program.steps[3]) == 'DRILL: NNM-402, gas, 70'
+
+    def test_compile_after_edit(self, program_steps):
+        program = program_steps.programs[0]
+        program.remove_step(2)
+        table = program.compile()
+        assert table.platforms == ['AEP']
+        assert table.columns['opcode'].tolist() == [START, DRILL, DRILL, STANDBY]
+
+    def test_insert_drill_wells(self, program_steps):
+        program = program_steps.programs[0]
+        program.insert_step(2, {'drill wells': '2, NNM-8{i}, oil, 30'})
+        assert [str(step) for step in program.steps[2:4]] == ['DRILL: NNM-81, oil, 30', 'DRILL: NNM-82, oil, 30']
+        assert program.compile().wells == ['NNM-7', 'NNM-81', 'NNM-82', 'NNM-402']
+
+    def test_manager_runs_drill_wells(self, program_steps):
+        steps = [{'start': '01/01/2018, AEP'}, {'drill wells': '2, NNM-7{i}, oil, 70'}, {'move': 'WHP4, 30'},
+                 {'drill': 'NNM-402, gas, 70'}]
+        manager = Manager(config=dict(program_steps.config,
+                                      programs={'Rig1': {'program': [compile_step(step) for step in steps]}}))
+        assert manager.asset.get_well_by_name('NNM-72').start_date == datetime(2018, 3, 12)
+        assert manager.asset.get_well_by_name('NNM-402').start_date == datetime(2018, 6, 20)
+
+    def test_manager_runs_drill_wells_campaign(self, program_steps):
+        steps = [{'start': '01/01/2018, WHP4'}, {'drill wells': '20, NNM-4{i:02d}, oil, 70, 10'}]
+        manager = Manager(config=dict(program_steps.config, **{
+            'platform well slots': {'WHP4': 24},
+            'programs': {'Rig1': {'program': [compile_step(step) for step in steps]}}}))
+        whp4 = manager.asset.get_wellhead_platform_by_name('WHP4')
+        assert manager.asset.get_well_by_name('NNM-429').start_date == datetime(2018, 1, 1) + timedelta(days=19 * 70)
+        assert whp4.remaining_slots == 24 - 21
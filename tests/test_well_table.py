@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import numpy as np
+
+from palantir.facilities import GasWell, OilWell, WellHeadPlatform
+from palantir.profile import DeclineCache, decline_inputs
+from palantir.well_table import GAS, OIL, WellTable
+
+
+class TestWellTable:
+
+    def test_attached_wells_have_rows(self, manager):
+        table = manager.asset.well_table
+        assert len(table) == len(manager.asset.wells)
+        for well in manager.asset.wells:
+            assert table.wells[well._row] is well
+
+    def test_attributes_read_from_columns(self, manager):
+        well = manager.asset.get_well_by_name('NNM-3')
+        table = manager.asset.well_table
+        assert table.columns['oil_rate'][well._row] == 1851
+        assert table.columns['type_code'][well._row] == OIL
+        well.oil_rate = 1500
+        assert table.columns['oil_rate'][well._row] == 1500
+        assert well.oil_rate == 1500
+
+    def test_gas_oil_ratio(self, manager):
+        well = manager.asset.get_well_by_name('NNM-3')
+        assert well.gas_oil_ratio == [2000, 4000]
+        well.gas_oil_ratio = [1000, 3000]
+        assert manager.asset.well_table.columns['gas_oil_ratio_end'][well._row] == 3000
+
+    def test_detached_well_keeps_values(self, manager):
+        well = manager.asset.get_well_by_name('NNM-3')
+        table = manager.asset.well_table
+        row = well._row
+        well.parent = None
+        assert well._table is None
+        assert table.wells[row] is None
+        assert table.columns['type_code'][row] == -1
+        assert well.oil_rate == 1851
+        assert well.start_date == well._values['start_date']
+
+    def test_reattached_well_reuses_free_row(self, manager):
+        asset = manager.asset
+        well = asset.get_well_by_name('NNM-3')
+        row = well._row
+        whp = well.whp
+        well.parent = None
+        well.parent = whp
+        assert well._row == row
+        assert well.oil_rate == 1851
+
+    def test_grow(self):
+        defaults = {'active period': 100, 'choke': 100, 'start date': datetime(2018, 1, 1),
+                    'initial gas rate': 1e6, 'ultimate gas recovery': 1e8, 'gas condensate ratio': 2.0,
+                    'b gas': 0.5}
+        table = WellTable(capacity=1)
+        whp = WellHeadPlatform(name='WHP')
+        for i in range(5):
+            well = GasWell(name='w{}'.format(i), start_date=datetime(2018, 1, 1), well_defaults=defaults)
+            well.parent = whp
+            table.adopt(well, GAS)
+        assert len(table) == 5
+        assert table.capacity == 8
+        assert table.get('gas_condensate_ratio', 4) == 2.0
+        assert table.get('start_date', 4) == datetime(2018, 1, 1)
+
+    def test_decline_inputs_match_per_well(self, manager):
+        wells = manager.asset.wells
+        from_table = decline_inputs(wells)
+        per_well = [decline_inputs([well]) for well in wells]
+        for i, column in enumerate(from_table):
+            np.testing.assert_allclose(column, [inputs[i][0] for inputs in per_well])
+
+    def test_decline_keys_match_per_well(self, manager):
+        wells = manager.asset.wells
+        assert DeclineCache.keys(wells) == [DeclineCache.key(well) for well in wells]
+        assert any(isinstance(well, OilWell) for well in wells)